@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""Async facade over storage.py for use inside discord.py coroutines.
+
+Every call runs in a small dedicated thread pool so file/SQLite I/O never
+blocks the event loop (and the gateway heartbeat). Reads run concurrently;
+writes are serialized per guild.
+"""
+import asyncio
+import contextlib
+import copy
+import functools
+import os
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, List, Optional, Sequence, Tuple, TypeVar
+
+import storage
+
+T = TypeVar("T")
+
+STORAGE_THREADS = int(os.getenv("AOUV_STORAGE_THREADS", "4"))
+
+
+class AsyncStore:
+    def __init__(self, max_workers: int = STORAGE_THREADS) -> None:
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="aouv-storage")
+        # Locks disappear once no coroutine holds or waits on them.
+        self._guild_locks: "weakref.WeakValueDictionary[int, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+    def _guild_lock(self, guild_id: int) -> asyncio.Lock:
+        lock = self._guild_locks.get(guild_id)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._guild_locks[guild_id] = lock
+        return lock
+
+    async def run(self, fn: Callable[..., T], *args: Any) -> T:
+        """Run a blocking storage call in the storage thread pool."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(fn, *args))
+
+    async def write(self, guild_id: int, fn: Callable[..., T], *args: Any) -> T:
+        """Run ``fn(guild_id, *args)`` in the pool, serialized with other writes to this guild."""
+        async with self._guild_lock(guild_id):
+            return await self.run(fn, guild_id, *args)
+
+    async def flush(self) -> None:
+        """Write every pending (debounced) mutation to disk."""
+        await self.run(storage.flush)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+
+    # ---- Reads ----
+
+    async def get_channels(self, guild_id: int) -> List[int]:
+        return await self.run(storage.get_channels, guild_id)
+
+    async def list_custom_prompts(self, guild_id: int, kind: str) -> List[Tuple[str, str]]:
+        return await self.run(storage.list_custom_prompts, guild_id, kind)
+
+    async def get_custom_prompts(self, guild_id: int, kind: str) -> List[storage.CustomPrompt]:
+        return await self.run(storage.get_custom_prompts, guild_id, kind)
+
+    async def get_base_prompt_meta(self, guild_id: int, kind: str, index: int) -> storage.PromptMeta:
+        return await self.run(storage.get_base_prompt_meta, guild_id, kind, index)
+
+    async def list_disabled_base(self, guild_id: int, kind: str) -> List[int]:
+        return await self.run(storage.list_disabled_base, guild_id, kind)
+
+    async def get_combined_actions(self, guild_id: int, base_actions: Sequence[str]) -> Sequence[str]:
+        return await self.run(storage.get_combined_actions, guild_id, base_actions)
+
+    async def get_combined_truths(self, guild_id: int, base_truths: Sequence[str]) -> Sequence[str]:
+        return await self.run(storage.get_combined_truths, guild_id, base_truths)
+
+    # ---- Writes ----
+
+    @contextlib.asynccontextmanager
+    async def transaction(self, guild_id: int) -> AsyncIterator[storage.GuildConfig]:
+        """Async counterpart of ``storage.transaction``.
+
+            async with store.transaction(guild_id) as conf:
+                for index in indices:
+                    storage.set_disabled(conf, "verite", index, True)
+
+        The config is loaded once and every change is committed in one go
+        when the block exits normally; nothing is written if it raises.
+        """
+        async with self._guild_lock(guild_id):
+            before = await self.run(storage.get_config, guild_id)
+            conf = copy.deepcopy(before)
+            yield conf
+            await self.run(storage.commit_config, guild_id, before, conf)
+
+    async def add_channel(self, guild_id: int, channel_id: int) -> None:
+        return await self.write(guild_id, storage.add_channel, channel_id)
+
+    async def remove_channel(self, guild_id: int, channel_id: int) -> bool:
+        return await self.write(guild_id, storage.remove_channel, channel_id)
+
+    async def add_custom_prompt(self, guild_id: int, kind: str, text: str) -> str:
+        return await self.write(guild_id, storage.add_custom_prompt, kind, text)
+
+    async def edit_custom_prompt(self, guild_id: int, kind: str, prompt_id: str, new_text: str) -> bool:
+        return await self.write(guild_id, storage.edit_custom_prompt, kind, prompt_id, new_text)
+
+    async def remove_custom_prompt(self, guild_id: int, kind: str, prompt_id: str) -> bool:
+        return await self.write(guild_id, storage.remove_custom_prompt, kind, prompt_id)
+
+    async def set_custom_prompt_meta(
+        self, guild_id: int, kind: str, prompt_id: str, tags: Optional[Sequence[str]] = None, weight: Optional[float] = None
+    ) -> Optional[storage.CustomPrompt]:
+        return await self.write(guild_id, storage.set_custom_prompt_meta, kind, prompt_id, tags, weight)
+
+    async def set_base_prompt_meta(
+        self, guild_id: int, kind: str, index: int, tags: Optional[Sequence[str]] = None, weight: Optional[float] = None
+    ) -> storage.PromptMeta:
+        return await self.write(guild_id, storage.set_base_prompt_meta, kind, index, tags, weight)
+
+    async def disable_base_prompt(self, guild_id: int, kind: str, index: int) -> bool:
+        return await self.write(guild_id, storage.disable_base_prompt, kind, index)
+
+    async def enable_base_prompt(self, guild_id: int, kind: str, index: int) -> bool:
+        return await self.write(guild_id, storage.enable_base_prompt, kind, index)
+
+
+store = AsyncStore()
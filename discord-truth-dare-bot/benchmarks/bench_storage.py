@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""Storage and draw-path micro-benchmarks.
+
+Builds a synthetic store (N guilds, M custom prompts each) in a temporary
+data directory for every combination of backend, guild count, prompt count
+and flush mode, then times the hot storage calls and a full draw:
+
+    python benchmarks/bench_storage.py --guilds 10,1000,50000 --backends json,journal,sqlite
+    python benchmarks/bench_storage.py --quick -o bench.json
+
+Each case reports per-operation throughput and p50/p99 latency, the cold
+load time, the resident memory added by loading (RSS, Linux only) and the
+size of the data directory. Results are written as JSON so runs can be
+diffed between backends, flush modes and commits. Runs fully offline; the
+embed step of the draw is skipped when discord.py is not installed.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import draw  # noqa: E402
+import sampling  # noqa: E402
+import storage  # noqa: E402
+from prompts import ACTIONS, ACTION_TAGS, VERITES, VERITE_TAGS  # noqa: E402
+
+try:
+    from bot import build_prompt_embed
+except ImportError:  # discord.py (or python-dotenv) not installed
+    build_prompt_embed = None  # type: ignore[assignment]
+
+WORDS = "chante danse raconte imite montre envoie dessine avoue choisis décris ton ta tes un une le la les ami serveur photo souvenir secret".split()
+
+
+class _Author:
+    display_name = "bench"
+
+
+def _text(rng: random.Random) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 14))).capitalize() + "."
+
+
+def populate(num_guilds: int, num_prompts: int, seed: int) -> None:
+    """Write the synthetic store through the current backend, in one batch."""
+    rng = random.Random(seed)
+    batch = []
+    for gid in range(1, num_guilds + 1):
+        ops: List[storage.Op] = [("add_channel", 1000 + gid)]
+        for i in range(num_prompts):
+            kind = "action" if i % 2 == 0 else "verite"
+            ops.append(("add_prompt", kind, f"{gid:x}p{i}", _text(rng)))
+        if num_prompts:
+            ops.append(("disable_base", "action", rng.randrange(len(ACTIONS))))
+        batch.append((gid, ops))
+    backend = storage._backend()
+    backend.apply_many(batch)
+    compact = getattr(backend, "compact", None)
+    if compact is not None:
+        compact()
+
+
+def _dir_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def _rss() -> Optional[int]:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _percentile(sorted_ns: Sequence[int], q: float) -> float:
+    i = min(len(sorted_ns) - 1, int(q * len(sorted_ns)))
+    return sorted_ns[i] / 1e3
+
+
+def measure(fn: Callable[[], Any], max_ops: int, max_seconds: float) -> Dict[str, float]:
+    """Call ``fn`` until ``max_ops`` calls or ``max_seconds``; latencies in µs."""
+    samples: List[int] = []
+    deadline = time.perf_counter() + max_seconds
+    while len(samples) < max_ops and time.perf_counter() < deadline:
+        started = time.perf_counter_ns()
+        fn()
+        samples.append(time.perf_counter_ns() - started)
+    total = sum(samples)
+    samples.sort()
+    return {
+        "ops": len(samples),
+        "ops_per_s": len(samples) / (total / 1e9) if total else 0.0,
+        "p50_us": _percentile(samples, 0.50),
+        "p99_us": _percentile(samples, 0.99),
+        "mean_us": total / len(samples) / 1e3,
+    }
+
+
+def run_case(backend: str, num_guilds: int, num_prompts: int, flush_delay: float, args: argparse.Namespace) -> Dict[str, Any]:
+    data_dir = tempfile.mkdtemp(prefix="aouv-bench-")
+    try:
+        storage.FLUSH_DELAY = 0
+        storage.configure(backend, data_dir)
+        started = time.perf_counter()
+        populate(num_guilds, num_prompts, args.seed)
+        populate_s = time.perf_counter() - started
+
+        # Fresh backend: the first access pays the full load.
+        storage.configure(backend, data_dir)
+        storage.FLUSH_DELAY = flush_delay
+        rss_before = _rss()
+        started = time.perf_counter()
+        storage.get_channels(1)
+        cold_load_s = time.perf_counter() - started
+        rss_after = _rss()
+        memory_bytes = rss_after - rss_before if rss_before is not None and rss_after is not None else None
+
+        rng = random.Random(args.seed)
+        engine = draw.DrawEngine(rng=random.Random(args.seed))
+
+        def guild() -> int:
+            return rng.randint(1, num_guilds)
+
+        def draw_once(with_embed: bool) -> None:
+            gid = guild()
+            kind = rng.choice(("action", "verite"))
+            base, base_tags = (ACTIONS, ACTION_TAGS) if kind == "action" else (VERITES, VERITE_TAGS)
+            weighted = sampling.weighted_pool(gid, kind, base, base_tags)
+            text = engine.draw(gid, 1000 + gid, kind, weighted.pool) if weighted.uniform else weighted.sample(engine.rng)
+            if with_embed:
+                build_prompt_embed(kind, text or "", _Author())  # type: ignore[misc]
+
+        ops: Dict[str, Callable[[], Any]] = {
+            "get_channels": lambda: storage.get_channels(guild()),
+            "get_combined_actions": lambda: storage.get_combined_actions(guild(), ACTIONS),
+            "get_combined_truths": lambda: storage.get_combined_truths(guild(), VERITES),
+            "draw": lambda: draw_once(False),
+        }
+        if build_prompt_embed is not None:
+            ops["draw_embed"] = lambda: draw_once(True)
+        ops["add_custom_prompt"] = lambda: storage.add_custom_prompt(guild(), "action", _text(rng))
+        ops["disable_base_prompt"] = lambda: storage.disable_base_prompt(guild(), "verite", rng.randrange(len(VERITES)))
+
+        results = {name: measure(fn, args.ops, args.max_seconds) for name, fn in ops.items()}
+        started = time.perf_counter()
+        storage.flush()
+        flush_s = time.perf_counter() - started
+        return {
+            "backend": backend,
+            "guilds": num_guilds,
+            "prompts_per_guild": num_prompts,
+            "flush_delay": flush_delay,
+            "populate_s": populate_s,
+            "cold_load_s": cold_load_s,
+            "memory_bytes": memory_bytes,
+            "disk_bytes": _dir_size(data_dir),
+            "final_flush_s": flush_s,
+            "embed": build_prompt_embed is not None,
+            "ops": results,
+        }
+    finally:
+        storage.configure()
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def _ints(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v]
+
+
+def _floats(value: str) -> List[float]:
+    return [float(v) for v in value.split(",") if v]
+
+
+def main(argv: Sequence[str]) -> None:
+    parser = argparse.ArgumentParser(description="Benchmarks du stockage et des tirages AouV.")
+    parser.add_argument("--backends", default="json,journal,sqlite")
+    parser.add_argument("--guilds", type=_ints, default=[10, 1000, 50000], help="nombres de serveurs, ex. 10,1000")
+    parser.add_argument("--prompts", type=_ints, default=[0, 20], help="prompts personnalisés par serveur")
+    parser.add_argument("--flush-delay", type=_floats, default=[0.0, 0.5], help="0 = écriture immédiate, >0 = écritures regroupées")
+    parser.add_argument("--ops", type=int, default=2000, help="appels max par opération")
+    parser.add_argument("--max-seconds", type=float, default=3.0, help="durée max par opération")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--quick", action="store_true", help="10 et 1000 serveurs, 200 appels")
+    parser.add_argument("-o", "--output", default="bench_results.json")
+    args = parser.parse_args(argv)
+    if args.quick:
+        args.guilds = [g for g in args.guilds if g <= 1000]
+        args.ops = min(args.ops, 200)
+
+    cases = []
+    for backend in args.backends.split(","):
+        for num_guilds in args.guilds:
+            for num_prompts in args.prompts:
+                for flush_delay in args.flush_delay:
+                    case = run_case(backend, num_guilds, num_prompts, flush_delay, args)
+                    cases.append(case)
+                    print(
+                        f"{backend:8} guilds={num_guilds:<6} prompts={num_prompts:<4} flush={flush_delay:<4g} "
+                        f"load={case['cold_load_s'] * 1000:.1f}ms mem={(case['memory_bytes'] or 0) / 1e6:.1f}MB "
+                        f"disk={case['disk_bytes'] / 1e6:.1f}MB"
+                    )
+                    for name, r in case["ops"].items():
+                        print(f"    {name:22} {r['ops_per_s']:>10.0f}/s  p50={r['p50_us']:.1f}µs  p99={r['p99_us']:.1f}µs")
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "args": {k: v for k, v in vars(args).items() if k != "output"},
+        "cases": cases,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Résultats écrits dans {args.output}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+"""End-to-end load simulator: the real bot.py handlers, fake interactions.
+
+Thousands of concurrent virtual users call the command callbacks
+(``action_cmd.callback`` ...), the persistent buttons, the ``/aouv``
+game sessions and a few ``/aouvconfig`` writes with fake ``Interaction`` objects whose
+``response`` only records what would have been sent (after an optional
+simulated round trip). Storage runs for real, in a temporary data
+directory, through the same thread pool as in production:
+
+    python benchmarks/load_sim.py --requests 20000 --concurrency 1000
+    python benchmarks/load_sim.py --mix action=45,verite=45,button=5,config=5 --backend sqlite -o load.json
+
+Reports throughput, latency percentiles per operation, event-loop lag and
+rate-limited replies. Needs discord.py installed, but no token or network.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import discord  # noqa: E402
+from discord import app_commands  # noqa: E402
+
+import bot  # noqa: E402
+import ratelimit  # noqa: E402
+import storage  # noqa: E402
+from prompts import VERITES  # noqa: E402
+
+DEFAULT_MIX = "action=35,verite=35,button=15,aouv=10,config=5"
+GUILD_BASE = 10 ** 17
+
+
+class FakeMember(discord.Member):
+    """Passes the ``isinstance(user, discord.Member)`` checks without a gateway state."""
+
+    def __init__(self, user_id: int, manager: bool) -> None:
+        self._fake_id = user_id
+        self._manager = manager
+
+    @property
+    def id(self) -> int:  # type: ignore[override]
+        return self._fake_id
+
+    @property
+    def display_name(self) -> str:
+        return f"joueur{self._fake_id}"
+
+    @property
+    def mention(self) -> str:
+        return f"<@{self._fake_id}>"
+
+    @property
+    def guild_permissions(self) -> discord.Permissions:
+        return discord.Permissions(manage_guild=self._manager)
+
+    def __repr__(self) -> str:
+        return f"<FakeMember id={self._fake_id}>"
+
+
+class FakeChannel:
+    def __init__(self, channel_id: int) -> None:
+        self.id = channel_id
+        self.mention = f"<#{channel_id}>"
+
+
+class FakeResponse:
+    def __init__(self, rtt: float) -> None:
+        self.rtt = rtt
+        self.sent: List[Dict[str, Any]] = []
+        self._done = False
+
+    def is_done(self) -> bool:
+        return self._done
+
+    async def send_message(self, content: Optional[str] = None, **kwargs: Any) -> None:
+        if self._done:
+            raise RuntimeError("interaction already answered")
+        self._done = True
+        if self.rtt:
+            await asyncio.sleep(self.rtt)
+        self.sent.append(dict(kwargs, content=content))
+
+    async def defer(self, **kwargs: Any) -> None:
+        self._done = True
+        if self.rtt:
+            await asyncio.sleep(self.rtt)
+
+
+class FakeFollowup:
+    def __init__(self, response: FakeResponse) -> None:
+        self._response = response
+
+    async def send(self, content: Optional[str] = None, **kwargs: Any) -> None:
+        if self._response.rtt:
+            await asyncio.sleep(self._response.rtt)
+        self._response.sent.append(dict(kwargs, content=content))
+
+
+class FakeInteraction:
+    def __init__(self, guild_id: int, channel_id: int, user: FakeMember, rtt: float) -> None:
+        self.guild_id = guild_id
+        self.channel_id = channel_id
+        self.guild = discord.Object(id=guild_id)
+        self.user = user
+        self.response = FakeResponse(rtt)
+        self.followup = FakeFollowup(self.response)
+        self.extras: Dict[str, Any] = {}
+        self.command = None
+
+
+def _choice(kind: str) -> app_commands.Choice[str]:
+    return app_commands.Choice(name=kind, value=kind)
+
+
+class Simulation:
+    def __init__(self, args: argparse.Namespace) -> None:
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.rate_limited = 0
+        self._error_logged = False
+        self.lags: List[float] = []
+        mix = parse_mix(args.mix)
+        self.ops = list(mix)
+        self.weights = [mix[name] for name in self.ops]
+        self.handlers: Dict[str, Callable[[FakeInteraction], Awaitable[None]]] = {
+            "action": lambda i: bot.action_cmd.callback(i),
+            "verite": lambda i: bot.verite_cmd.callback(i),
+            "aouv": self._session,
+            "button": self._button,
+            "config": self._config,
+        }
+
+    async def _button(self, interaction: FakeInteraction) -> None:
+        await bot.DrawButton(self.rng.choice(("action", "verite"))).callback(interaction)  # type: ignore[arg-type]
+
+    async def _session(self, interaction: FakeInteraction) -> None:
+        roll = self.rng.random()
+        if roll < 0.1:
+            await bot.aouv_start.callback(interaction)
+        elif roll < 0.4:
+            await bot.aouv_join.callback(interaction)
+        elif roll < 0.5:
+            await bot.aouv_leave.callback(interaction)
+        else:
+            session = bot.sessions.engine.get(interaction.guild_id, interaction.channel_id)
+            if session is not None and session.players:
+                # Someone who actually plays, as in a real game.
+                interaction.user = FakeMember(self.rng.choice(session.players), manager=False)
+            await bot.aouv_next.callback(interaction)
+
+    async def _config(self, interaction: FakeInteraction) -> None:
+        interaction.user._manager = True
+        roll = self.rng.random()
+        if roll < 0.5:
+            text = f"Défi de charge n°{self.rng.randrange(10 ** 9)} pour {interaction.user.display_name}"
+            await bot.cfg_prompt_add.callback(interaction, _choice(self.rng.choice(("action", "verite"))), text, True)
+        elif roll < 0.8:
+            numero = self.rng.randint(1, len(VERITES))
+            await bot.cfg_prompt_disable_base.callback(interaction, _choice("verite"), numero)
+        else:
+            channel = FakeChannel(interaction.channel_id)
+            await bot.cfg_channel_add.callback(interaction, channel)  # type: ignore[arg-type]
+
+    def _interaction(self) -> FakeInteraction:
+        args = self.args
+        g = self.rng.randrange(args.guilds)
+        guild_id = GUILD_BASE + g
+        channel_id = GUILD_BASE + args.guilds + g * args.channels + self.rng.randrange(args.channels)
+        user = FakeMember(GUILD_BASE * 2 + self.rng.randrange(args.users), manager=False)
+        return FakeInteraction(guild_id, channel_id, user, args.rtt_ms / 1000)
+
+    async def _client(self, budget: List[int]) -> None:
+        while budget[0] > 0:
+            budget[0] -= 1
+            name = self.rng.choices(self.ops, self.weights)[0]
+            interaction = self._interaction()
+            started = time.perf_counter()
+            try:
+                await self.handlers[name](interaction)
+            except Exception:
+                self.errors[name] = self.errors.get(name, 0) + 1
+                if not self._error_logged:
+                    # The first one is enough to see what breaks.
+                    self._error_logged = True
+                    logging.exception("Échec de %s", name)
+                continue
+            self.latencies.setdefault(name, []).append(time.perf_counter() - started)
+            sent = interaction.response.sent
+            if sent and sent[0].get("ephemeral") and (sent[0].get("content") or "").startswith("Doucement"):
+                self.rate_limited += 1
+
+    async def _watch_lag(self, stop: asyncio.Event, interval: float = 0.05) -> None:
+        while not stop.is_set():
+            started = time.perf_counter()
+            await asyncio.sleep(interval)
+            self.lags.append(max(0.0, time.perf_counter() - started - interval))
+
+    async def run(self) -> Dict[str, Any]:
+        stop = asyncio.Event()
+        watcher = asyncio.create_task(self._watch_lag(stop))
+        budget = [self.args.requests]
+        started = time.perf_counter()
+        await asyncio.gather(*(self._client(budget) for _ in range(self.args.concurrency)))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await watcher
+        await bot.store.flush()
+        done = sum(len(v) for v in self.latencies.values())
+        return {
+            "requests": done,
+            "elapsed_s": elapsed,
+            "throughput_per_s": done / elapsed if elapsed else 0.0,
+            "rate_limited": self.rate_limited,
+            "errors": self.errors,
+            "latency_ms": {name: _summary(values) for name, values in sorted(self.latencies.items())},
+            "loop_lag_ms": _summary(self.lags),
+        }
+
+
+def _summary(values: Sequence[float]) -> Dict[str, float]:
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+
+    def pct(q: float) -> float:
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+
+    return {"count": len(ordered), "p50": pct(0.50), "p95": pct(0.95), "p99": pct(0.99), "max": ordered[-1] * 1000}
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    mix: Dict[str, float] = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ("action", "verite", "button", "aouv", "config"):
+            raise argparse.ArgumentTypeError(f"opération inconnue: {name!r}")
+        mix[name] = float(weight or 1)
+    if not any(mix.values()):
+        raise argparse.ArgumentTypeError("le mélange est vide")
+    return mix
+
+
+def main(argv: Sequence[str]) -> None:
+    parser = argparse.ArgumentParser(description="Simulation de charge des handlers du bot AouV.")
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=1000, help="utilisateurs virtuels simultanés")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"poids par opération (défaut {DEFAULT_MIX})")
+    parser.add_argument("--guilds", type=int, default=200)
+    parser.add_argument("--channels", type=int, default=3, help="salons par serveur")
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--rtt-ms", type=float, default=30.0, help="aller-retour Discord simulé par réponse")
+    parser.add_argument("--backend", default=storage.STORAGE_BACKEND)
+    parser.add_argument("--no-rate-limit", action="store_true", help="désactive le limiteur de débit")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("-o", "--output", help="fichier JSON de résultats")
+    args = parser.parse_args(argv)
+    parse_mix(args.mix)
+
+    data_dir = tempfile.mkdtemp(prefix="aouv-load-")
+    storage.configure(args.backend, data_dir)
+    if args.no_rate_limit:
+        ratelimit.users.enabled = ratelimit.channels.enabled = False
+    try:
+        report = asyncio.run(Simulation(args).run())
+    finally:
+        storage.configure()
+        shutil.rmtree(data_dir, ignore_errors=True)
+    report["args"] = vars(args)
+
+    print(f"{report['requests']} requêtes en {report['elapsed_s']:.2f} s, {report['throughput_per_s']:.0f}/s")
+    print(f"limitées: {report['rate_limited']}, erreurs: {report['errors'] or 0}")
+    for name, s in report["latency_ms"].items():
+        print(f"  {name:8} n={s['count']:<6} p50={s['p50']:.1f}ms p95={s['p95']:.1f}ms p99={s['p99']:.1f}ms max={s['max']:.1f}ms")
+    lag = report["loop_lag_ms"]
+    if lag["count"]:
+        print(f"  retard de boucle: p50={lag['p50']:.1f}ms p99={lag['p99']:.1f}ms max={lag['max']:.1f}ms")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,32 +1,41 @@
 # -*- coding: utf-8 -*-
+import asyncio
 import os
-import random
 import logging
+import math
+import re
+import time
+from http.server import ThreadingHTTPServer
+from typing import Dict, List, Optional, Sequence
 
 import discord
 from discord import app_commands
-from discord.ext import commands
+from discord.ext import commands, tasks
 from dotenv import load_dotenv
 
-from prompts import ACTIONS, VERITES
-from storage import (
-	get_combined_actions,
-	get_combined_truths,
-	get_channels,
-	add_channel,
-	remove_channel,
-	list_custom_prompts,
-	add_custom_prompt,
-	edit_custom_prompt,
-	remove_custom_prompt,
-	disable_base_prompt,
-	enable_base_prompt,
-	list_disabled_base,
-)
+from prompts import ACTIONS, ACTION_TAGS, VERITES, VERITE_TAGS
+from async_storage import store
+import command_sync
+import dedup
+import draw
+import history
+import metrics
+import packs
+import profiler
+import prompt_io
+import ratelimit
+import sampling
+import search
+import sessions
+import sharding
+import storage
 
 
 load_dotenv()
 
+# Process start, for the startup-to-ready time logged in on_ready.
+STARTED_AT = time.monotonic()
+
 DISCORD_BOT_TOKEN = os.getenv("DISCORD_BOT_TOKEN") or os.getenv("BOT_TOKEN")
 
 COLOR_ACTION = 0xFF6B6B
@@ -34,7 +43,7 @@ COLOR_TRUTH = 0x3399FF
 COLOR_NEUTRAL = 0x888888
 
 
-def build_prompt_embed(kind: str, prompt_text: str, author: discord.abc.User) -> discord.Embed:
+def build_prompt_embed(kind: str, prompt_text: str, author: discord.abc.User, tag: Optional[str] = None) -> discord.Embed:
 	"""Create a nicely formatted embed for the prompt."""
 	if kind == "action":
 		title = "Action 🎯"
@@ -47,83 +56,445 @@ def build_prompt_embed(kind: str, prompt_text: str, author: discord.abc.User) ->
 		color = COLOR_NEUTRAL
 
 	embed = discord.Embed(title=title, description=prompt_text, color=color)
-	embed.set_footer(text=f"Demandé par {author.display_name}")
+	footer = f"Demandé par {author.display_name}"
+	if tag:
+		footer += f" · tag: {tag}"
+	embed.set_footer(text=footer)
 	return embed
 
 
+async def draw_prompt(interaction: discord.Interaction, kind: str, tag: Optional[str] = None) -> str:
+	"""Draw a prompt for this guild/channel, optionally restricted to a tag.
+
+	With equal weights, draws go through the no-repeat shuffle bags (one per
+	tag filter); with per-prompt weights they use the pool's alias table.
+	"""
+	guild_id = interaction.guild_id or 0
+	if kind == "action":
+		base, base_tags = ACTIONS, ACTION_TAGS
+		empty = "(Aucune action configurée)"
+	else:
+		base, base_tags = VERITES, VERITE_TAGS
+		empty = "(Aucune vérité configurée)"
+	if tag:
+		empty = f"(Aucun prompt avec le tag « {tag} »)"
+	weighted = await store.run(sampling.weighted_pool, guild_id, kind, base, base_tags, tag)
+	if not weighted:
+		return empty
+	if weighted.uniform:
+		bag_kind = kind if tag is None else f"{kind}#{tag}"
+		pool = weighted.pool if tag is None else weighted
+		prompt_text = draw.engine.draw(guild_id, interaction.channel_id or 0, bag_kind, pool)
+	else:
+		prompt_text = weighted.sample(draw.engine.rng)
+	if not prompt_text:
+		return empty
+	history.recorder.record_draw(guild_id, interaction.channel_id or 0, interaction.user.id, kind, prompt_text)
+	return prompt_text
+
+
+async def _rate_limited(interaction: discord.Interaction) -> bool:
+	"""True (after a short ephemeral notice) if the user draws too fast here.
+
+	Checked before any storage access, and the notice is a plain ephemeral
+	text rather than an embed: rejecting a click must stay cheap.
+	"""
+	wait = ratelimit.check(interaction.guild_id or 0, interaction.channel_id or 0, interaction.user.id)
+	if not wait:
+		return False
+	await interaction.response.send_message(f"Doucement ! Réessaie dans {math.ceil(wait)} s.", ephemeral=True)
+	return True
+
+
+def _parse_tag_option(tag: Optional[str]) -> Optional[str]:
+	if not tag:
+		return None
+	return sampling.normalize_tag(tag) or None
+
+
+async def _tag_choices(interaction: discord.Interaction, kinds: Sequence[str], current: str) -> List[app_commands.Choice[str]]:
+	counts: Dict[str, int] = {}
+	for kind in kinds:
+		base, base_tags = (ACTIONS, ACTION_TAGS) if kind == "action" else (VERITES, VERITE_TAGS)
+		for tag, count in (await store.run(sampling.list_tags, interaction.guild_id, kind, base, base_tags)).items():
+			counts[tag] = counts.get(tag, 0) + count
+	prefix = sampling.normalize_tag(current)
+	matching = sorted((t for t in counts if t.startswith(prefix)), key=lambda t: (-counts[t], t))
+	return [app_commands.Choice(name=f"{t} ({counts[t]})", value=t) for t in matching[:25]]
+
+
+class DrawButton(discord.ui.DynamicItem[discord.ui.Button], template=r"aouv:(?P<kind>action|verite)(?::(?P<tag>[a-z0-9_-]{1,32}))?"):
+	"""Stateless Action/Vérité button: everything it needs is in its custom_id.
+
+	Registered once with ``bot.add_dynamic_items``, so any message carrying
+	these buttons keeps working after a restart and no per-game view or timer
+	is kept in memory. Guild and channel come from the interaction.
+	"""
+
+	def __init__(self, kind: str, tag: Optional[str] = None) -> None:
+		custom_id = f"aouv:{kind}" + (f":{tag}" if tag else "")
+		if kind == "action":
+			button = discord.ui.Button(label="Action", emoji="🎯", style=discord.ButtonStyle.danger, custom_id=custom_id)
+		else:
+			button = discord.ui.Button(label="Vérité", emoji="💬", style=discord.ButtonStyle.primary, custom_id=custom_id)
+		super().__init__(button)
+		self.kind = kind
+		self.tag = tag
+
+	@classmethod
+	async def from_custom_id(
+		cls, interaction: discord.Interaction, item: discord.ui.Button, match: "re.Match[str]"
+	) -> "DrawButton":
+		return cls(match["kind"], match["tag"])
+
+	async def callback(self, interaction: discord.Interaction) -> None:
+		with metrics.command_seconds.time(f"bouton {self.kind}"):
+			if await _rate_limited(interaction):
+				return
+			prompt_text = await draw_prompt(interaction, self.kind, self.tag)
+			embed = build_prompt_embed(self.kind, prompt_text, interaction.user, self.tag)
+			await interaction.response.send_message(embed=embed)
+
+
 class TruthDareView(discord.ui.View):
-	"""View with two buttons to draw Action/Vérité and send a new message each time."""
+	"""View with two buttons to draw Action/Vérité and send a new message each time.
+
+	Only used to attach the buttons to a message: it has no timeout and holds
+	no state, clicks are routed to ``DrawButton`` by custom_id.
+	"""
+
+	def __init__(self, tag: Optional[str] = None) -> None:
+		super().__init__(timeout=None)
+		self.add_item(DrawButton("action", tag))
+		self.add_item(DrawButton("verite", tag))
+
+
+class AouVTree(app_commands.CommandTree):
+	"""Command tree timing every slash command for the metrics."""
 
-	def __init__(self) -> None:
-		super().__init__(timeout=900)
+	async def interaction_check(self, interaction: discord.Interaction) -> bool:
+		interaction.extras["started"] = time.perf_counter()
+		return True
 
-	@discord.ui.button(label="Action", emoji="🎯", style=discord.ButtonStyle.danger)
-	async def draw_action(self, interaction: discord.Interaction, _: discord.ui.Button) -> None:
-		guild_id = interaction.guild_id
-		pool = get_combined_actions(guild_id, ACTIONS) if guild_id else list(ACTIONS)
-		prompt_text = random.choice(pool) if pool else "(Aucune action configurée)"
-		embed = build_prompt_embed("action", prompt_text, interaction.user)
-		await interaction.response.send_message(embed=embed)
+	async def on_error(self, interaction: discord.Interaction, error: app_commands.AppCommandError) -> None:
+		command = interaction.command
+		if command is not None:
+			_observe_command(interaction, command.qualified_name)
+			metrics.command_errors.inc(command.qualified_name)
+		logging.error("Erreur dans la commande %r", command and command.qualified_name, exc_info=error)
 
-	@discord.ui.button(label="Vérité", emoji="💬", style=discord.ButtonStyle.primary)
-	async def draw_truth(self, interaction: discord.Interaction, _: discord.ui.Button) -> None:
-		guild_id = interaction.guild_id
-		pool = get_combined_truths(guild_id, VERITES) if guild_id else list(VERITES)
-		prompt_text = random.choice(pool) if pool else "(Aucune vérité configurée)"
-		embed = build_prompt_embed("verite", prompt_text, interaction.user)
-		await interaction.response.send_message(embed=embed)
+
+def _observe_command(interaction: discord.Interaction, name: str) -> None:
+	started = interaction.extras.get("started")
+	if started is not None:
+		metrics.command_seconds.observe(time.perf_counter() - started, name)
+
+
+class AouVBot(commands.AutoShardedBot):
+	startup_seconds: Optional[float] = None
+	loop_lag_monitor: Optional["asyncio.Task[None]"] = None
+	watchdog: Optional[profiler.LoopWatchdog] = None
+	sessions_saved_at = 0.0
+	metrics_server: Optional[ThreadingHTTPServer] = None
+
+	async def setup_hook(self) -> None:
+		self.add_dynamic_items(DrawButton)
+		self.loop_lag_monitor = asyncio.create_task(metrics.monitor_loop_lag())
+		if metrics.METRICS_PORT:
+			self.metrics_server = metrics.serve()
+		if profiler.WATCHDOG_THRESHOLD > 0:
+			self.watchdog = profiler.LoopWatchdog()
+			self.watchdog.start()
+		if profiler.PROFILE_ON_START > 0:
+			asyncio.create_task(self.profile(profiler.PROFILE_ON_START))
+		suffix = sharding.state_suffix(self.shard_ids)
+		await store.run(draw.engine.load, draw.state_path(suffix))
+		await store.run(sessions.engine.load, sessions.state_path(suffix))
+		await store.run(history.recorder.load_stats, history.stats_path(suffix))
+		self.maintenance.start()
+		self.session_upkeep.start()
+		self.history_flush.start()
+		# Once per deployment (the process owning shard 0), not on every
+		# gateway reconnect like on_ready.
+		if not sharding.owns_global_tasks(self.shard_ids):
+			return
+		try:
+			await self.sync_commands(force=command_sync.FORCE_SYNC)
+		except Exception:
+			logging.exception("Échec de la synchronisation des commandes slash")
+
+	async def sync_commands(self, force: bool = False) -> Optional[int]:
+		"""Sync slash commands if their schema changed since the last sync.
+
+		With AOUV_DEV_GUILD_ID set, commands are synced to that guild only.
+		Returns the number of synced commands, or None if the sync was skipped.
+		"""
+		guild = discord.Object(id=command_sync.DEV_GUILD_ID) if command_sync.DEV_GUILD_ID else None
+		if guild is not None:
+			self.tree.copy_global_to(guild=guild)
+		payload = [cmd.to_dict(self.tree) for cmd in self.tree.get_commands(guild=guild)]
+		digest = command_sync.fingerprint(payload)
+		sync_scope = command_sync.scope(self.application_id, guild.id if guild else None)
+		if not force and await store.run(command_sync.is_current, sync_scope, digest):
+			logging.info("Commandes slash inchangées (%s), synchronisation ignorée", sync_scope)
+			return None
+		started = time.monotonic()
+		synced = await self.tree.sync(guild=guild)
+		await store.run(command_sync.record, sync_scope, digest)
+		logging.info("Commandes slash synchronisées (%s): %d en %.2f s", sync_scope, len(synced), time.monotonic() - started)
+		return len(synced)
+
+	async def close(self) -> None:
+		self.maintenance.cancel()
+		self.session_upkeep.cancel()
+		self.history_flush.cancel()
+		if self.loop_lag_monitor is not None:
+			self.loop_lag_monitor.cancel()
+		if self.watchdog is not None:
+			self.watchdog.stop()
+		await self.save_draw_state()
+		await self.save_sessions()
+		await self.flush_history()
+		await super().close()
+		await store.flush()
+		store.close()
+
+	async def profile(self, seconds: float) -> Optional[str]:
+		"""Run the sampling profiler off the loop; returns the written file (None on failure)."""
+		try:
+			return await asyncio.to_thread(profiler.profiler.record, seconds)
+		except Exception:
+			logging.exception("Échec du profilage")
+			return None
+
+	async def save_draw_state(self) -> None:
+		# Snapshot on the loop (bags are only touched here), serialize and write in the pool.
+		path = draw.state_path(sharding.state_suffix(self.shard_ids))
+		await store.run(draw.save_snapshot, draw.engine.snapshot(), path)
+
+	async def save_sessions(self) -> None:
+		path = sessions.state_path(sharding.state_suffix(self.shard_ids))
+		try:
+			await store.run(draw.write_state, sessions.engine.dumps(), path)
+		except BaseException:
+			# Not saved: keep it due for the next tick.
+			sessions.engine.dirty = True
+			raise
+		self.sessions_saved_at = time.monotonic()
+
+	async def flush_history(self) -> None:
+		# Drain and snapshot on the loop, append to disk in the pool.
+		if not history.recorder.dirty:
+			return
+		suffix = sharding.state_suffix(self.shard_ids)
+		dropped, history.recorder.dropped = history.recorder.dropped, 0
+		if dropped:
+			logging.warning("Historique des tirages: %d événements perdus (tampon plein)", dropped)
+		# Both before any await: draws recorded meanwhile stay for the next flush.
+		batch, changes = history.recorder.drain(), history.recorder.stats_changes()
+		await store.run(history.write_batch, batch, suffix)
+		await store.run(history.write_stats, changes, history.stats_path(suffix))
+
+	@tasks.loop(seconds=history.HISTORY_FLUSH_INTERVAL)
+	async def history_flush(self) -> None:
+		try:
+			await self.flush_history()
+		except Exception:
+			logging.exception("Échec de l'écriture de l'historique des tirages")
+
+	@tasks.loop(seconds=sessions.SESSION_TICK)
+	async def session_upkeep(self) -> None:
+		expired = sessions.engine.expire()
+		if expired:
+			logging.debug("Parties inactives expirées: %d", len(expired))
+		# Snapshots are batched: at most one write per interval, only after changes.
+		if sessions.engine.dirty and time.monotonic() - self.sessions_saved_at >= sessions.SESSION_SAVE_INTERVAL:
+			try:
+				await self.save_sessions()
+			except Exception:
+				logging.exception("Échec de la sauvegarde des parties")
+
+	@tasks.loop(minutes=5)
+	async def maintenance(self) -> None:
+		evicted = draw.engine.sweep()
+		if evicted:
+			logging.debug("Sacs de tirage inactifs évincés: %d", evicted)
+		idle_users, idle_channels = ratelimit.sweep()
+		if idle_users or idle_channels:
+			logging.debug("Limiteurs de débit inactifs évincés: %d utilisateurs, %d salons", idle_users, idle_channels)
+		try:
+			await self.save_draw_state()
+		except Exception:
+			logging.exception("Échec de la sauvegarde de l'état des tirages")
 
 
 intents = discord.Intents.default()
 # We only need default intents for slash commands and buttons
-bot = commands.Bot(command_prefix="!", intents=intents)
+bot = AouVBot(
+	command_prefix="!", intents=intents, tree_cls=AouVTree, shard_count=sharding.SHARD_COUNT, shard_ids=sharding.SHARD_IDS
+)
 
 tree = bot.tree
 
+metrics.Gauge("aouv_draw_bags", "Sacs de tirage actifs en mémoire.", lambda: len(draw.engine))
+metrics.Gauge("aouv_rate_limit_keys", "Utilisateurs suivis par le limiteur de débit.", lambda: len(ratelimit.users))
+metrics.Gauge("aouv_guilds", "Serveurs vus par ce processus.", lambda: len(bot.guilds))
+
+
+@bot.event
+async def on_app_command_completion(interaction: discord.Interaction, command: app_commands.Command) -> None:
+	_observe_command(interaction, command.qualified_name)
+
 
 @bot.event
 async def on_ready() -> None:
-	logging.info("Bot connecté en tant que %s (ID: %s)", bot.user, getattr(bot.user, "id", "?"))
-	try:
-		synced = await tree.sync()
-		logging.info("Commandes slash synchronisées: %d", len(synced))
-	except Exception:
-		logging.exception("Échec de la synchronisation des commandes slash")
+	if bot.startup_seconds is not None:
+		logging.info("Bot reconnecté en tant que %s", bot.user)
+		return
+	bot.startup_seconds = time.monotonic() - STARTED_AT
+	logging.info(
+		"Bot connecté en tant que %s (ID: %s), shards %s/%s, prêt en %.2f s",
+		bot.user, getattr(bot.user, "id", "?"), bot.shard_ids or "tous", bot.shard_count, bot.startup_seconds,
+	)
 
 
 @tree.command(name="action", description="Obtiens un défi 'Action' aléatoire.")
-async def action_cmd(interaction: discord.Interaction) -> None:
-	pool = get_combined_actions(interaction.guild_id, ACTIONS) if interaction.guild_id else list(ACTIONS)
-	prompt_text = random.choice(pool) if pool else "(Aucune action configurée)"
-	embed = build_prompt_embed("action", prompt_text, interaction.user)
+@app_commands.describe(tag="Ne tirer que les actions avec ce tag")
+async def action_cmd(interaction: discord.Interaction, tag: Optional[str] = None) -> None:
+	if await _rate_limited(interaction):
+		return
+	tag = _parse_tag_option(tag)
+	prompt_text = await draw_prompt(interaction, "action", tag)
+	embed = build_prompt_embed("action", prompt_text, interaction.user, tag)
 	await interaction.response.send_message(embed=embed)
 
 
+@action_cmd.autocomplete("tag")
+async def action_tag_autocomplete(interaction: discord.Interaction, current: str) -> List[app_commands.Choice[str]]:
+	return await _tag_choices(interaction, ("action",), current)
+
+
 @tree.command(name="verite", description="Obtiens une question 'Vérité' aléatoire.")
-async def verite_cmd(interaction: discord.Interaction) -> None:
-	pool = get_combined_truths(interaction.guild_id, VERITES) if interaction.guild_id else list(VERITES)
-	prompt_text = random.choice(pool) if pool else "(Aucune vérité configurée)"
-	embed = build_prompt_embed("verite", prompt_text, interaction.user)
+@app_commands.describe(tag="Ne tirer que les vérités avec ce tag")
+async def verite_cmd(interaction: discord.Interaction, tag: Optional[str] = None) -> None:
+	if await _rate_limited(interaction):
+		return
+	tag = _parse_tag_option(tag)
+	prompt_text = await draw_prompt(interaction, "verite", tag)
+	embed = build_prompt_embed("verite", prompt_text, interaction.user, tag)
 	await interaction.response.send_message(embed=embed)
 
 
-@tree.command(name="aouv", description="Démarre le jeu Action ou Vérité dans ce salon.")
-async def aouv_cmd(interaction: discord.Interaction) -> None:
-	if not interaction.guild_id:
-		return await interaction.response.send_message("Cette commande doit être utilisée dans un serveur.", ephemeral=True)
-	allowed = get_channels(interaction.guild_id)
+@verite_cmd.autocomplete("tag")
+async def verite_tag_autocomplete(interaction: discord.Interaction, current: str) -> List[app_commands.Choice[str]]:
+	return await _tag_choices(interaction, ("verite",), current)
+
+
+# ---- Turn-based games ----
+
+aouv_group = app_commands.Group(name="aouv", description="Partie d'Action ou Vérité à tour de rôle", guild_only=True)
+
+
+async def _channel_allowed(interaction: discord.Interaction) -> bool:
+	allowed = await store.get_channels(interaction.guild_id)
 	if allowed and interaction.channel_id not in allowed:
 		channels_str = ", ".join(f"<#{cid}>" for cid in allowed)
-		return await interaction.response.send_message(
+		await interaction.response.send_message(
 			f"Ce salon n'est pas configuré pour AouV. Utilise l'un des salons autorisés: {channels_str}", ephemeral=True
 		)
+		return False
+	return True
+
+
+async def _channel_session(interaction: discord.Interaction) -> Optional[sessions.Session]:
+	session = sessions.engine.get(interaction.guild_id or 0, interaction.channel_id or 0)
+	if session is None:
+		await interaction.response.send_message("Aucune partie en cours dans ce salon. Lance-en une avec `/aouv start`.", ephemeral=True)
+	return session
+
+
+def _players_line(session: sessions.Session) -> str:
+	return ", ".join(f"<@{uid}>" for uid in session.players)
+
+
+@aouv_group.command(name="start", description="Lance une partie à tour de rôle dans ce salon")
+@app_commands.describe(tag="Ne tirer que les prompts avec ce tag")
+async def aouv_start(interaction: discord.Interaction, tag: Optional[str] = None) -> None:
+	if await _rate_limited(interaction):
+		return
+	if not await _channel_allowed(interaction):
+		return
+	tag = _parse_tag_option(tag)
+	session, created = sessions.engine.start(interaction.guild_id, interaction.channel_id, interaction.user.id, tag)  # type: ignore[arg-type]
+	if not created:
+		return await interaction.response.send_message(
+			f"Une partie est déjà en cours ici ({len(session.players)} joueurs). Rejoins-la avec `/aouv join`.", ephemeral=True
+		)
+	description = (
+		"Rejoignez la partie avec `/aouv join`, puis `/aouv next` désigne le joueur suivant.\n"
+		"Les boutons ci-dessous tirent un prompt public pour celui qui clique."
+	)
+	if tag:
+		description += f"\nSeuls les prompts avec le tag « {tag} » sont tirés."
+	embed = discord.Embed(title="Action ou Vérité ?", description=description, color=COLOR_NEUTRAL)
+	embed.add_field(name="Joueurs", value=_players_line(session))
+	await interaction.response.send_message(embed=embed, view=TruthDareView(tag))
+
+
+@aouv_start.autocomplete("tag")
+async def aouv_tag_autocomplete(interaction: discord.Interaction, current: str) -> List[app_commands.Choice[str]]:
+	return await _tag_choices(interaction, ("action", "verite"), current)
+
+
+@aouv_group.command(name="join", description="Rejoint la partie en cours dans ce salon")
+async def aouv_join(interaction: discord.Interaction) -> None:
+	session = await _channel_session(interaction)
+	if session is None:
+		return
+	if interaction.user.id in session.players:
+		return await interaction.response.send_message("Tu participes déjà à cette partie.", ephemeral=True)
+	if not sessions.engine.join(session, interaction.user.id):
+		return await interaction.response.send_message(f"La partie est complète ({sessions.MAX_PLAYERS} joueurs).", ephemeral=True)
+	await interaction.response.send_message(f"Tu as rejoint la partie ({len(session.players)} joueurs).", ephemeral=True)
+
+
+@aouv_group.command(name="leave", description="Quitte la partie en cours dans ce salon")
+async def aouv_leave(interaction: discord.Interaction) -> None:
+	session = await _channel_session(interaction)
+	if session is None:
+		return
+	if not sessions.engine.leave(session, interaction.user.id):
+		return await interaction.response.send_message("Tu ne participes pas à cette partie.", ephemeral=True)
+	if not session.players:
+		return await interaction.response.send_message("Plus aucun joueur : la partie est terminée.")
+	await interaction.response.send_message("Tu as quitté la partie.", ephemeral=True)
+
+
+@aouv_group.command(name="next", description="Passe au joueur suivant")
+async def aouv_next(interaction: discord.Interaction) -> None:
+	session = await _channel_session(interaction)
+	if session is None:
+		return
+	if interaction.user.id not in session.players:
+		return await interaction.response.send_message("Seuls les joueurs de la partie peuvent passer au suivant.", ephemeral=True)
+	if await _rate_limited(interaction):
+		return
+	player = sessions.engine.next_player(session)
 	embed = discord.Embed(
 		title="Action ou Vérité ?",
-		description="Clique sur un bouton ci-dessous pour tirer un prompt public dans ce salon.",
+		description=f"Au tour de <@{player}> ! Choisis avec les boutons ci-dessous.",
 		color=COLOR_NEUTRAL,
 	)
-	view = TruthDareView()
-	await interaction.response.send_message(embed=embed, view=view)
+	embed.set_footer(text=f"{len(session.players)} joueurs · /aouv next pour continuer")
+	await interaction.response.send_message(
+		content=f"<@{player}>",
+		embed=embed,
+		view=TruthDareView(session.tag),
+		allowed_mentions=discord.AllowedMentions(users=True, everyone=False, roles=False),
+	)
+
+
+tree.add_command(aouv_group)
 
 
 # ---- Configuration commands ----
@@ -131,6 +502,7 @@ async def aouv_cmd(interaction: discord.Interaction) -> None:
 aouvconfig = app_commands.Group(name="aouvconfig", description="Configurer le jeu Action ou Vérité")
 channel_group = app_commands.Group(name="channel", description="Gérer les salons autorisés")
 prompt_group = app_commands.Group(name="prompt", description="Gérer les prompts")
+pack_group = app_commands.Group(name="pack", description="Packs de prompts partagés entre serveurs")
 
 
 async def _ensure_manager(interaction: discord.Interaction) -> bool:
@@ -149,7 +521,7 @@ async def _ensure_manager(interaction: discord.Interaction) -> bool:
 async def cfg_channel_add(interaction: discord.Interaction, salon: discord.TextChannel) -> None:
 	if not await _ensure_manager(interaction):
 		return
-	add_channel(interaction.guild_id, salon.id)  # type: ignore[arg-type]
+	await store.add_channel(interaction.guild_id, salon.id)  # type: ignore[arg-type]
 	await interaction.response.send_message(f"Salon autorisé: {salon.mention}", ephemeral=True)
 
 
@@ -158,7 +530,7 @@ async def cfg_channel_add(interaction: discord.Interaction, salon: discord.TextC
 async def cfg_channel_remove(interaction: discord.Interaction, salon: discord.TextChannel) -> None:
 	if not await _ensure_manager(interaction):
 		return
-	success = remove_channel(interaction.guild_id, salon.id)  # type: ignore[arg-type]
+	success = await store.remove_channel(interaction.guild_id, salon.id)  # type: ignore[arg-type]
 	msg = f"Salon retiré: {salon.mention}" if success else f"Ce salon n'était pas autorisé: {salon.mention}"
 	await interaction.response.send_message(msg, ephemeral=True)
 
@@ -167,7 +539,7 @@ async def cfg_channel_remove(interaction: discord.Interaction, salon: discord.Te
 async def cfg_channel_list(interaction: discord.Interaction) -> None:
 	if not await _ensure_manager(interaction):
 		return
-	ids = get_channels(interaction.guild_id)  # type: ignore[arg-type]
+	ids = await store.get_channels(interaction.guild_id)  # type: ignore[arg-type]
 	if not ids:
 		return await interaction.response.send_message("Aucun salon configuré. Le jeu est autorisé partout.", ephemeral=True)
 	mentions = []
@@ -177,23 +549,47 @@ async def cfg_channel_list(interaction: discord.Interaction) -> None:
 	await interaction.response.send_message("Salons autorisés: " + ", ".join(mentions), ephemeral=True)
 
 
+def _duplicate_message(duplicates: List[dedup.Duplicate]) -> str:
+	lines = []
+	for d in duplicates[:5]:
+		ref = f"base n°{d.ref}" if d.source == "base" else f"perso `{d.ref}`"
+		match = "identique" if d.similarity >= 1.0 else f"{d.similarity:.0%} similaire"
+		lines.append(f"[{ref}, {match}] {d.text}")
+	return "Prompt trop proche d'un prompt existant:\n" + "\n".join(lines)[:1700]
+
+
 @prompt_group.command(name="add", description="Ajoute un prompt personnalisé")
-@app_commands.describe(kind="Type de prompt", texte="Contenu du prompt")
+@app_commands.describe(kind="Type de prompt", texte="Contenu du prompt", forcer="Ajouter même si un prompt très proche existe")
 @app_commands.choices(kind=[app_commands.Choice(name="action", value="action"), app_commands.Choice(name="vérité", value="verite")])
-async def cfg_prompt_add(interaction: discord.Interaction, kind: app_commands.Choice[str], texte: str) -> None:
+async def cfg_prompt_add(interaction: discord.Interaction, kind: app_commands.Choice[str], texte: str, forcer: bool = False) -> None:
 	if not await _ensure_manager(interaction):
 		return
-	pid = add_custom_prompt(interaction.guild_id, kind.value, texte)  # type: ignore[arg-type]
+	base = ACTIONS if kind.value == "action" else VERITES
+	duplicates = await store.run(dedup.find_duplicates, interaction.guild_id, kind.value, texte, base)
+	# Exact duplicates are always refused; near duplicates only without `forcer`.
+	if duplicates and (not forcer or duplicates[0].similarity >= 1.0):
+		hint = "" if duplicates[0].similarity >= 1.0 else "\nUtilise `forcer: True` pour l'ajouter quand même."
+		return await interaction.response.send_message(_duplicate_message(duplicates) + hint, ephemeral=True)
+	pid = await store.add_custom_prompt(interaction.guild_id, kind.value, texte)  # type: ignore[arg-type]
 	await interaction.response.send_message(f"Ajouté ({kind.value}) avec l'ID `{pid}`.", ephemeral=True)
 
 
 @prompt_group.command(name="edit", description="Modifie un prompt personnalisé par ID")
-@app_commands.describe(kind="Type de prompt", prompt_id="ID du prompt", texte="Nouveau contenu")
+@app_commands.describe(
+	kind="Type de prompt", prompt_id="ID du prompt", texte="Nouveau contenu", forcer="Modifier même si un prompt très proche existe"
+)
 @app_commands.choices(kind=[app_commands.Choice(name="action", value="action"), app_commands.Choice(name="vérité", value="verite")])
-async def cfg_prompt_edit(interaction: discord.Interaction, kind: app_commands.Choice[str], prompt_id: str, texte: str) -> None:
+async def cfg_prompt_edit(
+	interaction: discord.Interaction, kind: app_commands.Choice[str], prompt_id: str, texte: str, forcer: bool = False
+) -> None:
 	if not await _ensure_manager(interaction):
 		return
-	success = edit_custom_prompt(interaction.guild_id, kind.value, prompt_id, texte)  # type: ignore[arg-type]
+	base = ACTIONS if kind.value == "action" else VERITES
+	duplicates = await store.run(dedup.find_duplicates, interaction.guild_id, kind.value, texte, base, prompt_id)
+	if duplicates and (not forcer or duplicates[0].similarity >= 1.0):
+		hint = "" if duplicates[0].similarity >= 1.0 else "\nUtilise `forcer: True` pour le modifier quand même."
+		return await interaction.response.send_message(_duplicate_message(duplicates) + hint, ephemeral=True)
+	success = await store.edit_custom_prompt(interaction.guild_id, kind.value, prompt_id, texte)  # type: ignore[arg-type]
 	msg = "Modifié." if success else "ID introuvable."
 	await interaction.response.send_message(msg, ephemeral=True)
 
@@ -204,7 +600,7 @@ async def cfg_prompt_edit(interaction: discord.Interaction, kind: app_commands.C
 async def cfg_prompt_remove(interaction: discord.Interaction, kind: app_commands.Choice[str], prompt_id: str) -> None:
 	if not await _ensure_manager(interaction):
 		return
-	success = remove_custom_prompt(interaction.guild_id, kind.value, prompt_id)  # type: ignore[arg-type]
+	success = await store.remove_custom_prompt(interaction.guild_id, kind.value, prompt_id)  # type: ignore[arg-type]
 	msg = "Supprimé." if success else "ID introuvable."
 	await interaction.response.send_message(msg, ephemeral=True)
 
@@ -215,10 +611,10 @@ async def cfg_prompt_remove(interaction: discord.Interaction, kind: app_commands
 async def cfg_prompt_list_custom(interaction: discord.Interaction, kind: app_commands.Choice[str]) -> None:
 	if not await _ensure_manager(interaction):
 		return
-	items = list_custom_prompts(interaction.guild_id, kind.value)  # type: ignore[arg-type]
+	items = await store.get_custom_prompts(interaction.guild_id, kind.value)  # type: ignore[arg-type]
 	if not items:
 		return await interaction.response.send_message("Aucun prompt personnalisé.", ephemeral=True)
-	lines = [f"`{pid}` — {text}" for pid, text in items[:50]]
+	lines = [f"`{p.id}`{_meta_suffix(p.tags, p.weight)} — {p.text}" for p in items[:50]]
 	more = "\n…" if len(items) > 50 else ""
 	await interaction.response.send_message("\n".join(lines) + more, ephemeral=True)
 
@@ -233,7 +629,9 @@ async def cfg_prompt_disable_base(interaction: discord.Interaction, kind: app_co
 	base = ACTIONS if kind.value == "action" else VERITES
 	if index < 0 or index >= len(base):
 		return await interaction.response.send_message("Numéro invalide.", ephemeral=True)
-	did = disable_base_prompt(interaction.guild_id, kind.value, index)  # type: ignore[arg-type]
+	did = await store.disable_base_prompt(interaction.guild_id, kind.value, index)  # type: ignore[arg-type]
+	if did:
+		history.recorder.record_base_toggle(interaction.guild_id or 0, interaction.user.id, kind.value, base[index], disabled=True)
 	msg = "Désactivé." if did else "Déjà désactivé."
 	await interaction.response.send_message(msg, ephemeral=True)
 
@@ -248,7 +646,9 @@ async def cfg_prompt_enable_base(interaction: discord.Interaction, kind: app_com
 	base = ACTIONS if kind.value == "action" else VERITES
 	if index < 0 or index >= len(base):
 		return await interaction.response.send_message("Numéro invalide.", ephemeral=True)
-	did = enable_base_prompt(interaction.guild_id, kind.value, index)  # type: ignore[arg-type]
+	did = await store.enable_base_prompt(interaction.guild_id, kind.value, index)  # type: ignore[arg-type]
+	if did:
+		history.recorder.record_base_toggle(interaction.guild_id or 0, interaction.user.id, kind.value, base[index], disabled=False)
 	msg = "Réactivé." if did else "N'était pas désactivé."
 	await interaction.response.send_message(msg, ephemeral=True)
 
@@ -259,7 +659,7 @@ async def cfg_prompt_enable_base(interaction: discord.Interaction, kind: app_com
 async def cfg_prompt_list_disabled(interaction: discord.Interaction, kind: app_commands.Choice[str]) -> None:
 	if not await _ensure_manager(interaction):
 		return
-	indices = list_disabled_base(interaction.guild_id, kind.value)  # type: ignore[arg-type]
+	indices = await store.list_disabled_base(interaction.guild_id, kind.value)  # type: ignore[arg-type]
 	if not indices:
 		return await interaction.response.send_message("Aucun prompt de base désactivé.", ephemeral=True)
 	numbers = ", ".join(str(i + 1) for i in sorted(indices))
@@ -278,15 +678,439 @@ async def cfg_prompt_list_base(interaction: discord.Interaction, kind: app_comma
 	per = 20
 	start = (page - 1) * per
 	end = start + per
-	slice_items = list(enumerate(base, start=1))[start:end]
+	slice_items = [(i + 1, base[i]) for i in range(start, min(end, len(base)))]
 	if not slice_items:
 		return await interaction.response.send_message("Page vide.", ephemeral=True)
 	lines = [f"{idx}. {text}" for idx, text in slice_items]
 	await interaction.response.send_message("\n".join(lines), ephemeral=True)
 
 
+def _meta_suffix(tags: Sequence[str], weight: float) -> str:
+	parts = []
+	if tags:
+		parts.append(", ".join(tags))
+	if weight != storage.DEFAULT_WEIGHT:
+		parts.append(f"poids {weight:g}")
+	return f" [{' · '.join(parts)}]" if parts else ""
+
+
+@prompt_group.command(name="tag", description="Définit les tags et/ou le poids de tirage d'un prompt")
+@app_commands.describe(
+	kind="Type de prompt",
+	prompt_id="ID d'un prompt personnalisé",
+	numero="Ou numéro (1..n) d'un prompt de base",
+	tags="Tags séparés par des virgules (\"-\" pour tout retirer)",
+	poids="Poids de tirage (1 = normal, 2 = deux fois plus souvent...)",
+)
+@app_commands.choices(kind=[app_commands.Choice(name="action", value="action"), app_commands.Choice(name="vérité", value="verite")])
+async def cfg_prompt_tag(
+	interaction: discord.Interaction,
+	kind: app_commands.Choice[str],
+	prompt_id: Optional[str] = None,
+	numero: Optional[int] = None,
+	tags: Optional[str] = None,
+	poids: Optional[float] = None,
+) -> None:
+	if not await _ensure_manager(interaction):
+		return
+	if (prompt_id is None) == (numero is None):
+		return await interaction.response.send_message("Indique soit `prompt_id`, soit `numero`.", ephemeral=True)
+	try:
+		tag_list = None if tags is None else ([] if tags.strip() == "-" else sampling.parse_tags(tags))
+		weight = None if poids is None else sampling.check_weight(poids)
+	except ValueError as e:
+		return await interaction.response.send_message(f"Valeur invalide: {e}.", ephemeral=True)
+	guild_id: int = interaction.guild_id  # type: ignore[assignment]
+	if prompt_id is not None:
+		if tag_list is None and weight is None:
+			prompt = next((p for p in await store.get_custom_prompts(guild_id, kind.value) if p.id == prompt_id), None)
+		else:
+			prompt = await store.set_custom_prompt_meta(guild_id, kind.value, prompt_id, tag_list, weight)
+		if prompt is None:
+			return await interaction.response.send_message("ID introuvable.", ephemeral=True)
+		label, current_tags, current_weight = f"`{prompt.id}`", prompt.tags, prompt.weight
+	else:
+		index = numero - 1  # type: ignore[operator]
+		base, base_tags = (ACTIONS, ACTION_TAGS) if kind.value == "action" else (VERITES, VERITE_TAGS)
+		if index < 0 or index >= len(base):
+			return await interaction.response.send_message("Numéro invalide.", ephemeral=True)
+		if tag_list is None and weight is None:
+			meta = await store.get_base_prompt_meta(guild_id, kind.value, index)
+		else:
+			meta = await store.set_base_prompt_meta(guild_id, kind.value, index, tag_list, weight)
+		label, current_weight = f"base n°{numero}", meta.weight
+		current_tags = list(base_tags.get(index, ())) + meta.tags
+	tags_text = ", ".join(current_tags) if current_tags else "aucun"
+	await interaction.response.send_message(f"{label} — tags: {tags_text} · poids: {current_weight:g}", ephemeral=True)
+
+
+@prompt_group.command(name="list-tags", description="Liste les tags utilisables pour filtrer les tirages")
+@app_commands.describe(kind="Type de prompt")
+@app_commands.choices(kind=[app_commands.Choice(name="action", value="action"), app_commands.Choice(name="vérité", value="verite")])
+async def cfg_prompt_list_tags(interaction: discord.Interaction, kind: app_commands.Choice[str]) -> None:
+	if not await _ensure_manager(interaction):
+		return
+	base, base_tags = (ACTIONS, ACTION_TAGS) if kind.value == "action" else (VERITES, VERITE_TAGS)
+	counts = await store.run(sampling.list_tags, interaction.guild_id, kind.value, base, base_tags)
+	if not counts:
+		return await interaction.response.send_message("Aucun tag.", ephemeral=True)
+	lines = [f"`{t}` — {n} prompt(s)" for t, n in sorted(counts.items(), key=lambda item: (-item[1], item[0]))]
+	await interaction.response.send_message("\n".join(lines)[:1900], ephemeral=True)
+
+
+@prompt_group.command(name="search", description="Cherche un prompt de base ou personnalisé par mots-clés")
+@app_commands.describe(requete="Mots à chercher (accents et majuscules ignorés)", kind="Limiter à un type de prompt")
+@app_commands.choices(kind=[app_commands.Choice(name="action", value="action"), app_commands.Choice(name="vérité", value="verite")])
+async def cfg_prompt_search(
+	interaction: discord.Interaction, requete: str, kind: Optional[app_commands.Choice[str]] = None
+) -> None:
+	if not await _ensure_manager(interaction):
+		return
+	kinds = (kind.value,) if kind else ("action", "verite")
+	results, total = await store.run(
+		search.search, interaction.guild_id, requete, {"action": ACTIONS, "verite": VERITES}, kinds
+	)
+	if not results:
+		return await interaction.response.send_message("Aucun prompt trouvé.", ephemeral=True)
+	lines = []
+	for r in results:
+		label = "action" if r.kind == "action" else "vérité"
+		ref = f"base n°{r.ref}" if r.source == "base" else f"perso `{r.ref}`"
+		lines.append(f"[{label}, {ref}] {r.text}")
+	more = f"\n… {total - len(results)} autre(s) résultat(s)" if total > len(results) else ""
+	await interaction.response.send_message("\n".join(lines)[:1900] + more, ephemeral=True)
+
+
+@prompt_group.command(name="duplicates", description="Liste les groupes de prompts personnalisés en double ou quasi identiques")
+@app_commands.describe(kind="Type de prompt")
+@app_commands.choices(kind=[app_commands.Choice(name="action", value="action"), app_commands.Choice(name="vérité", value="verite")])
+async def cfg_prompt_duplicates(interaction: discord.Interaction, kind: app_commands.Choice[str]) -> None:
+	if not await _ensure_manager(interaction):
+		return
+	base = ACTIONS if kind.value == "action" else VERITES
+	clusters = await store.run(dedup.duplicate_clusters, interaction.guild_id, kind.value, base)
+	if not clusters:
+		return await interaction.response.send_message("Aucun doublon trouvé.", ephemeral=True)
+	blocks = []
+	for n, cluster in enumerate(clusters, 1):
+		lines = [f"**Groupe {n}**"]
+		for d in cluster:
+			ref = f"base n°{d.ref}" if d.source == "base" else f"perso `{d.ref}`"
+			lines.append(f"[{ref}] {d.text}")
+		blocks.append("\n".join(lines))
+	text = "\n\n".join(blocks)
+	more = f"\n… {len(clusters)} groupe(s) au total" if len(text) > 1900 else ""
+	await interaction.response.send_message(text[:1900] + more, ephemeral=True)
+
+
+@prompt_group.command(name="import", description="Importe des prompts personnalisés depuis un fichier (JSON, CSV ou texte)")
+@app_commands.describe(kind="Type de prompt", fichier="Fichier .json, .csv ou .txt (un prompt par ligne)")
+@app_commands.choices(kind=[app_commands.Choice(name="action", value="action"), app_commands.Choice(name="vérité", value="verite")])
+async def cfg_prompt_import(interaction: discord.Interaction, kind: app_commands.Choice[str], fichier: discord.Attachment) -> None:
+	if not await _ensure_manager(interaction):
+		return
+	if fichier.size > prompt_io.MAX_IMPORT_BYTES:
+		return await interaction.response.send_message(
+			f"Fichier trop volumineux (max {prompt_io.MAX_IMPORT_BYTES // 1024} Ko).", ephemeral=True
+		)
+	await interaction.response.defer(ephemeral=True, thinking=True)
+	data = await fichier.read()
+	base = ACTIONS if kind.value == "action" else VERITES
+	fmt = prompt_io.detect_format(fichier.filename)
+	try:
+		report = await store.write(interaction.guild_id, prompt_io.import_prompts, kind.value, data, fmt, base)  # type: ignore[arg-type]
+	except prompt_io.ImportFormatError as e:
+		return await interaction.followup.send(f"Fichier illisible ({fmt}): {e}", ephemeral=True)
+	lines = [f"Importés: {len(report.added)}"]
+	if report.duplicates:
+		lines.append(f"Doublons ignorés: {report.duplicates}")
+	if report.invalid:
+		lines.append(f"Entrées invalides ignorées: {report.invalid}")
+	if report.disabled:
+		lines.append(f"Prompts de base désactivés: {report.disabled}")
+	if report.truncated:
+		lines.append(f"Limite de {prompt_io.MAX_IMPORT_PROMPTS} prompts atteinte, le reste a été ignoré.")
+	await interaction.followup.send("\n".join(lines), ephemeral=True)
+
+
+@prompt_group.command(name="export", description="Exporte les prompts personnalisés et les numéros désactivés")
+@app_commands.describe(kind="Type de prompt", fmt="Format du fichier")
+@app_commands.rename(fmt="format")
+@app_commands.choices(
+	kind=[app_commands.Choice(name="action", value="action"), app_commands.Choice(name="vérité", value="verite")],
+	fmt=[app_commands.Choice(name=f, value=f) for f in prompt_io.FORMATS],
+)
+async def cfg_prompt_export(
+	interaction: discord.Interaction, kind: app_commands.Choice[str], fmt: Optional[app_commands.Choice[str]] = None
+) -> None:
+	if not await _ensure_manager(interaction):
+		return
+	file_format = fmt.value if fmt else "json"
+	buffer = await store.run(prompt_io.export_prompts, interaction.guild_id, kind.value, file_format)
+	file = discord.File(buffer, filename=f"aouv-{kind.value}.{file_format}")
+	await interaction.response.send_message(file=file, ephemeral=True)
+
+
+@aouvconfig.command(name="sync", description="Resynchronise les commandes slash (propriétaire du bot)")
+@app_commands.describe(forcer="Synchroniser même si les commandes n'ont pas changé")
+async def cfg_sync(interaction: discord.Interaction, forcer: bool = False) -> None:
+	if not await bot.is_owner(interaction.user):  # type: ignore[arg-type]
+		return await interaction.response.send_message("Réservé au propriétaire du bot.", ephemeral=True)
+	await interaction.response.defer(ephemeral=True, thinking=True)
+	try:
+		count = await bot.sync_commands(force=forcer)
+	except discord.HTTPException as e:
+		return await interaction.followup.send(f"Échec de la synchronisation: {e}", ephemeral=True)
+	msg = "Commandes inchangées, rien à synchroniser." if count is None else f"Commandes synchronisées: {count}."
+	await interaction.followup.send(msg, ephemeral=True)
+
+
+@tree.command(name="aouvstats", description="Statistiques de fonctionnement du bot (administrateurs)")
+@app_commands.default_permissions(administrator=True)
+@app_commands.guild_only()
+async def aouvstats_cmd(interaction: discord.Interaction) -> None:
+	if not isinstance(interaction.user, discord.Member) or not interaction.user.guild_permissions.administrator:
+		return await interaction.response.send_message("Réservé aux administrateurs du serveur.", ephemeral=True)
+	await interaction.response.send_message(f"```\n{metrics.summary()[:1900]}\n```", ephemeral=True)
+
+
+@aouvconfig.command(name="profile", description="Profile le bot pendant quelques secondes (propriétaire du bot)")
+@app_commands.describe(secondes="Durée de l'échantillonnage")
+async def cfg_profile(interaction: discord.Interaction, secondes: app_commands.Range[int, 1, 300] = 30) -> None:
+	if not await bot.is_owner(interaction.user):  # type: ignore[arg-type]
+		return await interaction.response.send_message("Réservé au propriétaire du bot.", ephemeral=True)
+	if profiler.profiler.busy:
+		return await interaction.response.send_message("Un profil est déjà en cours.", ephemeral=True)
+	await interaction.response.defer(ephemeral=True, thinking=True)
+	path = await bot.profile(secondes)
+	if path is None:
+		return await interaction.followup.send("Échec du profilage, voir les logs.", ephemeral=True)
+	await interaction.followup.send(f"Profil écrit dans `{path}` (format « collapsed », pour flamegraph.pl ou speedscope).", ephemeral=True)
+
+
+@aouvconfig.command(name="stats", description="Prompts les plus tirés ou passés, tirages par salon")
+@app_commands.describe(vue="Classement à afficher", limite="Nombre de lignes")
+@app_commands.choices(
+	vue=[
+		app_commands.Choice(name="prompts les plus tirés", value="prompts"),
+		app_commands.Choice(name="prompts les plus passés", value="skipped"),
+		app_commands.Choice(name="tirages par salon", value="channels"),
+	]
+)
+async def cfg_stats(
+	interaction: discord.Interaction, vue: app_commands.Choice[str], limite: app_commands.Range[int, 1, 25] = 10
+) -> None:
+	if not await _ensure_manager(interaction):
+		return
+	stats = history.recorder.stats.get(interaction.guild_id or 0)
+	if stats is None or not stats.draws:
+		return await interaction.response.send_message("Aucun tirage enregistré pour ce serveur.", ephemeral=True)
+	lines = [f"Tirages enregistrés: {stats.draws}"]
+	if vue.value == "channels":
+		for channel_id, count in stats.channels.top(limite):
+			lines.append(f"<#{channel_id}> — {count}")
+	else:
+		top = (stats.prompts if vue.value == "prompts" else stats.skipped).top(limite)
+		if not top:
+			lines.append("Aucun prompt passé pour l'instant.")
+		for i, ((kind, text), count) in enumerate(top, start=1):
+			label = "Action" if kind == "action" else "Vérité"
+			short = text if len(text) <= 80 else text[:77] + "..."
+			lines.append(f"{i}. [{label}] {short} — {count}")
+	await interaction.response.send_message("\n".join(lines)[:1900], ephemeral=True)
+
+
+# ---- Shared prompt packs ----
+
+
+async def _pack_choices(current: str, pack_ids: Optional[Sequence[str]] = None) -> List[app_commands.Choice[str]]:
+	available = await store.run(storage.list_packs)
+	needle = current.lower()
+	choices = []
+	for pack in available:
+		if pack_ids is not None and pack.id not in pack_ids:
+			continue
+		if needle in pack.id or needle in pack.name.lower():
+			choices.append(app_commands.Choice(name=f"{pack.name} ({pack.id})"[:100], value=pack.id))
+	return choices[:25]
+
+
+async def _get_pack(interaction: discord.Interaction, pack_id: str) -> Optional[packs.Pack]:
+	pack = await store.run(storage.get_pack, pack_id)
+	if pack is None:
+		await interaction.response.send_message(f"Pack inconnu: `{pack_id}`.", ephemeral=True)
+	return pack
+
+
+async def _pack_prompt_index(interaction: discord.Interaction, pack_id: str, kind: str, numero: int) -> Optional[int]:
+	"""0-based index of prompt ``numero`` of a pack, or None (after replying) if invalid."""
+	pack = await _get_pack(interaction, pack_id)
+	if pack is None:
+		return None
+	if not 1 <= numero <= len(pack.prompts(kind)):
+		await interaction.response.send_message("Numéro invalide.", ephemeral=True)
+		return None
+	return numero - 1
+
+
+@pack_group.command(name="list", description="Liste les packs disponibles et ceux suivis par ce serveur")
+async def cfg_pack_list(interaction: discord.Interaction) -> None:
+	if not await _ensure_manager(interaction):
+		return
+	available = await store.run(storage.list_packs)
+	if not available:
+		return await interaction.response.send_message("Aucun pack disponible.", ephemeral=True)
+	subscribed = await store.run(storage.get_subscribed_packs, interaction.guild_id)
+	lines = []
+	for pack in available:
+		mark = "✅ " if pack.id in subscribed else ""
+		lines.append(f"{mark}`{pack.id}` — {pack.name} ({len(pack.actions)} actions, {len(pack.truths)} vérités)")
+	await interaction.response.send_message("\n".join(lines)[:1900], ephemeral=True)
+
+
+@pack_group.command(name="subscribe", description="Ajoute un pack partagé aux tirages du serveur")
+@app_commands.describe(pack="Identifiant du pack")
+async def cfg_pack_subscribe(interaction: discord.Interaction, pack: str) -> None:
+	if not await _ensure_manager(interaction):
+		return
+	if await _get_pack(interaction, pack) is None:
+		return
+	did = await store.write(interaction.guild_id, storage.subscribe_pack, pack)  # type: ignore[arg-type]
+	msg = f"Pack `{pack}` ajouté aux tirages (tag `{pack}`)." if did else "Ce pack est déjà suivi."
+	await interaction.response.send_message(msg, ephemeral=True)
+
+
+@pack_group.command(name="unsubscribe", description="Retire un pack partagé des tirages du serveur")
+@app_commands.describe(pack="Identifiant du pack")
+async def cfg_pack_unsubscribe(interaction: discord.Interaction, pack: str) -> None:
+	if not await _ensure_manager(interaction):
+		return
+	did = await store.write(interaction.guild_id, storage.unsubscribe_pack, pack)  # type: ignore[arg-type]
+	msg = f"Pack `{pack}` retiré." if did else "Ce pack n'était pas suivi."
+	await interaction.response.send_message(msg, ephemeral=True)
+
+
+@cfg_pack_unsubscribe.autocomplete("pack")
+async def cfg_pack_unsubscribe_autocomplete(interaction: discord.Interaction, current: str) -> List[app_commands.Choice[str]]:
+	subscribed = await store.run(storage.get_subscribed_packs, interaction.guild_id or 0)
+	return await _pack_choices(current, subscribed)
+
+
+@pack_group.command(name="view", description="Affiche les prompts d'un pack (20 par page)")
+@app_commands.describe(pack="Identifiant du pack", kind="Type de prompt", page="Page (>=1)")
+@app_commands.choices(kind=[app_commands.Choice(name="action", value="action"), app_commands.Choice(name="vérité", value="verite")])
+async def cfg_pack_view(interaction: discord.Interaction, pack: str, kind: app_commands.Choice[str], page: int = 1) -> None:
+	if not await _ensure_manager(interaction):
+		return
+	found = await _get_pack(interaction, pack)
+	if found is None:
+		return
+	hidden = set(await store.run(storage.list_hidden_pack_prompts, interaction.guild_id, kind.value, pack))
+	prompts = found.prompts(kind.value)
+	per = 20
+	start = (max(page, 1) - 1) * per
+	lines = [
+		f"{i + 1}. {'~~' + prompts[i] + '~~ (masqué)' if i in hidden else prompts[i]}"
+		for i in range(start, min(start + per, len(prompts)))
+	]
+	if not lines:
+		return await interaction.response.send_message("Page vide.", ephemeral=True)
+	await interaction.response.send_message("\n".join(lines)[:1900], ephemeral=True)
+
+
+@pack_group.command(name="hide", description="Masque un prompt d'un pack pour ce serveur")
+@app_commands.describe(pack="Identifiant du pack", kind="Type de prompt", numero="Numéro (1..n) dans le pack")
+@app_commands.choices(kind=[app_commands.Choice(name="action", value="action"), app_commands.Choice(name="vérité", value="verite")])
+async def cfg_pack_hide(interaction: discord.Interaction, pack: str, kind: app_commands.Choice[str], numero: int) -> None:
+	if not await _ensure_manager(interaction):
+		return
+	index = await _pack_prompt_index(interaction, pack, kind.value, numero)
+	if index is None:
+		return
+	did = await store.write(interaction.guild_id, storage.hide_pack_prompt, kind.value, pack, index)  # type: ignore[arg-type]
+	await interaction.response.send_message("Masqué." if did else "Déjà masqué.", ephemeral=True)
+
+
+@pack_group.command(name="unhide", description="Réaffiche un prompt masqué d'un pack")
+@app_commands.describe(pack="Identifiant du pack", kind="Type de prompt", numero="Numéro (1..n) dans le pack")
+@app_commands.choices(kind=[app_commands.Choice(name="action", value="action"), app_commands.Choice(name="vérité", value="verite")])
+async def cfg_pack_unhide(interaction: discord.Interaction, pack: str, kind: app_commands.Choice[str], numero: int) -> None:
+	if not await _ensure_manager(interaction):
+		return
+	index = await _pack_prompt_index(interaction, pack, kind.value, numero)
+	if index is None:
+		return
+	did = await store.write(interaction.guild_id, storage.show_pack_prompt, kind.value, pack, index)  # type: ignore[arg-type]
+	await interaction.response.send_message("Réaffiché." if did else "N'était pas masqué.", ephemeral=True)
+
+
+@pack_group.command(name="edit", description="Modifie un prompt d'un pack pour ce serveur seulement")
+@app_commands.describe(pack="Identifiant du pack", kind="Type de prompt", numero="Numéro (1..n) dans le pack", texte="Nouveau contenu")
+@app_commands.choices(kind=[app_commands.Choice(name="action", value="action"), app_commands.Choice(name="vérité", value="verite")])
+async def cfg_pack_edit(interaction: discord.Interaction, pack: str, kind: app_commands.Choice[str], numero: int, texte: str) -> None:
+	if not await _ensure_manager(interaction):
+		return
+	index = await _pack_prompt_index(interaction, pack, kind.value, numero)
+	if index is None:
+		return
+	pid = await store.write(interaction.guild_id, storage.edit_pack_prompt, kind.value, pack, index, texte)  # type: ignore[arg-type]
+	await interaction.response.send_message(
+		f"Copie personnalisée créée avec l'ID `{pid}` ; l'original est masqué pour ce serveur.", ephemeral=True
+	)
+
+
+@pack_group.command(name="import", description="Crée ou complète un pack partagé depuis un fichier (propriétaire du bot)")
+@app_commands.describe(
+	pack="Identifiant du pack (lettres, chiffres, - et _)",
+	kind="Type de prompt",
+	fichier="Fichier .json, .csv ou .txt (un prompt par ligne)",
+	nom="Nom affiché du pack",
+)
+@app_commands.choices(kind=[app_commands.Choice(name="action", value="action"), app_commands.Choice(name="vérité", value="verite")])
+async def cfg_pack_import(
+	interaction: discord.Interaction, pack: str, kind: app_commands.Choice[str], fichier: discord.Attachment, nom: Optional[str] = None
+) -> None:
+	if not await bot.is_owner(interaction.user):  # type: ignore[arg-type]
+		return await interaction.response.send_message("Réservé au propriétaire du bot.", ephemeral=True)
+	pack_id = sampling.normalize_tag(pack)
+	if not pack_id:
+		return await interaction.response.send_message("Identifiant de pack invalide.", ephemeral=True)
+	if fichier.size > prompt_io.MAX_IMPORT_BYTES:
+		return await interaction.response.send_message(
+			f"Fichier trop volumineux (max {prompt_io.MAX_IMPORT_BYTES // 1024} Ko).", ephemeral=True
+		)
+	await interaction.response.defer(ephemeral=True, thinking=True)
+	data = await fichier.read()
+	fmt = prompt_io.detect_format(fichier.filename)
+	try:
+		report = await store.run(prompt_io.import_pack, pack_id, kind.value, data, fmt, nom)
+	except prompt_io.ImportFormatError as e:
+		return await interaction.followup.send(f"Fichier illisible ({fmt}): {e}", ephemeral=True)
+	lines = [f"Pack `{pack_id}` : {len(report.added)} prompts ajoutés."]
+	if report.duplicates:
+		lines.append(f"Doublons ignorés: {report.duplicates}")
+	if report.invalid:
+		lines.append(f"Entrées invalides ignorées: {report.invalid}")
+	if report.dropped:
+		lines.append(f"Limite de {packs.MAX_PACK_PROMPTS} prompts par pack atteinte, {report.dropped} prompts non ajoutés.")
+	elif report.truncated:
+		lines.append(f"Limite de {prompt_io.MAX_IMPORT_PROMPTS} prompts atteinte, le reste a été ignoré.")
+	await interaction.followup.send("\n".join(lines), ephemeral=True)
+
+
+@cfg_pack_subscribe.autocomplete("pack")
+@cfg_pack_view.autocomplete("pack")
+@cfg_pack_hide.autocomplete("pack")
+@cfg_pack_unhide.autocomplete("pack")
+@cfg_pack_edit.autocomplete("pack")
+@cfg_pack_import.autocomplete("pack")
+async def cfg_pack_autocomplete(interaction: discord.Interaction, current: str) -> List[app_commands.Choice[str]]:
+	return await _pack_choices(current)
+
+
 aouvconfig.add_command(channel_group)
 aouvconfig.add_command(prompt_group)
+aouvconfig.add_command(pack_group)
 tree.add_command(aouvconfig)
 
 
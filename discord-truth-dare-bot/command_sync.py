@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""Fingerprints of the slash-command schema, to skip redundant syncs.
+
+``tree.sync()`` is a heavy, globally rate-limited API call. The serialized
+command tree is hashed and the hash of the last successful sync is kept per
+scope (application + global or guild) in ``data/command_sync.json``; the bot
+only syncs again when the hash changes or a sync is forced.
+"""
+import hashlib
+import json
+import os
+from typing import Any, Dict, Optional, Sequence
+
+import storage
+
+# Sync on startup even if the schema did not change.
+FORCE_SYNC = os.getenv("AOUV_FORCE_SYNC", "").lower() in ("1", "true", "yes", "on")
+# Development: register the commands on this guild only, instead of
+# globally (guild commands update instantly).
+DEV_GUILD_ID = int(os.getenv("AOUV_DEV_GUILD_ID") or 0) or None
+
+
+def fingerprint(payload: Sequence[Dict[str, Any]]) -> str:
+    """Stable hash of serialized commands (``[cmd.to_dict(tree), ...]``)."""
+    canonical = json.dumps(sorted(payload, key=lambda c: (c.get("type", 1), c["name"])), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def scope(application_id: Optional[int], guild_id: Optional[int] = None) -> str:
+    return f"{application_id}:{guild_id if guild_id else 'global'}"
+
+
+def state_path() -> str:
+    return os.path.join(storage.DATA_DIR, "command_sync.json")
+
+
+def _read_state(path: str) -> Dict[str, str]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def is_current(sync_scope: str, digest: str, path: Optional[str] = None) -> bool:
+    """True if the last successful sync of ``sync_scope`` had this fingerprint."""
+    return _read_state(path or state_path()).get(sync_scope) == digest
+
+
+def record(sync_scope: str, digest: str, path: Optional[str] = None) -> None:
+    """Remember a successful sync."""
+    path = path or state_path()
+    state = _read_state(path)
+    state[sync_scope] = digest
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_file = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_file, path)
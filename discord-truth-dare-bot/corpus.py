@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""Packed, memory-mapped prompt corpus.
+
+A corpus file holds named sections (e.g. "actions", "verites",
+"actions.soft"...). Each section is a table of uint32 offsets followed by the
+UTF-8 texts back to back, so prompt i is decoded in O(1) straight from the
+mapping and the file is shared through the page cache by every bot process.
+
+Layout (little endian):
+
+    b"AOUVCRP1"  u32 section_count
+    section_count x (u16 name_len, name, u32 count, u64 offsets_pos, u64 blob_pos)
+    per section: (count + 1) x u32 offsets (4-byte aligned), then the blob
+
+Build a corpus from prompts.py (plus optional extra sections, one prompt per
+line) with:
+
+    python corpus.py build -o data/corpus.bin --section actions.soft=soft.txt
+"""
+import argparse
+import mmap
+import os
+import struct
+import sys
+from array import array
+from typing import Dict, Iterable, Iterator, List, Mapping, Sequence, Tuple
+
+MAGIC = b"AOUVCRP1"
+_HEADER = struct.Struct("<8sI")
+_ENTRY_TAIL = struct.Struct("<IQQ")
+
+
+class PackedCorpus(Sequence[str]):
+    """Read-only sequence view over one section of a mapped corpus file."""
+
+    __slots__ = ("name", "_mm", "_offsets", "_blob_pos", "_count")
+
+    def __init__(self, name: str, mm: mmap.mmap, offsets_pos: int, blob_pos: int, count: int) -> None:
+        self.name = name
+        self._mm = mm
+        self._blob_pos = blob_pos
+        self._count = count
+        view = memoryview(mm)[offsets_pos:offsets_pos + 4 * (count + 1)]
+        if sys.byteorder == "little":
+            self._offsets: Sequence[int] = view.cast("I")
+        else:
+            offsets = array("I", view.tobytes())
+            offsets.byteswap()
+            self._offsets = offsets
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, i):  # type: ignore[override]
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self._count))]
+        if i < 0:
+            i += self._count
+        if not 0 <= i < self._count:
+            raise IndexError("corpus index out of range")
+        start = self._blob_pos + self._offsets[i]
+        end = self._blob_pos + self._offsets[i + 1]
+        return self._mm[start:end].decode("utf-8")
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(self._count):
+            yield self[i]
+
+    def __repr__(self) -> str:
+        return f"<PackedCorpus {self.name!r} ({self._count} prompts)>"
+
+
+def load_corpus(path: str) -> Dict[str, PackedCorpus]:
+    """Map a corpus file and return a view per section."""
+    with open(path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, section_count = _HEADER.unpack_from(mm, 0)
+    if magic != MAGIC:
+        raise ValueError(f"{path} n'est pas un corpus AouV")
+    sections: Dict[str, PackedCorpus] = {}
+    pos = _HEADER.size
+    for _ in range(section_count):
+        (name_len,) = struct.unpack_from("<H", mm, pos)
+        pos += 2
+        name = mm[pos:pos + name_len].decode("utf-8")
+        pos += name_len
+        count, offsets_pos, blob_pos = _ENTRY_TAIL.unpack_from(mm, pos)
+        pos += _ENTRY_TAIL.size
+        sections[name] = PackedCorpus(name, mm, offsets_pos, blob_pos, count)
+    return sections
+
+
+def compile_corpus(sections: Mapping[str, Iterable[str]], path: str) -> None:
+    """Write ``sections`` to ``path`` in the packed format (atomically)."""
+    packed: List[Tuple[bytes, array, bytes]] = []
+    for name, prompts in sections.items():
+        offsets = array("I", [0])
+        chunks = []
+        size = 0
+        for text in prompts:
+            data = text.encode("utf-8")
+            chunks.append(data)
+            size += len(data)
+            offsets.append(size)
+        if sys.byteorder != "little":
+            offsets.byteswap()
+        packed.append((name.encode("utf-8"), offsets, b"".join(chunks)))
+
+    header_size = _HEADER.size + sum(2 + len(name) + _ENTRY_TAIL.size for name, _, _ in packed)
+    entries = []
+    pos = header_size
+    for name, offsets, blob in packed:
+        pos += -pos % 4
+        offsets_pos = pos
+        pos += len(offsets) * 4
+        entries.append((name, len(offsets) - 1, offsets_pos, pos))
+        pos += len(blob)
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_file = path + ".tmp"
+    with open(tmp_file, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, len(packed)))
+        for name, count, offsets_pos, blob_pos in entries:
+            f.write(struct.pack("<H", len(name)) + name + _ENTRY_TAIL.pack(count, offsets_pos, blob_pos))
+        for (_, offsets, blob), (_, _, offsets_pos, _) in zip(packed, entries):
+            f.write(b"\0" * (offsets_pos - f.tell()))
+            f.write(offsets.tobytes())
+            f.write(blob)
+    os.replace(tmp_file, path)
+
+
+def _read_lines(path: str) -> Iterator[str]:
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                yield line
+
+
+def main(argv: Sequence[str]) -> None:
+    parser = argparse.ArgumentParser(description="Compile le corpus de prompts AouV.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="compile prompts.py (+ sections supplémentaires)")
+    build.add_argument("-o", "--output", default=os.path.join(os.path.dirname(__file__), "data", "corpus.bin"))
+    build.add_argument("--section", action="append", default=[], metavar="NOM=FICHIER",
+                       help="section supplémentaire, un prompt par ligne")
+    info = sub.add_parser("info", help="affiche les sections d'un corpus")
+    info.add_argument("path")
+    args = parser.parse_args(argv)
+
+    if args.command == "info":
+        for name, section in load_corpus(args.path).items():
+            print(f"{name}: {len(section)} prompts")
+        return
+
+    import prompts
+
+    sections: Dict[str, Iterable[str]] = {"actions": prompts.ACTIONS, "verites": prompts.VERITES}
+    for spec in args.section:
+        name, _, file = spec.partition("=")
+        if not name or not file:
+            parser.error(f"--section attend NOM=FICHIER, reçu {spec!r}")
+        sections[name] = _read_lines(file)
+    compile_corpus(sections, args.output)
+    print(f"Corpus écrit dans {args.output}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
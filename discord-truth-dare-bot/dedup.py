@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""Near-duplicate detection for prompts.
+
+Each prompt gets an exact key (accent-folded words) and a MinHash signature
+over its character trigrams. Signatures are split into LSH bands, so looking
+up the prompts similar to a new text only touches the handful sharing a band
+bucket instead of comparing against every prompt. The base corpus index is
+built once per base list; guild indexes follow storage commits (see
+prompt_index.py).
+"""
+import os
+import random
+from array import array
+from typing import Dict, Hashable, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+import storage
+from prompt_index import IndexCache
+from search import tokenize
+
+NUM_PERM = 24
+BANDS = 6
+ROWS = NUM_PERM // BANDS
+SHINGLE = 3
+# Estimated Jaccard similarity from which two prompts count as near duplicates.
+THRESHOLD = float(os.getenv("AOUV_DUPLICATE_THRESHOLD", "0.75"))
+DEDUP_CACHE_SIZE = int(os.getenv("AOUV_DEDUP_CACHE_SIZE", "256"))
+
+_MASKS = [random.Random(0xA0B1 + i).getrandbits(32) for i in range(NUM_PERM)]
+
+
+def exact_key(text: str) -> str:
+    return " ".join(tokenize(text))
+
+
+def signature(key: str) -> bytes:
+    """MinHash signature (NUM_PERM x uint32) of the trigrams of ``key``."""
+    if len(key) <= SHINGLE:
+        shingles = {key}
+    else:
+        shingles = {key[i:i + SHINGLE] for i in range(len(key) - SHINGLE + 1)}
+    hashes = [hash(s) & 0xFFFFFFFF for s in shingles]
+    return array("I", [min(h ^ m for h in hashes) for m in _MASKS]).tobytes()
+
+
+def similarity(sig_a: bytes, sig_b: bytes) -> float:
+    a, b = array("I", sig_a), array("I", sig_b)
+    return sum(x == y for x, y in zip(a, b)) / NUM_PERM
+
+
+def _bands(sig: bytes) -> List[Tuple[int, bytes]]:
+    width = ROWS * 4
+    return [(band, sig[band * width:(band + 1) * width]) for band in range(BANDS)]
+
+
+class Match(NamedTuple):
+    ref: Hashable
+    similarity: float  # 1.0 for an exact (normalized) duplicate
+
+
+class SimilarityIndex:
+    def __init__(self) -> None:
+        self._exact: Dict[str, Set[Hashable]] = {}
+        self._buckets: Dict[Tuple[int, bytes], Set[Hashable]] = {}
+        self._entries: Dict[Hashable, Tuple[str, bytes]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, ref: Hashable, text: str) -> None:
+        self.remove(ref)
+        key = exact_key(text)
+        sig = signature(key)
+        self._entries[ref] = (key, sig)
+        self._exact.setdefault(key, set()).add(ref)
+        for band in _bands(sig):
+            self._buckets.setdefault(band, set()).add(ref)
+
+    def remove(self, ref: Hashable) -> None:
+        entry = self._entries.pop(ref, None)
+        if entry is None:
+            return
+        key, sig = entry
+        self._exact[key].discard(ref)
+        if not self._exact[key]:
+            del self._exact[key]
+        for band in _bands(sig):
+            bucket = self._buckets[band]
+            bucket.discard(ref)
+            if not bucket:
+                del self._buckets[band]
+
+    def query(self, text: str, exclude: Optional[Hashable] = None) -> List[Match]:
+        key = exact_key(text)
+        return self.query_signature(key, signature(key), exclude)
+
+    def query_signature(self, key: str, sig: bytes, exclude: Optional[Hashable] = None) -> List[Match]:
+        if not key:
+            return []
+        matches = {ref: 1.0 for ref in self._exact.get(key, ()) if ref != exclude}
+        for band in _bands(sig):
+            for ref in self._buckets.get(band, ()):
+                if ref == exclude or ref in matches:
+                    continue
+                score = similarity(sig, self._entries[ref][1])
+                if score >= THRESHOLD:
+                    matches[ref] = score
+        return sorted((Match(ref, score) for ref, score in matches.items()), key=lambda m: -m.similarity)
+
+
+_indexes: IndexCache[SimilarityIndex] = IndexCache("dedup", SimilarityIndex, DEDUP_CACHE_SIZE)
+
+
+class Duplicate(NamedTuple):
+    source: str  # "base" or "custom"
+    ref: object  # 1-based number for base prompts, prompt id for custom ones
+    text: str
+    similarity: float
+
+
+def find_duplicates(
+    guild_id: int, kind: str, text: str, base: Sequence[str], exclude_id: Optional[str] = None
+) -> List[Duplicate]:
+    """Base and custom prompts of ``kind`` that are (near) duplicates of ``text``."""
+    with _indexes.lock:
+        base_matches = _indexes.base(base).query(text)
+        custom_matches = _indexes.custom(guild_id, kind).query(text, exclude=exclude_id)
+    result = [Duplicate("base", int(m.ref) + 1, base[m.ref], m.similarity) for m in base_matches]  # type: ignore[call-overload, index]
+    if custom_matches:
+        texts = dict(storage.list_custom_prompts(guild_id, kind))
+        result += [Duplicate("custom", m.ref, texts[m.ref], m.similarity) for m in custom_matches if m.ref in texts]  # type: ignore[index]
+    result.sort(key=lambda d: -d.similarity)
+    return result
+
+
+def checker(guild_id: int, kind: str, base: Sequence[str]) -> "DuplicateChecker":
+    with _indexes.lock:
+        return DuplicateChecker(_indexes.base(base), _indexes.custom(guild_id, kind))
+
+
+class DuplicateChecker:
+    """Checks a stream of new texts against base, existing custom and earlier texts."""
+
+    def __init__(self, base_index: SimilarityIndex, custom_index: SimilarityIndex) -> None:
+        self._indexes = (base_index, custom_index)
+        self._batch = SimilarityIndex()
+
+    def is_duplicate(self, text: str) -> bool:
+        key = exact_key(text)
+        sig = signature(key)
+        with _indexes.lock:
+            if any(index.query_signature(key, sig) for index in self._indexes):
+                return True
+        return bool(self._batch.query_signature(key, sig))
+
+    def add(self, ref: Hashable, text: str) -> None:
+        self._batch.add(ref, text)
+
+
+def duplicate_clusters(guild_id: int, kind: str, base: Sequence[str]) -> List[List[Duplicate]]:
+    """Groups of custom prompts that duplicate each other or a base prompt.
+
+    ``similarity`` is, for each member, its best score against another member.
+    """
+    texts = dict(storage.list_custom_prompts(guild_id, kind))
+    parent: Dict[Tuple[str, Hashable], Tuple[str, Hashable]] = {}
+    best: Dict[Tuple[str, Hashable], float] = {}
+
+    def find(node: Tuple[str, Hashable]) -> Tuple[str, Hashable]:
+        root = node
+        while parent[root] != root:
+            root = parent[root]
+        while parent[node] != root:
+            parent[node], node = root, parent[node]
+        return root
+
+    def link(a: Tuple[str, Hashable], b: Tuple[str, Hashable], score: float) -> None:
+        for node in (a, b):
+            parent.setdefault(node, node)
+            best[node] = max(best.get(node, 0.0), score)
+        root_a, root_b = find(a), find(b)
+        if root_a != root_b:
+            parent[root_a] = root_b
+
+    with _indexes.lock:
+        base_index = _indexes.base(base)
+        custom_index = _indexes.custom(guild_id, kind)
+        for pid, text in texts.items():
+            key = exact_key(text)
+            sig = signature(key)
+            for m in custom_index.query_signature(key, sig, exclude=pid):
+                link(("custom", pid), ("custom", m.ref), m.similarity)
+            for m in base_index.query_signature(key, sig):
+                link(("custom", pid), ("base", m.ref), m.similarity)
+
+    groups: Dict[Tuple[str, Hashable], List[Duplicate]] = {}
+    for node in parent:
+        source, ref = node
+        if source == "base":
+            dup = Duplicate("base", int(ref) + 1, base[ref], best[node])  # type: ignore[call-overload, index]
+        elif ref in texts:
+            dup = Duplicate("custom", ref, texts[ref], best[node])  # type: ignore[index]
+        else:
+            continue
+        groups.setdefault(find(node), []).append(dup)
+    return [
+        sorted(group, key=lambda d: (d.source, str(d.ref)))
+        for group in groups.values()
+        if len(group) > 1
+    ]
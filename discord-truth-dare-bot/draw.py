@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+"""No-repeat "shuffle bag" draws per (guild, channel, kind).
+
+Each bag is an array of indices into the combined pool plus a cursor:
+``order[:cursor]`` were already drawn this round, ``order[cursor:]`` remain.
+A draw picks a random remaining slot and swaps it to the cursor (one step of
+a lazy Fisher-Yates shuffle), so nothing repeats until the pool is exhausted
+and no upfront shuffle is needed. When the pool changes the bag is remapped
+in place instead of being reshuffled.
+
+Each round starts from the identity order and draws from a small per-bag
+generator seeded at the start of the round, so a bag is fully described by
+(seed, cursor, pool fingerprint): that is all the state file holds, and the
+order is replayed when the bag is restored. Only bags remapped mid-round
+(their order no longer follows from a seed) are saved with their order.
+"""
+import base64
+import json
+import os
+import random
+import time
+import zlib
+from array import array
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import storage
+
+BAG_IDLE_TTL = float(os.getenv("AOUV_BAG_IDLE_TTL", "3600"))
+# Parked (evicted or restored but unused) bags are forgotten after this many
+# seconds, and only the most recently parked PARKED_MAX_BAGS are kept.
+PARKED_TTL = float(os.getenv("AOUV_BAG_PARKED_TTL", str(7 * 24 * 3600)))
+PARKED_MAX_BAGS = int(os.getenv("AOUV_BAG_PARKED_MAX", "100000"))
+
+BagKey = Tuple[int, int, str]
+
+_MASK64 = (1 << 64) - 1
+
+
+def _typecode(size: int) -> str:
+    return "H" if size < 0x10000 else "I"
+
+
+def _pool_checksum(pool: Sequence[str]) -> int:
+    crc = 0
+    for text in pool:
+        crc = zlib.crc32(text.encode("utf-8"), crc)
+    return crc
+
+
+class ShuffleBag:
+    __slots__ = ("order", "cursor", "pool", "last_used", "seed", "avoid", "state")
+
+    def __init__(self, pool: Sequence[str], seed: Optional[int], cursor: int = 0, avoid: int = -1) -> None:
+        self.pool = pool
+        self.order = array(_typecode(len(pool)), range(len(pool)))
+        self.cursor = 0
+        # Seed of the current round; None once the order was remapped.
+        self.seed = seed
+        # Pool index kept out of the first pick of the round (-1: none).
+        self.avoid = avoid
+        self.state = seed or 1
+        self.last_used = time.monotonic()
+        for _ in range(cursor):
+            self._step()
+
+    @classmethod
+    def fresh(cls, pool: Sequence[str], rng: random.Random) -> "ShuffleBag":
+        return cls(pool, rng.getrandbits(64) | 1)
+
+    @classmethod
+    def from_order(cls, pool: Sequence[str], order: array, cursor: int, rng: random.Random) -> "ShuffleBag":
+        """A bag whose order does not follow from a seed (remapped mid-round)."""
+        bag = cls(pool, None)
+        bag.order = order
+        bag.cursor = cursor
+        bag.state = rng.getrandbits(64) | 1
+        return bag
+
+    def _next(self, bound: int) -> int:
+        # xorshift64: one int of state per bag, replayable from the seed.
+        x = self.state
+        x ^= (x << 13) & _MASK64
+        x ^= x >> 7
+        x ^= (x << 17) & _MASK64
+        self.state = x
+        return x % bound
+
+    def _step(self) -> int:
+        order = self.order
+        n = len(order)
+        start = self.cursor
+        if start == 0 and 0 <= self.avoid < n and n > 1:
+            # The round starts from the identity order, so the prompt to
+            # avoid sits at position ``avoid``.
+            j = self._next(n - 1)
+            if j >= self.avoid:
+                j += 1
+        else:
+            j = start + self._next(n - start)
+        order[start], order[j] = order[j], order[start]
+        self.cursor = start + 1
+        return order[start]
+
+    def draw(self, rng: random.Random) -> int:
+        n = len(self.order)
+        if self.cursor >= n:
+            # New round: keep the last prompt of the previous round out of
+            # the first pick so it does not come up twice in a row.
+            last = self.order[n - 1] if n > 1 else -1
+            self.seed = rng.getrandbits(64) | 1
+            self.state = self.seed
+            self.avoid = last
+            self.order = array(_typecode(n), range(n))
+            self.cursor = 0
+        self.last_used = time.monotonic()
+        return self._step()
+
+    def remap(self, pool: Sequence[str]) -> None:
+        """Follow a pool change: keep drawn/remaining state, add new prompts as remaining."""
+        old_pool = self.pool
+        positions: Dict[str, List[int]] = {}
+        for i, text in enumerate(pool):
+            positions.setdefault(text, []).append(i)
+        drawn: List[int] = []
+        remaining: List[int] = []
+        for pos, old_index in enumerate(self.order):
+            if old_index >= len(old_pool):
+                continue
+            candidates = positions.get(old_pool[old_index])
+            if candidates:
+                (drawn if pos < self.cursor else remaining).append(candidates.pop())
+        added = [i for candidates in positions.values() for i in candidates]
+        self.order = array(_typecode(len(pool)), drawn + remaining + added)
+        self.cursor = len(drawn)
+        self.pool = pool
+        self.seed = None
+
+
+class ParkedBag(NamedTuple):
+    """An evicted or not-yet-restored bag, without its order when it has a seed.
+
+    Bags parked by this process keep a reference to their pool; bags read
+    from the state file only have its size and checksum.
+    """
+
+    cursor: int
+    seed: Optional[int]
+    avoid: int
+    order: Optional[array]
+    pool: Optional[Sequence[str]]
+    size: int
+    checksum: Optional[int]
+    parked_at: float
+
+
+class DrawEngine:
+    def __init__(self, idle_ttl: float = BAG_IDLE_TTL, rng: Optional[random.Random] = None) -> None:
+        self.idle_ttl = idle_ttl
+        self.rng = rng or random.Random()
+        self._bags: Dict[BagKey, ShuffleBag] = {}
+        # Oldest first, so the LRU bound drops from the front.
+        self._parked: Dict[str, ParkedBag] = {}
+        # id(pool) -> (pool, checksum), for bags restored from the state file.
+        self._checksums: Dict[int, Tuple[Sequence[str], int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._bags)
+
+    def draw(self, guild_id: int, channel_id: int, kind: str, pool: Sequence[str]) -> Optional[str]:
+        """Draw a prompt from ``pool`` without repeats for this guild/channel/kind."""
+        if not pool:
+            return None
+        key = (guild_id, channel_id, kind)
+        bag = self._bags.get(key)
+        if bag is None:
+            bag = self._unpark(key, pool) or ShuffleBag.fresh(pool, self.rng)
+            self._bags[key] = bag
+        elif bag.pool is not pool:
+            if len(bag.pool) != len(pool) or bag.pool != pool:
+                bag.remap(pool)
+            bag.pool = pool
+        return pool[bag.draw(self.rng)]
+
+    # ---- Eviction and persistence ----
+
+    @staticmethod
+    def _key_str(key: BagKey) -> str:
+        return f"{key[0]}:{key[1]}:{key[2]}"
+
+    def _checksum(self, pool: Sequence[str]) -> int:
+        entry = self._checksums.get(id(pool))
+        if entry is None or entry[0] is not pool:
+            entry = self._checksums[id(pool)] = (pool, _pool_checksum(pool))
+        return entry[1]
+
+    @staticmethod
+    def _park(bag: ShuffleBag) -> ParkedBag:
+        order = bag.order if bag.seed is None else None
+        return ParkedBag(bag.cursor, bag.seed, bag.avoid, order, bag.pool, len(bag.pool), None, time.time())
+
+    def _unpark(self, key: BagKey, pool: Sequence[str]) -> Optional[ShuffleBag]:
+        parked = self._parked.pop(self._key_str(key), None)
+        if parked is None:
+            return None
+        if parked.pool is not None:
+            same = parked.pool is pool or (len(parked.pool) == len(pool) and parked.pool == pool)
+        else:
+            same = parked.size == len(pool) and parked.checksum == self._checksum(pool)
+        if not same or parked.cursor > len(pool):
+            # The pool changed while the bag was parked; start a fresh round.
+            return None
+        if parked.order is not None:
+            if len(parked.order) != len(pool):
+                return None
+            return ShuffleBag.from_order(pool, parked.order, parked.cursor, self.rng)
+        return ShuffleBag(pool, parked.seed, parked.cursor, parked.avoid)
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """Park bags idle for longer than ``idle_ttl`` and forget old parked ones.
+
+        Returns how many bags were evicted.
+        """
+        now = time.monotonic() if now is None else now
+        idle = [key for key, bag in self._bags.items() if now - bag.last_used > self.idle_ttl]
+        for key in idle:
+            self._parked[self._key_str(key)] = self._park(self._bags.pop(key))
+        expired_before = time.time() - PARKED_TTL
+        stale = [k for k, parked in self._parked.items() if parked.parked_at < expired_before]
+        for k in stale:
+            del self._parked[k]
+        excess = len(self._parked) - PARKED_MAX_BAGS
+        if excess > 0:
+            for k in list(self._parked)[:excess]:
+                del self._parked[k]
+        self._checksums.clear()
+        return len(idle)
+
+    def snapshot(self) -> List[Tuple[str, ParkedBag]]:
+        """Every bag (parked and live) in parked form. O(bags): call from the
+        thread that draws, then hand the result to ``dumps_snapshot`` elsewhere.
+        """
+        state = list(self._parked.items())
+        for key, bag in self._bags.items():
+            parked = self._park(bag)
+            if parked.order is not None:
+                # Live bags keep drawing while the snapshot is serialized.
+                parked = parked._replace(order=array(parked.order.typecode, parked.order))
+            state.append((self._key_str(key), parked))
+        return state
+
+    def dumps(self) -> str:
+        """Serialize every bag. Call from the thread that draws."""
+        return dumps_snapshot(self.snapshot())
+
+    def load(self, path: str) -> None:
+        if not os.path.exists(path):
+            return
+        with open(path, "r", encoding="utf-8") as f:
+            raw = json.load(f)
+        now = time.time()
+        for key, packed in raw.items():
+            if len(packed) == 4:
+                # Older format: [cursor, size, checksum, order], always explicit.
+                cursor, size, checksum, data = packed
+                seed, avoid, parked_at = None, -1, now
+            else:
+                cursor, size, checksum, seed, avoid, data, parked_at = packed
+            order = None
+            if seed is None:
+                order = array(_typecode(size))
+                order.frombytes(base64.b64decode(data))
+            self._parked[key] = ParkedBag(cursor, seed, avoid, order, None, size, checksum, parked_at)
+
+
+def dumps_snapshot(snapshot: List[Tuple[str, ParkedBag]]) -> str:
+    """JSON for a ``DrawEngine.snapshot``; safe to run outside the drawing thread."""
+    checksums: Dict[int, int] = {}
+    state = {}
+    for key, parked in snapshot:
+        checksum = parked.checksum
+        if checksum is None:
+            assert parked.pool is not None
+            checksum = checksums.get(id(parked.pool))
+            if checksum is None:
+                # Bags of the same guild and kind share their pool: one pass each.
+                checksum = checksums[id(parked.pool)] = _pool_checksum(parked.pool)
+        data = "" if parked.order is None else base64.b64encode(parked.order.tobytes()).decode("ascii")
+        state[key] = [parked.cursor, parked.size, checksum, parked.seed, parked.avoid, data, round(parked.parked_at)]
+    return json.dumps(state, separators=(",", ":"))
+
+
+def state_path(suffix: str = "") -> str:
+    """Bag state file; ``suffix`` keeps shard processes from sharing one."""
+    return os.path.join(storage.DATA_DIR, f"draw_bags{suffix}.json")
+
+
+def write_state(data: str, path: Optional[str] = None) -> None:
+    path = path or state_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_file = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        f.write(data)
+    os.replace(tmp_file, path)
+
+
+def save_snapshot(snapshot: List[Tuple[str, ParkedBag]], path: Optional[str] = None) -> None:
+    """Serialize and write a ``DrawEngine.snapshot`` (meant for the storage threads)."""
+    write_state(dumps_snapshot(snapshot), path)
+
+
+engine = DrawEngine()
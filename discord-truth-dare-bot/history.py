@@ -0,0 +1,370 @@
+# -*- coding: utf-8 -*-
+"""Draw history: a ring buffer of events, daily binary files and top-k counters.
+
+Events (draws, skips, base prompts disabled/enabled) are recorded on the
+event loop into a bounded ring buffer of fixed-size records; nothing touches
+the disk on the draw path. A periodic flush drains the buffer into
+append-only daily files (``data/history/draws-YYYYMMDD.bin``), one write per
+batch. Each guild also keeps incremental Stream-Summary counters (Metwally
+et al.'s Space-Saving) for its prompts and channels: memory is bounded per
+guild and the k most frequent entries come out in O(k), without scanning
+the history. Each flush re-encodes only the counters that changed.
+
+A draw counts as a skip of the previous prompt when the same user draws the
+same kind again in the same channel within ``SKIP_WINDOW`` seconds.
+"""
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Dict, Hashable, Iterator, List, Optional, Set, Tuple
+
+import storage
+
+HISTORY_BUFFER = int(os.getenv("AOUV_HISTORY_BUFFER", "65536"))
+HISTORY_FLUSH_INTERVAL = float(os.getenv("AOUV_HISTORY_FLUSH_INTERVAL", "60"))
+SKIP_WINDOW = float(os.getenv("AOUV_HISTORY_SKIP_WINDOW", "30"))
+# Entries monitored per guild counter; the top-k is exact for frequent items.
+SUMMARY_CAPACITY = int(os.getenv("AOUV_HISTORY_TOP_CAPACITY", "128"))
+LAST_DRAWS_SIZE = 8192
+
+EVENT_DRAW = 0
+EVENT_SKIP = 1
+EVENT_DISABLE = 2
+EVENT_ENABLE = 3
+EVENT_NAMES = {EVENT_DRAW: "draw", EVENT_SKIP: "skip", EVENT_DISABLE: "disable", EVENT_ENABLE: "enable"}
+KIND_CODES = {"action": 0, "verite": 1}
+KIND_NAMES = {code: kind for kind, code in KIND_CODES.items()}
+
+FILE_MAGIC = b"AOUVHIS1"
+# timestamp, guild, channel, user, event, kind, crc32 of the prompt text
+RECORD = struct.Struct("<dQQQBBI")
+
+PromptKey = Tuple[str, str]  # (kind, text)
+
+
+class _Bucket:
+    __slots__ = ("count", "items", "prev", "next")
+
+    def __init__(self, count: int) -> None:
+        self.count = count
+        # Insertion-ordered set of the keys with this count.
+        self.items: Dict[Hashable, None] = {}
+        self.prev: Optional["_Bucket"] = None
+        self.next: Optional["_Bucket"] = None
+
+
+class StreamSummary:
+    """Space-Saving counters over at most ``capacity`` keys.
+
+    Buckets of equal counts form a doubly linked list sorted by count, so an
+    increment moves one key to the neighbouring bucket (O(1)) and ``top(k)``
+    walks k keys from the largest bucket. Once full, a new key replaces one
+    of the least counted and inherits its count (an overestimate bounded by
+    ``error``).
+    """
+
+    __slots__ = ("capacity", "_where", "_errors", "_min", "_max")
+
+    def __init__(self, capacity: int = SUMMARY_CAPACITY) -> None:
+        self.capacity = capacity
+        self._where: Dict[Hashable, _Bucket] = {}
+        self._errors: Dict[Hashable, int] = {}
+        self._min: Optional[_Bucket] = None
+        self._max: Optional[_Bucket] = None
+
+    def __len__(self) -> int:
+        return len(self._where)
+
+    def _bucket_after(self, bucket: Optional[_Bucket], count: int) -> _Bucket:
+        """Bucket for ``count`` right after ``bucket`` (None: at the head), created if needed."""
+        nxt = bucket.next if bucket is not None else self._min
+        if nxt is not None and nxt.count == count:
+            return nxt
+        new = _Bucket(count)
+        new.prev, new.next = bucket, nxt
+        if bucket is not None:
+            bucket.next = new
+        else:
+            self._min = new
+        if nxt is not None:
+            nxt.prev = new
+        else:
+            self._max = new
+        return new
+
+    def _unlink_if_empty(self, bucket: _Bucket) -> None:
+        if bucket.items:
+            return
+        if bucket.prev is not None:
+            bucket.prev.next = bucket.next
+        else:
+            self._min = bucket.next
+        if bucket.next is not None:
+            bucket.next.prev = bucket.prev
+        else:
+            self._max = bucket.prev
+
+    def add(self, key: Hashable, amount: int = 1) -> None:
+        bucket = self._where.get(key)
+        if bucket is None:
+            if len(self._where) < self.capacity:
+                base: Optional[_Bucket] = None
+                count = amount
+                error = 0
+            else:
+                # Replace the oldest of the least counted keys.
+                base = self._min
+                assert base is not None
+                victim = next(iter(base.items))
+                del base.items[victim], self._where[victim]
+                self._errors.pop(victim, None)
+                count = base.count + amount
+                error = base.count
+            target = self._insert_from(base, count)
+            if error:
+                self._errors[key] = error
+            if base is not None:
+                self._unlink_if_empty(base)
+        else:
+            del bucket.items[key]
+            target = self._insert_from(bucket, bucket.count + amount)
+            self._unlink_if_empty(bucket)
+        target.items[key] = None
+        self._where[key] = target
+
+    def _insert_from(self, start: Optional[_Bucket], count: int) -> _Bucket:
+        # Walk forward from ``start`` (increments of 1 never walk).
+        bucket = start
+        while True:
+            nxt = bucket.next if bucket is not None else self._min
+            if nxt is None or nxt.count > count:
+                break
+            if nxt.count == count:
+                return nxt
+            bucket = nxt
+        if bucket is not None and bucket.count == count:
+            return bucket
+        return self._bucket_after(bucket, count)
+
+    def count(self, key: Hashable) -> int:
+        bucket = self._where.get(key)
+        return bucket.count if bucket is not None else 0
+
+    def top(self, k: int) -> List[Tuple[Hashable, int]]:
+        """The ``k`` most counted keys with their (possibly overestimated) counts."""
+        result: List[Tuple[Hashable, int]] = []
+        bucket = self._max
+        while bucket is not None and len(result) < k:
+            for key in reversed(bucket.items):
+                result.append((key, bucket.count))
+                if len(result) == k:
+                    break
+            bucket = bucket.prev
+        return result
+
+    def dump(self) -> List[list]:
+        return [[key, count, self._errors.get(key, 0)] for key, count in self.top(len(self._where))]
+
+    @classmethod
+    def restore(cls, entries: List[list], capacity: int = SUMMARY_CAPACITY) -> "StreamSummary":
+        """Inverse of ``dump``: rebuilds the buckets in one pass over the sorted entries."""
+        summary = cls(capacity)
+        bucket: Optional[_Bucket] = None
+        # ``dump`` lists counts in decreasing order, newest key first within a
+        # count: reversed, keys come back oldest first (stable sort).
+        for key, count, error in sorted(reversed(entries[:capacity]), key=lambda e: e[1]):
+            key = tuple(key) if isinstance(key, list) else key
+            if key in summary._where:
+                continue
+            if bucket is None or bucket.count != count:
+                bucket = summary._bucket_after(bucket, count)
+            bucket.items[key] = None
+            summary._where[key] = bucket
+            if error:
+                summary._errors[key] = error
+        return summary
+
+
+class GuildStats:
+    __slots__ = ("draws", "prompts", "skipped", "channels")
+
+    def __init__(self) -> None:
+        self.draws = 0
+        self.prompts = StreamSummary()
+        self.skipped = StreamSummary()
+        self.channels = StreamSummary()
+
+
+class DrawRecorder:
+    def __init__(self, capacity: int = HISTORY_BUFFER) -> None:
+        self.capacity = capacity
+        self._buffer = bytearray(capacity * RECORD.size)
+        self._start = 0  # index of the oldest record
+        self._size = 0
+        self.dropped = 0
+        self.stats: Dict[int, GuildStats] = {}
+        # (guild, channel, user) -> (time, kind, text) of the last draw, for skips.
+        self._last: "OrderedDict[Tuple[int, int, int], Tuple[float, str, str]]" = OrderedDict()
+        self.dirty = False
+        # Guilds whose counters changed since the last ``stats_changes``.
+        self._changed: Set[int] = set()
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _append(self, now: float, guild_id: int, channel_id: int, user_id: int, event: int, kind: str, text: str) -> None:
+        if self._size == self.capacity:
+            # Full before a flush could run: the oldest record is lost.
+            self._start = (self._start + 1) % self.capacity
+            self._size -= 1
+            self.dropped += 1
+        slot = (self._start + self._size) % self.capacity
+        crc = zlib.crc32(text.encode("utf-8")) if text else 0
+        RECORD.pack_into(self._buffer, slot * RECORD.size, now, guild_id, channel_id, user_id, event, KIND_CODES.get(kind, 255), crc)
+        self._size += 1
+        self.dirty = True
+
+    def _guild(self, guild_id: int) -> GuildStats:
+        stats = self.stats.get(guild_id)
+        if stats is None:
+            stats = self.stats[guild_id] = GuildStats()
+        return stats
+
+    def record_draw(self, guild_id: int, channel_id: int, user_id: int, kind: str, text: str) -> None:
+        now = time.time()
+        stats = self._guild(guild_id)
+        key = (guild_id, channel_id, user_id)
+        last = self._last.pop(key, None)
+        if last is not None and last[1] == kind and now - last[0] <= SKIP_WINDOW:
+            self._append(now, guild_id, channel_id, user_id, EVENT_SKIP, kind, last[2])
+            stats.skipped.add((kind, last[2]))
+        self._last[key] = (now, kind, text)
+        if len(self._last) > LAST_DRAWS_SIZE:
+            self._last.popitem(last=False)
+        self._append(now, guild_id, channel_id, user_id, EVENT_DRAW, kind, text)
+        stats.draws += 1
+        stats.prompts.add((kind, text))
+        stats.channels.add(channel_id)
+        self._changed.add(guild_id)
+
+    def record_base_toggle(self, guild_id: int, user_id: int, kind: str, text: str, disabled: bool) -> None:
+        self._append(time.time(), guild_id, 0, user_id, EVENT_DISABLE if disabled else EVENT_ENABLE, kind, text)
+
+    def drain(self) -> bytes:
+        """Take every buffered record (oldest first) as one contiguous block."""
+        size = RECORD.size
+        start, end = self._start * size, (self._start + self._size) * size
+        if end <= len(self._buffer):
+            data = bytes(self._buffer[start:end])
+        else:
+            data = bytes(self._buffer[start:]) + bytes(self._buffer[:end - len(self._buffer)])
+        self._start = self._size = 0
+        self.dirty = bool(self._changed)
+        return data
+
+    def stats_changes(self) -> Dict[int, str]:
+        """Encoded counters of the guilds changed since the last call.
+
+        Call from the event loop; costs O(changed guilds). Hand the result to
+        ``write_stats``.
+        """
+        changes = {gid: _encode_stats(self.stats[gid]) for gid in self._changed}
+        self._changed.clear()
+        self.dirty = self._size > 0
+        return changes
+
+    def load_stats(self, path: str) -> None:
+        if not os.path.exists(path):
+            return
+        with open(path, "r", encoding="utf-8") as f:
+            raw = json.load(f)
+        for gid, (draws, prompts, skipped, channels) in raw.items():
+            stats = GuildStats()
+            stats.draws = draws
+            stats.prompts = StreamSummary.restore(prompts)
+            stats.skipped = StreamSummary.restore(skipped)
+            stats.channels = StreamSummary.restore(channels)
+            self.stats[int(gid)] = stats
+
+
+def _encode_stats(stats: GuildStats) -> str:
+    return json.dumps(
+        [stats.draws, stats.prompts.dump(), stats.skipped.dump(), stats.channels.dump()],
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+
+
+def history_dir() -> str:
+    return os.path.join(storage.DATA_DIR, "history")
+
+
+def stats_path(suffix: str = "") -> str:
+    return os.path.join(history_dir(), f"stats{suffix}.json")
+
+
+def write_batch(data: bytes, suffix: str = "", directory: Optional[str] = None) -> None:
+    """Append drained records to their daily files, one write per file."""
+    if not data:
+        return
+    directory = directory or history_dir()
+    os.makedirs(directory, exist_ok=True)
+    by_day: Dict[str, List[bytes]] = {}
+    size = RECORD.size
+    for offset in range(0, len(data), size):
+        record = data[offset:offset + size]
+        day = time.strftime("%Y%m%d", time.gmtime(RECORD.unpack_from(record)[0]))
+        by_day.setdefault(day, []).append(record)
+    for day, records in by_day.items():
+        path = os.path.join(directory, f"draws-{day}{suffix}.bin")
+        with open(path, "ab") as f:
+            if f.tell() == 0:
+                f.write(FILE_MAGIC)
+            f.write(b"".join(records))
+
+
+def read_events(path: str) -> Iterator[Tuple[float, int, int, int, str, Optional[str], int]]:
+    """(timestamp, guild, channel, user, event, kind, text crc32) of a daily file."""
+    with open(path, "rb") as f:
+        if f.read(len(FILE_MAGIC)) != FILE_MAGIC:
+            raise ValueError(f"{path}: not a draw history file")
+        data = f.read()
+    usable = len(data) - len(data) % RECORD.size  # ignore a torn last record
+    for ts, gid, cid, uid, event, kind, crc in RECORD.iter_unpack(data[:usable]):
+        yield ts, gid, cid, uid, EVENT_NAMES.get(event, str(event)), KIND_NAMES.get(kind), crc
+
+
+# path -> {guild id: encoded counters} as last written, so a flush only
+# encodes the guilds that changed.
+_written: Dict[str, Dict[int, str]] = {}
+_write_lock = threading.Lock()
+
+
+def write_stats(changes: Dict[int, str], path: str) -> None:
+    """Merge ``DrawRecorder.stats_changes`` into the stats file at ``path``."""
+    if not changes:
+        return
+    with _write_lock:
+        fragments = _written.get(path)
+        if fragments is None:
+            fragments = {}
+            if os.path.exists(path):
+                with open(path, "r", encoding="utf-8") as f:
+                    for gid, entry in json.load(f).items():
+                        fragments[int(gid)] = json.dumps(entry, ensure_ascii=False, separators=(",", ":"))
+            _written[path] = fragments
+        fragments.update(changes)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_file = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            f.write("{")
+            f.write(",".join(f'"{gid}":{fragment}' for gid, fragment in fragments.items()))
+            f.write("}")
+        os.replace(tmp_file, path)
+
+
+recorder = DrawRecorder()
@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+"""Built-in instrumentation: counters, gauges and latency histograms.
+
+Everything lives in process memory. Updating a metric is a dict lookup and
+an addition under one lock (storage threads update them too), cheap enough
+to stay on in production. ``render`` produces the Prometheus text format,
+served on ``AOUV_METRICS_PORT`` when set and summarized by ``/aouvstats``.
+"""
+import asyncio
+import bisect
+import contextlib
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+METRICS_PORT = int(os.getenv("AOUV_METRICS_PORT") or 0)
+METRICS_HOST = os.getenv("AOUV_METRICS_HOST", "127.0.0.1")
+LOOP_LAG_INTERVAL = float(os.getenv("AOUV_LOOP_LAG_INTERVAL", "0.5"))
+
+# Seconds; from a cached read to a slow Discord round trip.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = Tuple[str, ...]
+
+_lock = threading.Lock()
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        _registry.append(self)
+
+    def lines(self) -> Iterator[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()) -> None:
+        super().__init__(name, help_text, labels)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with _lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0)
+
+    def values(self) -> Dict[Labels, float]:
+        with _lock:
+            return dict(self._values)
+
+    def lines(self) -> Iterator[str]:
+        for labels, value in sorted(self.values().items()):
+            yield f"{self.name}{_format_labels(self.labels, labels)} {_format_value(value)}"
+
+
+class Gauge(Metric):
+    """Value set by the code, or read from ``callback`` at exposition time."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, callback: Optional[Callable[[], float]] = None) -> None:
+        super().__init__(name, help_text)
+        self.callback = callback
+        self._value = 0.0
+
+    def set(self, value: float) -> None:
+        self._value = value
+
+    def value(self) -> float:
+        if self.callback is None:
+            return self._value
+        try:
+            return self.callback()
+        except Exception:
+            logging.exception("Échec de la lecture de la jauge %s", self.name)
+            return float("nan")
+
+    def lines(self) -> Iterator[str]:
+        yield f"{self.name} {_format_value(self.value())}"
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self, name: str, help_text: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> None:
+        super().__init__(name, help_text, labels)
+        self.bounds = tuple(buckets)
+        # labels -> [count per bucket (last one is +Inf)..., sum]
+        self._series: Dict[Labels, List[float]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        i = bisect.bisect_left(self.bounds, value)
+        with _lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.bounds) + 1) + [0.0]
+            series[i] += 1
+            series[-1] += value
+
+    @contextlib.contextmanager
+    def time(self, *labels: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def series(self) -> Dict[Labels, List[float]]:
+        with _lock:
+            return {labels: list(s) for labels, s in self._series.items()}
+
+    def count(self, *labels: str) -> int:
+        series = self._series.get(labels)
+        return int(sum(series[:-1])) if series else 0
+
+    def quantile(self, q: float, *labels: str) -> Optional[float]:
+        """Upper bound of the bucket holding the ``q`` quantile (None without data)."""
+        series = self._series.get(labels)
+        if not series:
+            return None
+        counts = series[:-1]
+        rank = q * sum(counts)
+        seen = 0
+        for bound, n in zip(self.bounds + (float("inf"),), counts):
+            seen += n
+            if seen >= rank and n:
+                return bound
+        return float("inf")
+
+    def lines(self) -> Iterator[str]:
+        for labels, series in sorted(self.series().items()):
+            cumulative = 0
+            for bound, n in zip(self.bounds + (float("inf"),), series[:-1]):
+                cumulative += n
+                le = 'le="' + _format_value(bound) + '"'
+                yield f"{self.name}_bucket{_format_labels(self.labels, labels, le)} {int(cumulative)}"
+            yield f"{self.name}_sum{_format_labels(self.labels, labels)} {_format_value(series[-1])}"
+            yield f"{self.name}_count{_format_labels(self.labels, labels)} {int(cumulative)}"
+
+
+_registry: List[Metric] = []
+
+
+def render() -> str:
+    """Every metric in the Prometheus text exposition format (0.0.4)."""
+    out: List[str] = []
+    for metric in _registry:
+        out.append(f"# HELP {metric.name} {metric.help}")
+        out.append(f"# TYPE {metric.name} {metric.kind}")
+        out.extend(metric.lines())
+    return "\n".join(out) + "\n"
+
+
+# ---- The bot's metrics ----
+
+command_seconds = Histogram("aouv_command_seconds", "Durée de traitement des commandes et boutons.", ("command",))
+command_errors = Counter("aouv_command_errors_total", "Commandes terminées par une exception.", ("command",))
+storage_seconds = Histogram("aouv_storage_seconds", "Durée des lectures complètes et écritures du stockage.", ("backend", "op"))
+storage_ops = Counter("aouv_storage_ops_total", "Lectures complètes et écritures du stockage.", ("backend", "op"))
+storage_bytes = Counter("aouv_storage_bytes_total", "Octets lus et écrits par le stockage.", ("backend", "op"))
+cache_requests = Counter("aouv_cache_requests_total", "Accès aux caches dérivés de la configuration.", ("cache", "result"))
+loop_lag = Histogram("aouv_loop_lag_seconds", "Retard de la boucle d'événements sur un sommeil programmé.")
+loop_lag_last = Gauge("aouv_loop_lag_last_seconds", "Dernier retard mesuré de la boucle d'événements.")
+loop_stalls = Counter("aouv_loop_stalls_total", "Blocages de la boucle d'événements signalés par le chien de garde.")
+
+
+def cache_hit(cache: str) -> None:
+    cache_requests.inc(cache, "hit")
+
+
+def cache_miss(cache: str) -> None:
+    cache_requests.inc(cache, "miss")
+
+
+def hit_ratios() -> Dict[str, Tuple[float, int]]:
+    """cache -> (hit ratio, number of requests)."""
+    totals: Dict[str, List[float]] = {}
+    for (cache, result), n in cache_requests.values().items():
+        entry = totals.setdefault(cache, [0, 0])
+        entry[1] += n
+        if result == "hit":
+            entry[0] += n
+    return {cache: (hits / total if total else 0.0, int(total)) for cache, (hits, total) in totals.items()}
+
+
+async def monitor_loop_lag(interval: float = LOOP_LAG_INTERVAL) -> None:
+    """Sleep ``interval`` forever and record how late each wake-up is."""
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        lag = max(0.0, time.perf_counter() - started - interval)
+        loop_lag.observe(lag)
+        loop_lag_last.set(lag)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path.split("?", 1)[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: object) -> None:
+        pass
+
+
+def serve(port: int = METRICS_PORT, host: str = METRICS_HOST) -> ThreadingHTTPServer:
+    """Serve ``/metrics`` from a daemon thread, so scrapes work even while the loop lags."""
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="aouv-metrics", daemon=True).start()
+    logging.info("Métriques exposées sur http://%s:%d/metrics", host, server.server_address[1])
+    return server
+
+
+def _ms(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return "-"
+    if seconds == float("inf"):
+        return f">{LATENCY_BUCKETS[-1] * 1000:g} ms"
+    return f"≤{seconds * 1000:g} ms"
+
+
+def _size(n: float) -> str:
+    for unit in ("o", "Ko", "Mo"):
+        if n < 1024:
+            return f"{n:.0f} {unit}"
+        n /= 1024
+    return f"{n:.1f} Go"
+
+
+def summary(max_commands: int = 10) -> str:
+    """Human-readable digest for /aouvstats (quantiles are histogram bucket bounds)."""
+    lines = ["Commandes (appels, p50, p99) :"]
+    by_count = sorted(command_seconds.series(), key=lambda labels: -command_seconds.count(*labels))
+    for labels in by_count[:max_commands]:
+        errors = command_errors.value(*labels)
+        lines.append(
+            f"  {labels[0]}: {command_seconds.count(*labels)}, {_ms(command_seconds.quantile(0.5, *labels))}, "
+            f"{_ms(command_seconds.quantile(0.99, *labels))}" + (f", {int(errors)} erreur(s)" if errors else "")
+        )
+    if not by_count:
+        lines.append("  (aucune)")
+    lines.append("Stockage (opérations, octets, p99) :")
+    ops = storage_ops.values()
+    volumes = storage_bytes.values()
+    for labels in sorted(set(ops) | set(volumes)):
+        lines.append(
+            f"  {labels[0]} {labels[1]}: {int(ops.get(labels, 0))}, {_size(volumes.get(labels, 0))}, "
+            f"{_ms(storage_seconds.quantile(0.99, *labels))}"
+        )
+    lines.append("Caches (taux de succès) :")
+    for cache, (ratio, total) in sorted(hit_ratios().items()):
+        lines.append(f"  {cache}: {ratio:.1%} sur {total}")
+    lines.append(
+        f"Boucle d'événements : retard {loop_lag_last.value() * 1000:.1f} ms, p99 {_ms(loop_lag.quantile(0.99))}"
+    )
+    return "\n".join(lines)
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""Shared prompt packs: themed prompt lists that guilds subscribe to.
+
+A pack is stored once, in ``data/packs.json``; a guild config only holds
+the ids of the packs it subscribed to and, per pack, a bitmask of the pack
+prompts it hid. In memory each pack is a tuple of interned strings shared by
+every guild, and its full view (a ``PromptPool`` segment) is built once per
+pack and referenced by every combined pool that includes it. A guild that
+edits a pack prompt gets a custom copy and the original is hidden for that
+guild only; the pack itself is never modified on a guild's behalf.
+
+Packs only grow: adding prompts appends them, so a prompt keeps its number
+in a pack and guild masks stay valid.
+"""
+import json
+import os
+import sys
+import threading
+from typing import ContextManager, Dict, Iterable, List, Optional, Tuple
+
+import metrics
+from prompt_pool import PromptPool
+
+MAX_PACK_PROMPTS = int(os.getenv("AOUV_PACK_MAX_PROMPTS", "10000"))
+
+
+class Pack:
+    __slots__ = ("id", "name", "actions", "truths", "_views")
+
+    def __init__(self, pack_id: str, name: str, actions: Iterable[str], truths: Iterable[str]) -> None:
+        self.id = pack_id
+        self.name = name
+        # Interned: a text shared by several packs (or reloads) is one object.
+        self.actions: Tuple[str, ...] = tuple(sys.intern(t) for t in actions)
+        self.truths: Tuple[str, ...] = tuple(sys.intern(t) for t in truths)
+        self._views: Dict[str, PromptPool] = {}
+
+    def prompts(self, kind: str) -> Tuple[str, ...]:
+        return self.actions if kind == "action" else self.truths
+
+    def view(self, kind: str, hidden: int = 0) -> PromptPool:
+        """The pack prompts of ``kind`` minus ``hidden`` (bitmask), as a pool segment.
+
+        The unmasked view is shared by every guild; only guilds that hid
+        prompts get a view of their own.
+        """
+        if hidden:
+            return PromptPool(self.prompts(kind), hidden, ())
+        view = self._views.get(kind)
+        if view is None:
+            view = self._views[kind] = PromptPool(self.prompts(kind), 0, ())
+        return view
+
+    def to_json(self) -> Dict[str, object]:
+        return {"name": self.name, "actions": list(self.actions), "verites": list(self.truths)}
+
+
+class PackLibrary:
+    """Every pack, loaded once from a JSON file and reloaded when it changes.
+
+    Works like the ``json`` storage backend: the file signature is checked on
+    access, and writes hold ``lock`` (shared with other processes) around a
+    read-modify-write of the whole file. Writes replace the changed pack by a
+    new object, so pools built from the previous one stay consistent.
+    """
+
+    def __init__(self, path: str, lock: ContextManager[object]) -> None:
+        self.path = path
+        self._lock = lock
+        self._packs: Optional[Dict[str, Pack]] = None
+        self._sig: Optional[Tuple[int, int, int]] = None
+        self._generation = 0
+        self._reload_lock = threading.Lock()
+
+    def _file_signature(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def _load_file(self) -> Dict[str, Pack]:
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, "rb") as f:
+            data = f.read()
+        metrics.storage_bytes.inc("packs", "read", amount=len(data))
+        raw = json.loads(data)
+        return {
+            pack_id: Pack(pack_id, entry.get("name") or pack_id, entry.get("actions", []), entry.get("verites", []))
+            for pack_id, entry in raw.items()
+        }
+
+    def packs(self) -> Dict[str, Pack]:
+        """Resident packs by id, reloaded only if the file changed. Do not mutate."""
+        packs = self._packs
+        if packs is not None and self._file_signature() == self._sig:
+            return packs
+        with self._reload_lock:
+            sig = self._file_signature()
+            if self._packs is None or sig != self._sig:
+                with metrics.storage_seconds.time("packs", "read"):
+                    self._packs = self._load_file()
+                metrics.storage_ops.inc("packs", "read")
+                self._sig = sig
+                self._generation += 1
+            return self._packs
+
+    def generation(self) -> int:
+        """Changes whenever any pack may have changed."""
+        self.packs()
+        return self._generation
+
+    def get(self, pack_id: str) -> Optional[Pack]:
+        return self.packs().get(pack_id)
+
+    def _write(self, packs: Dict[str, Pack]) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        data = json.dumps({pid: p.to_json() for pid, p in packs.items()}, ensure_ascii=False, indent=2).encode("utf-8")
+        tmp_file = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_file, "wb") as f:
+            f.write(data)
+        os.replace(tmp_file, self.path)
+        metrics.storage_bytes.inc("packs", "write", amount=len(data))
+        metrics.storage_ops.inc("packs", "write")
+        with self._reload_lock:
+            self._packs = packs
+            self._sig = self._file_signature()
+            self._generation += 1
+
+    def add_prompts(
+        self, pack_id: str, kind: str, texts: Iterable[str], name: Optional[str] = None
+    ) -> Tuple[List[int], int]:
+        """Append ``texts`` to a pack (created if needed).
+
+        Returns the indices of the added texts and how many were dropped
+        because the pack reached MAX_PACK_PROMPTS. Texts already in the pack
+        are skipped. ``name`` renames the pack.
+        """
+        with self._lock:
+            packs = dict(self.packs())
+            old = packs.get(pack_id)
+            actions = list(old.actions) if old else []
+            truths = list(old.truths) if old else []
+            target = actions if kind == "action" else truths
+            known = set(target)
+            added: List[int] = []
+            dropped = 0
+            for text in texts:
+                if text in known:
+                    continue
+                if len(target) >= MAX_PACK_PROMPTS:
+                    dropped += 1
+                    continue
+                known.add(text)
+                added.append(len(target))
+                target.append(text)
+            new_name = name or (old.name if old else pack_id)
+            if old is not None and not added and new_name == old.name:
+                return added, dropped
+            packs[pack_id] = Pack(pack_id, new_name, actions, truths)
+            self._write(packs)
+            return added, dropped
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""Event-loop stall watchdog and sampling profiler.
+
+The watchdog pairs a heartbeat coroutine with a plain thread: when the loop
+has not ticked for ``WATCHDOG_THRESHOLD`` seconds, the thread grabs the loop
+thread's current stack (``sys._current_frames``) while the blocking code is
+still running, and logs it. The profiler samples every thread's stack at a
+fixed interval for a fixed window and writes them in the collapsed format
+("frame;frame;frame count") read by flamegraph.pl, speedscope or inferno.
+"""
+import asyncio
+import collections
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from types import FrameType
+from typing import Counter, Dict, Optional
+
+import metrics
+import storage
+
+# Seconds without a loop tick before the blocking stack is captured (0: off).
+WATCHDOG_THRESHOLD = float(os.getenv("AOUV_WATCHDOG_THRESHOLD", "0.5"))
+PROFILE_INTERVAL = float(os.getenv("AOUV_PROFILE_INTERVAL", "0.005"))
+# Profile this many seconds right after startup (0: only on demand).
+PROFILE_ON_START = float(os.getenv("AOUV_PROFILE_ON_START", "0"))
+MAX_PROFILE_SECONDS = 300.0
+
+
+def _frame_label(frame: FrameType) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ",")
+
+
+def collapse(frame: Optional[FrameType], root: str) -> str:
+    """``root;outermost;...;innermost`` for one sampled stack."""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.append(root)
+    return ";".join(reversed(labels))
+
+
+class LoopWatchdog:
+    """Logs the stack of whatever keeps the event loop busy past ``threshold``."""
+
+    def __init__(self, threshold: float = WATCHDOG_THRESHOLD) -> None:
+        self.threshold = threshold
+        self._beat = time.monotonic()
+        self._loop_thread: Optional[int] = None
+        self._stopped = threading.Event()
+        self._task: Optional["asyncio.Task[None]"] = None
+
+    async def _heartbeat(self) -> None:
+        self._loop_thread = threading.get_ident()
+        interval = self.threshold / 4
+        while True:
+            self._beat = time.monotonic()
+            await asyncio.sleep(interval)
+
+    def start(self) -> None:
+        """Start from inside the running loop."""
+        self._task = asyncio.get_running_loop().create_task(self._heartbeat())
+        threading.Thread(target=self._watch, name="aouv-watchdog", daemon=True).start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+
+    def _watch(self) -> None:
+        reported_beat = None
+        while not self._stopped.wait(self.threshold / 2):
+            beat = self._beat
+            stalled = time.monotonic() - beat
+            if stalled < self.threshold or beat == reported_beat or self._loop_thread is None:
+                continue
+            # One report per stall: the beat does not move until the loop is free.
+            reported_beat = beat
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            metrics.loop_stalls.inc()
+            logging.warning(
+                "Boucle d'événements bloquée depuis %.2f s, pile en cours:\n%s",
+                stalled, "".join(traceback.format_stack(frame)).rstrip(),
+            )
+
+
+class SamplingProfiler:
+    def __init__(self, interval: float = PROFILE_INTERVAL) -> None:
+        self.interval = interval
+        self._running = threading.Lock()
+
+    @property
+    def busy(self) -> bool:
+        return self._running.locked()
+
+    def sample(self, seconds: float) -> Counter[str]:
+        """Collapsed stacks of every other thread, sampled for ``seconds``."""
+        if not self._running.acquire(blocking=False):
+            raise RuntimeError("un profil est déjà en cours")
+        try:
+            own = threading.get_ident()
+            stacks: Counter[str] = collections.Counter()
+            deadline = time.monotonic() + min(seconds, MAX_PROFILE_SECONDS)
+            while time.monotonic() < deadline:
+                names: Dict[int, str] = {t.ident: t.name for t in threading.enumerate() if t.ident is not None}
+                for ident, frame in sys._current_frames().items():
+                    if ident != own:
+                        stacks[collapse(frame, names.get(ident, str(ident)))] += 1
+                time.sleep(self.interval)
+            return stacks
+        finally:
+            self._running.release()
+
+    def record(self, seconds: float, directory: Optional[str] = None) -> str:
+        """Profile for ``seconds`` and write the collapsed stacks; returns the file path."""
+        stacks = self.sample(seconds)
+        directory = directory or storage.DATA_DIR
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, time.strftime("profile-%Y%m%d-%H%M%S") + f"-{os.getpid()}.folded")
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        logging.info("Profil de %.0f s écrit dans %s (%d échantillons)", seconds, path, sum(stacks.values()))
+        return path
+
+
+profiler = SamplingProfiler()
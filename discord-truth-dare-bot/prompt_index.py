@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""Per-base and per-guild prompt index caches, shared by search.py and dedup.py.
+
+An index is any object with ``add(ref, text)`` and ``remove(ref)``. The base
+corpus index is built once per base list and kept for the life of the
+process. A guild's custom index is built on first use, stamped with the
+guild version, and then patched from storage commits (see
+storage.add_listener) as long as it was current when the commit happened.
+"""
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Generic, Hashable, Iterable, Sequence, Tuple, TypeVar
+
+import metrics
+import storage
+
+Version = Tuple[int, int, int]
+I = TypeVar("I")
+
+
+class IndexCache(Generic[I]):
+    """Indexes built by ``factory``; hold ``lock`` while using any of them."""
+
+    def __init__(self, name: str, factory: Callable[[], I], size: int) -> None:
+        self.name = name
+        self.size = size
+        self.lock = threading.Lock()
+        self._factory = factory
+        # id(base list) -> (base list, index).
+        self._base: Dict[int, Tuple[Sequence[str], I]] = {}
+        # (guild_id, kind) -> (guild version, index), in LRU order.
+        self._custom: "OrderedDict[Tuple[int, str], Tuple[Version, I]]" = OrderedDict()
+        storage.add_listener(self._on_commit)
+
+    def _build(self, items: Iterable[Tuple[Hashable, str]]) -> I:
+        index = self._factory()
+        for ref, text in items:
+            index.add(ref, text)  # type: ignore[attr-defined]
+        return index
+
+    def base(self, base: Sequence[str]) -> I:
+        entry = self._base.get(id(base))
+        if entry is None or entry[0] is not base:
+            entry = self._base[id(base)] = (base, self._build(enumerate(base)))
+        return entry[1]
+
+    def custom(self, guild_id: int, kind: str) -> I:
+        key = (guild_id, kind)
+        version = storage.guild_version(guild_id)
+        entry = self._custom.get(key)
+        if entry is None or entry[0] != version:
+            # First use, or the config changed outside this process: rebuild.
+            metrics.cache_miss(self.name)
+            entry = self._custom[key] = (version, self._build(storage.list_custom_prompts(guild_id, kind)))
+            while len(self._custom) > self.size:
+                self._custom.popitem(last=False)
+        else:
+            metrics.cache_hit(self.name)
+        self._custom.move_to_end(key)
+        return entry[1]
+
+    def _on_commit(self, guild_id: int, ops: Sequence[storage.Op], before: Version) -> None:
+        with self.lock:
+            version = storage.guild_version(guild_id)
+            for kind in ("action", "verite"):
+                key = (guild_id, kind)
+                entry = self._custom.get(key)
+                if entry is None:
+                    continue
+                if entry[0] != before:
+                    # Already stale before this commit (changed by another
+                    # process): patching would hide that, rebuild on next use.
+                    del self._custom[key]
+                    continue
+                index = entry[1]
+                for op in ops:
+                    if op[0] in ("add_prompt", "edit_prompt") and op[1] == kind:
+                        index.add(op[2], op[3])  # type: ignore[attr-defined]
+                    elif op[0] == "remove_prompt" and op[1] == kind:
+                        index.remove(op[2])  # type: ignore[attr-defined]
+                self._custom[key] = (version, index)
@@ -0,0 +1,291 @@
+# -*- coding: utf-8 -*-
+"""Bulk import/export of custom prompts (JSON, CSV or plain text files).
+
+Import parses the attachment item by item, validates each prompt, drops
+exact and near duplicates (see dedup.py), and commits everything in a
+single storage transaction. Export writes straight into the output buffer,
+one prompt at a time. The same files can also fill a shared prompt pack
+(see packs.py).
+"""
+import csv
+import io
+import itertools
+import json
+import os
+from dataclasses import dataclass, field
+from typing import IO, Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import dedup
+import sampling
+import storage
+
+MAX_PROMPT_LENGTH = 1000
+MAX_IMPORT_BYTES = int(os.getenv("AOUV_IMPORT_MAX_BYTES", str(1024 * 1024)))
+MAX_IMPORT_PROMPTS = int(os.getenv("AOUV_IMPORT_MAX_PROMPTS", "5000"))
+
+FORMATS = ("json", "csv", "txt")
+
+# Parsed items: ("prompt", text or {"text", "tags", "weight"}) or
+# ("disabled", numero) with numero 1..n.
+Item = Tuple[str, object]
+
+
+class ImportFormatError(ValueError):
+    """The attachment could not be parsed in the requested format."""
+
+
+@dataclass
+class ImportReport:
+    added: List[str] = field(default_factory=list)
+    duplicates: int = 0
+    invalid: int = 0
+    disabled: int = 0
+    truncated: bool = False
+    # Prompts left out because a shared pack reached MAX_PACK_PROMPTS.
+    dropped: int = 0
+
+
+def detect_format(filename: str) -> str:
+    ext = os.path.splitext(filename.lower())[1].lstrip(".")
+    if ext in ("json", "csv"):
+        return ext
+    return "txt"
+
+
+def _iter_json_array(text: str, pos: int) -> Iterator[object]:
+    """Decode the elements of the JSON array starting at ``text[pos]`` one by one."""
+    decoder = json.JSONDecoder()
+    end = len(text)
+    pos += 1
+    while True:
+        while pos < end and text[pos] in " \t\r\n,":
+            pos += 1
+        if pos >= end or text[pos] == "]":
+            return
+        value, pos = decoder.raw_decode(text, pos)
+        yield value
+
+
+def _json_items(data: bytes) -> Iterator[Item]:
+    text = data.decode("utf-8-sig")
+    start = len(text) - len(text.lstrip())
+    if text[start:start + 1] == "[":
+        elements: Iterator[object] = _iter_json_array(text, start)
+        disabled: Sequence[object] = ()
+    else:
+        # Export format: {"kind": ..., "disabled_base": [...], "prompts": [...]}
+        obj = json.loads(text)
+        if not isinstance(obj, dict):
+            raise ImportFormatError("le fichier doit contenir une liste de prompts ou un objet d'export")
+        prompts = obj.get("prompts", [])
+        disabled = obj.get("disabled_base", [])
+        if not isinstance(prompts, list):
+            raise ImportFormatError("`prompts` doit être une liste")
+        if not isinstance(disabled, list):
+            raise ImportFormatError("`disabled_base` doit être une liste")
+        elements = iter(prompts)
+    for element in elements:
+        yield ("prompt", element)
+    for numero in disabled:
+        yield ("disabled", numero)
+
+
+def _csv_items(data: bytes) -> Iterator[Item]:
+    reader = csv.reader(io.TextIOWrapper(io.BytesIO(data), encoding="utf-8-sig", newline=""))
+    header = next(reader, None)
+    if header is None:
+        return
+    columns = [h.strip().lower() for h in header]
+    text_col = next((columns.index(c) for c in ("texte", "text") if c in columns), None)
+    type_col = columns.index("type") if "type" in columns else None
+    id_col = columns.index("id") if "id" in columns else None
+    tags_col = columns.index("tags") if "tags" in columns else None
+    weight_col = next((columns.index(c) for c in ("poids", "weight") if c in columns), None)
+    if text_col is None:
+        # No header: every row is a prompt in the first column.
+        text_col = 0
+        reader = itertools.chain([header], reader)
+    for row in reader:
+        if not row:
+            continue
+        if type_col is not None and type_col < len(row) and row[type_col].strip() == "disabled":
+            if id_col is not None and id_col < len(row):
+                yield ("disabled", row[id_col].strip())
+            continue
+        text = row[text_col] if text_col < len(row) else None
+        if tags_col is None and weight_col is None:
+            yield ("prompt", text)
+            continue
+        fields: Dict[str, Any] = {"text": text}
+        if tags_col is not None and tags_col < len(row):
+            fields["tags"] = row[tags_col]
+        if weight_col is not None and weight_col < len(row) and row[weight_col].strip():
+            fields["weight"] = row[weight_col].strip()
+        yield ("prompt", fields)
+
+
+def _txt_items(data: bytes) -> Iterator[Item]:
+    for line in io.TextIOWrapper(io.BytesIO(data), encoding="utf-8-sig"):
+        line = line.strip()
+        if line and not line.startswith("#"):
+            yield ("prompt", line)
+
+
+def parse_items(data: bytes, fmt: str) -> Iterator[Item]:
+    if fmt == "json":
+        return _json_items(data)
+    if fmt == "csv":
+        return _csv_items(data)
+    return _txt_items(data)
+
+
+def _prompt_fields(value: object) -> Optional[Tuple[str, List[str], float]]:
+    """(text, tags, weight) of a parsed prompt, or None if it is invalid."""
+    tags: List[str] = []
+    weight = storage.DEFAULT_WEIGHT
+    if isinstance(value, dict):
+        raw_tags = value.get("tags", [])
+        raw_weight = value.get("weight", value.get("poids"))
+        value = value.get("text", value.get("texte"))
+        try:
+            if isinstance(raw_tags, list):
+                raw_tags = ",".join(str(t) for t in raw_tags)
+            tags = sampling.parse_tags(str(raw_tags))
+            if raw_weight is not None:
+                weight = sampling.check_weight(float(raw_weight))
+        except (TypeError, ValueError):
+            return None
+    if not isinstance(value, str) or not value.strip() or len(value.strip()) > MAX_PROMPT_LENGTH:
+        return None
+    return value.strip(), tags, weight
+
+
+def import_prompts(guild_id: int, kind: str, data: bytes, fmt: str, base: Sequence[str]) -> ImportReport:
+    """Validate and add every prompt of ``data`` in one commit.
+
+    Raises ImportFormatError (and writes nothing) if the file is malformed.
+    """
+    report = ImportReport()
+    checker = dedup.checker(guild_id, kind, base)
+    with storage.transaction(guild_id) as conf:
+        try:
+            _import_into(conf, kind, parse_items(data, fmt), base, checker, report)
+        except (ValueError, csv.Error) as e:
+            raise ImportFormatError(str(e)) from e
+    return report
+
+
+def _import_into(
+    conf: storage.GuildConfig,
+    kind: str,
+    items: Iterator[Item],
+    base: Sequence[str],
+    checker: "dedup.DuplicateChecker",
+    report: ImportReport,
+) -> None:
+    target = conf.custom_actions if kind == "action" else conf.custom_truths
+    for item_type, value in items:
+        if item_type == "disabled":
+            try:
+                index = int(value) - 1  # type: ignore[call-overload]
+            except (TypeError, ValueError):
+                report.invalid += 1
+                continue
+            if 0 <= index < len(base) and storage.set_disabled(conf, kind, index, True):
+                report.disabled += 1
+            continue
+        fields = _prompt_fields(value)
+        if fields is None:
+            report.invalid += 1
+            continue
+        text, tags, weight = fields
+        if checker.is_duplicate(text):
+            report.duplicates += 1
+            continue
+        if len(report.added) >= MAX_IMPORT_PROMPTS:
+            report.truncated = True
+            break
+        prompt_id = storage.new_prompt_id()
+        checker.add(prompt_id, text)
+        target.append(storage.CustomPrompt(id=prompt_id, text=text, tags=tags, weight=weight))
+        report.added.append(prompt_id)
+
+
+def _write_export(out: IO[str], kind: str, fmt: str, prompts: Sequence[storage.CustomPrompt], disabled: Sequence[int]) -> None:
+    numbers = sorted(i + 1 for i in disabled)
+    if fmt == "json":
+        out.write('{"kind": %s, "disabled_base": %s, "prompts": [' % (json.dumps(kind), json.dumps(numbers)))
+        for i, p in enumerate(prompts):
+            out.write(",\n  " if i else "\n  ")
+            entry: Dict[str, Any] = {"id": p.id, "text": p.text}
+            if p.tags:
+                entry["tags"] = p.tags
+            if p.weight != storage.DEFAULT_WEIGHT:
+                entry["weight"] = p.weight
+            json.dump(entry, out, ensure_ascii=False)
+        out.write("\n]}\n")
+    elif fmt == "csv":
+        writer = csv.writer(out)
+        writer.writerow(["type", "id", "texte", "tags", "poids"])
+        for p in prompts:
+            writer.writerow(["custom", p.id, p.text, ",".join(p.tags), f"{p.weight:g}"])
+        for numero in numbers:
+            writer.writerow(["disabled", numero, "", "", ""])
+    else:
+        # Plain text keeps only the texts.
+        if numbers:
+            out.write("# Prompts de base désactivés: " + ", ".join(map(str, numbers)) + "\n")
+        for p in prompts:
+            out.write(" ".join(p.text.splitlines()) + "\n")
+
+
+def export_prompts(guild_id: int, kind: str, fmt: str) -> io.BytesIO:
+    """Custom prompts and disabled base numbers of a guild, as a file buffer."""
+    buffer = io.BytesIO()
+    out = io.TextIOWrapper(buffer, encoding="utf-8", newline="" if fmt == "csv" else None, write_through=True)
+    _write_export(out, kind, fmt, storage.get_custom_prompts(guild_id, kind), storage.list_disabled_base(guild_id, kind))
+    out.flush()
+    out.detach()
+    buffer.seek(0)
+    return buffer
+
+
+def import_pack(pack_id: str, kind: str, data: bytes, fmt: str, name: Optional[str] = None) -> ImportReport:
+    """Append every valid prompt of ``data`` to a shared pack (created if needed).
+
+    Duplicates of the pack's prompts or of earlier lines are skipped; tags,
+    weights and disabled numbers in the file are ignored (pack prompts are
+    tagged with the pack id). ``report.added`` holds the 1-based numbers of
+    the new prompts in the pack. Raises ImportFormatError if the file is
+    malformed.
+    """
+    report = ImportReport()
+    existing = dedup.SimilarityIndex()
+    pack = storage.get_pack(pack_id)
+    if pack is not None:
+        for i, text in enumerate(pack.prompts(kind)):
+            existing.add(i, text)
+    checker = dedup.DuplicateChecker(existing, dedup.SimilarityIndex())
+    texts: List[str] = []
+    try:
+        for item_type, value in parse_items(data, fmt):
+            fields = _prompt_fields(value) if item_type == "prompt" else None
+            if fields is None:
+                report.invalid += 1
+                continue
+            text = fields[0]
+            if checker.is_duplicate(text):
+                report.duplicates += 1
+                continue
+            if len(texts) >= MAX_IMPORT_PROMPTS:
+                report.truncated = True
+                break
+            checker.add(("new", len(texts)), text)
+            texts.append(text)
+    except (ValueError, csv.Error) as e:
+        raise ImportFormatError(str(e)) from e
+    added, report.dropped = storage.add_pack_prompts(pack_id, kind, texts, name)
+    report.added = [str(i + 1) for i in added]
+    if report.dropped:
+        report.truncated = True
+    return report
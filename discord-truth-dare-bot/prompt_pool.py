@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""Bitset helpers and a lazy combined prompt pool.
+
+Disabled base prompts are stored as an ``int`` bitmask (bit i set = base
+prompt i disabled). ``PromptPool`` exposes "enabled base prompts, then
+subscribed pack segments, then custom prompts" as a read-only sequence
+without copying the base corpus or the packs: item r is resolved by
+rank/select over the mask, or by bisection over the segment ends.
+"""
+import bisect
+import random
+from array import array
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+BLOCK_BITS = 64
+
+
+def mask_indices(mask: int) -> List[int]:
+    """Indices of the set bits, in increasing order."""
+    indices = []
+    data = mask.to_bytes((mask.bit_length() + 7) // 8, "little")
+    for byte_index, byte in enumerate(data):
+        while byte:
+            low = byte & -byte
+            indices.append(byte_index * 8 + low.bit_length() - 1)
+            byte ^= low
+    return indices
+
+
+def mask_from_indices(indices: Sequence[int]) -> int:
+    mask = 0
+    for i in indices:
+        mask |= 1 << i
+    return mask
+
+
+def _select_in_word(word: int, rank: int) -> int:
+    """Position of the ``rank``-th (0-based) set bit of a 64-bit word."""
+    pos = 0
+    width = BLOCK_BITS
+    while width > 1:
+        width //= 2
+        low = word & ((1 << width) - 1)
+        count = low.bit_count()
+        if rank >= count:
+            rank -= count
+            word >>= width
+            pos += width
+        else:
+            word = low
+    return pos
+
+
+class PromptPool(Sequence[str]):
+    """Enabled base prompts, pack segments, then custom prompts, resolved on access.
+
+    ``packs`` are pools themselves (see packs.Pack.view), usually shared
+    between guilds; ``pack_ids`` names them, in the same order.
+    """
+
+    __slots__ = ("base", "mask", "custom", "packs", "pack_ids", "_enabled_base", "_pack_ends", "_ranks", "_words")
+
+    def __init__(
+        self,
+        base: Sequence[str],
+        mask: int,
+        custom: Tuple[str, ...],
+        packs: Tuple["PromptPool", ...] = (),
+        pack_ids: Tuple[str, ...] = (),
+    ) -> None:
+        size = len(base)
+        mask &= (1 << size) - 1
+        self.base = base
+        self.mask = mask
+        self.custom = custom
+        self.packs = packs
+        self.pack_ids = pack_ids
+        self._enabled_base = size - mask.bit_count()
+        # _pack_ends[i] = pack prompts up to and including segment i.
+        self._pack_ends = array("I")
+        total = 0
+        for segment in packs:
+            total += len(segment)
+            self._pack_ends.append(total)
+        # _ranks[b] = enabled base prompts before block b. Not needed when
+        # nothing is disabled: item r is then simply base[r].
+        self._ranks: Optional[array] = None
+        self._words = b""
+        if mask:
+            nblocks = (size + BLOCK_BITS - 1) // BLOCK_BITS
+            self._words = mask.to_bytes(nblocks * 8, "little")
+            ranks = array("I")
+            enabled = 0
+            for block in range(nblocks):
+                ranks.append(enabled)
+                width = min(BLOCK_BITS, size - block * BLOCK_BITS)
+                enabled += width - self._word(block).bit_count()
+            self._ranks = ranks
+
+    def _word(self, block: int) -> int:
+        return int.from_bytes(self._words[block * 8:block * 8 + 8], "little")
+
+    def __len__(self) -> int:
+        return self._enabled_base + self.pack_size + len(self.custom)
+
+    @property
+    def pack_size(self) -> int:
+        """Number of prompts coming from packs."""
+        return self._pack_ends[-1] if self._pack_ends else 0
+
+    def base_index(self, rank: int) -> int:
+        """Index in ``base`` of the ``rank``-th enabled base prompt."""
+        if self._ranks is None:
+            return rank
+        block = bisect.bisect_right(self._ranks, rank) - 1
+        start = block * BLOCK_BITS
+        width = min(BLOCK_BITS, len(self.base) - start)
+        enabled_word = ~self._word(block) & ((1 << width) - 1)
+        return start + _select_in_word(enabled_word, rank - self._ranks[block])
+
+    def __getitem__(self, r):  # type: ignore[override]
+        if isinstance(r, slice):
+            return [self[i] for i in range(*r.indices(len(self)))]
+        if r < 0:
+            r += len(self)
+        if not 0 <= r < len(self):
+            raise IndexError("prompt pool index out of range")
+        if r < self._enabled_base:
+            return self.base[self.base_index(r)]
+        r -= self._enabled_base
+        if r < self.pack_size:
+            segment = bisect.bisect_right(self._pack_ends, r)
+            return self.packs[segment][r - (self._pack_ends[segment - 1] if segment else 0)]
+        return self.custom[r - self.pack_size]
+
+    def sample(self, rng: random.Random) -> str:
+        """Uniformly random enabled prompt; O(log n) without materializing the pool."""
+        return self[rng.randrange(len(self))]
+
+    def base_indices(self) -> Iterator[int]:
+        """Indices in ``base`` of the enabled base prompts, in pool order."""
+        start = 0
+        for disabled in mask_indices(self.mask):
+            yield from range(start, disabled)
+            start = disabled + 1
+        yield from range(start, len(self.base))
+
+    def __iter__(self) -> Iterator[str]:
+        base = self.base
+        for i in self.base_indices():
+            yield base[i]
+        for segment in self.packs:
+            yield from segment
+        yield from self.custom
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, PromptPool):
+            return (
+                other.base is self.base
+                and other.mask == self.mask
+                and other.custom == self.custom
+                and other.pack_ids == self.pack_ids
+                and other.packs == self.packs
+            )
+        return NotImplemented
+
+    def __hash__(self) -> int:
+        return hash((id(self.base), self.mask, self.custom, self.packs))
@@ -2,7 +2,18 @@
 """
 Listes de prompts pour le jeu Action ou Vérité en français.
 Contient 100 actions et 100 vérités.
+
+Si AOUV_CORPUS_FILE pointe vers un corpus compilé (voir corpus.py), ACTIONS et
+VERITES deviennent des vues mémoire-mappées sur ses sections.
+
+ACTION_TAGS et VERITE_TAGS donnent les tags par défaut des prompts de base
+(index -> tags, calculés au premier accès) ; chaque serveur peut en ajouter
+avec /aouvconfig prompt tag.
 """
+import os
+import re
+import unicodedata
+from typing import Any, Dict, Iterator, Mapping, Optional, Sequence, Tuple
 
 ACTIONS = [
     "Envoie un GIF qui te représente aujourd'hui.",
@@ -208,4 +219,91 @@ VERITES = [
     "Quel est un échec dont tu es fier ?",
     "Quel est ton rituel du matin ?",
     "Quelle est la chose qui te fait rester sur ce serveur ?"
-]
\ No newline at end of file
+]
+
+
+_CORPUS_FILE = os.getenv("AOUV_CORPUS_FILE")
+if _CORPUS_FILE:
+    from corpus import load_corpus
+
+    _corpus = load_corpus(_CORPUS_FILE)
+    ACTIONS = _corpus[os.getenv("AOUV_CORPUS_ACTIONS", "actions")]  # type: ignore[assignment]
+    VERITES = _corpus[os.getenv("AOUV_CORPUS_VERITES", "verites")]  # type: ignore[assignment]
+
+
+# Tags par défaut des prompts de base, déduits de mots-clés. Les mots sont
+# comparés aux mots entiers du prompt (sans casse, pluriel en -s/-x toléré) ;
+# une entrée de plusieurs mots doit apparaître telle quelle.
+_ACTION_TAG_RULES = {
+    "ecriture": ("écris", "réécris", "compose", "poème", "haïku", "acrostiche", "pangramme", "palindrome", "rime", "slogan", "fiction", "histoire"),
+    "emoji": ("emoji", "réaction", "réagis"),
+    "media": ("gif", "mème", "sticker", "photo", "image", "musique", "playlist", "selfie", "capture", "fond d'écran"),
+    "profil": ("surnom", "photo de profil", "statut", "avatar"),
+    "social": ("complimente", "compliment", "demande", "gentil", "merci", "ping", "quelqu'un"),
+}
+_VERITE_TAG_RULES = {
+    "serveur": ("serveur", "discord", "canal", "ici", "bot"),
+    "tech": ("setup", "bug", "app", "appli", "application", "programmation", "outil", "notification", "numérique", "données", "tech"),
+    "perso": ("rêve", "peur", "fierté", "fier", "objectif", "habitude", "courageuse", "stress", "motive", "unique"),
+    "loisirs": ("jeu", "film", "série", "musique", "snack", "café"),
+}
+
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def _words(text: str) -> Tuple[str, ...]:
+    # Accents gardés (« même » n'est pas « mème »), mais forme NFC commune.
+    words = _WORD_RE.findall(unicodedata.normalize("NFC", text).casefold())
+    return tuple(w[:-1] if len(w) > 3 and w[-1] in "sx" else w for w in words)
+
+
+class KeywordTags(Mapping[int, Tuple[str, ...]]):
+    """Index -> tags des prompts de base, calculés au premier accès.
+
+    Évite de décoder tout le corpus (mmap) au démarrage : le calcul n'a lieu
+    que lorsqu'un tirage ou une commande a besoin des tags.
+    """
+
+    def __init__(self, prompts: Sequence[str], rules: Dict[str, Tuple[str, ...]]) -> None:
+        self._prompts = prompts
+        self._rules = [(tag, [_words(word) for word in words]) for tag, words in rules.items()]
+        self._tags: Optional[Dict[int, Tuple[str, ...]]] = None
+
+    def _compute(self) -> Dict[int, Tuple[str, ...]]:
+        tags = self._tags
+        if tags is None:
+            tags = {}
+            for i, text in enumerate(self._prompts):
+                words = _words(text)
+                # Mots du prompt, et suites de mots pour les entrées composées.
+                present = set(words)
+                joined = " " + " ".join(words) + " "
+                found = tuple(
+                    tag
+                    for tag, phrases in self._rules
+                    if any(
+                        phrase[0] in present if len(phrase) == 1 else " " + " ".join(phrase) + " " in joined
+                        for phrase in phrases
+                    )
+                )
+                if found:
+                    tags[i] = found
+            self._tags = tags
+        return tags
+
+    def __getitem__(self, index: int) -> Tuple[str, ...]:
+        return self._compute()[index]
+
+    def get(self, index: int, default: Any = None) -> Any:
+        return self._compute().get(index, default)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._compute())
+
+    def __len__(self) -> int:
+        return len(self._compute())
+
+
+ACTION_TAGS = KeywordTags(ACTIONS, _ACTION_TAG_RULES)
+VERITE_TAGS = KeywordTags(VERITES, _VERITE_TAG_RULES)
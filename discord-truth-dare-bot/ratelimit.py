@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""In-memory rate limiting of draws, per (guild, channel, user) and per channel.
+
+Each limiter is a token bucket stored as a single float per key, its
+"theoretical arrival time" (GCRA): a hit is allowed while that time is less
+than ``burst`` intervals ahead of now, and pushes it one interval further.
+A key whose time is in the past holds a full bucket, exactly like a missing
+one, so the idle sweep just drops those. Limiters are only touched from the
+event loop and need no lock.
+"""
+import os
+import time
+from typing import Dict, Hashable, Optional, Tuple
+
+# Draws per minute and burst size; a rate of 0 disables the limiter.
+USER_RATE = float(os.getenv("AOUV_USER_RATE", "12"))
+USER_BURST = int(os.getenv("AOUV_USER_BURST", "4"))
+# Protects the channel's outbound message rate, whoever clicks.
+CHANNEL_RATE = float(os.getenv("AOUV_CHANNEL_RATE", "40"))
+CHANNEL_BURST = int(os.getenv("AOUV_CHANNEL_BURST", "5"))
+
+
+class RateLimiter:
+    def __init__(self, per_minute: float, burst: int) -> None:
+        self.enabled = per_minute > 0
+        self.interval = 60.0 / per_minute if self.enabled else 0.0
+        # How far ahead of now the arrival time may be: burst - 1 extra hits.
+        self.tolerance = self.interval * (max(1, burst) - 1)
+        self._tat: Dict[Hashable, float] = {}
+
+    def __len__(self) -> int:
+        return len(self._tat)
+
+    def hit(self, key: Hashable, now: Optional[float] = None) -> float:
+        """Take a token for ``key``. Returns 0.0 if allowed, else seconds until the next token."""
+        if not self.enabled:
+            return 0.0
+        if now is None:
+            now = time.monotonic()
+        tat = self._tat.get(key, now)
+        if tat < now:
+            tat = now
+        ahead = tat - now
+        if ahead > self.tolerance:
+            return ahead - self.tolerance
+        self._tat[key] = tat + self.interval
+        return 0.0
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """Drop keys whose bucket is full again. Returns how many were dropped."""
+        now = time.monotonic() if now is None else now
+        idle = [key for key, tat in self._tat.items() if tat <= now]
+        for key in idle:
+            del self._tat[key]
+        return len(idle)
+
+
+users = RateLimiter(USER_RATE, USER_BURST)
+channels = RateLimiter(CHANNEL_RATE, CHANNEL_BURST)
+
+
+def check(guild_id: int, channel_id: int, user_id: int) -> float:
+    """0.0 if this user may draw here now, else seconds to wait.
+
+    The user bucket is checked first so that a spamming user is stopped
+    before eating into the channel's budget.
+    """
+    now = time.monotonic()
+    wait = users.hit((guild_id, channel_id, user_id), now)
+    if wait:
+        return wait
+    return channels.hit((guild_id, channel_id), now)
+
+
+def sweep() -> Tuple[int, int]:
+    now = time.monotonic()
+    return users.sweep(now), channels.sweep(now)
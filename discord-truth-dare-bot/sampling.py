@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""Tag filters and weighted draws over a guild's prompt pool.
+
+A ``WeightedPool`` is the subset of a combined pool matching a tag filter,
+with the per-prompt weights of the guild. Non-uniform weights get a Walker /
+Vose alias table, so each draw costs two random numbers whatever the pool
+size. Pools are cached per (guild, kind, tag) and rebuilt only when the
+guild config version (or the base list) changes.
+"""
+import os
+import random
+import re
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+import metrics
+import storage
+from prompt_pool import PromptPool
+from search import fold
+
+SAMPLING_CACHE_SIZE = int(os.getenv("AOUV_SAMPLING_CACHE_SIZE", "1024"))
+MAX_TAGS = 10
+MAX_TAG_LENGTH = 32
+MAX_WEIGHT = 100.0
+
+BaseTags = Mapping[int, Sequence[str]]
+
+_TAG_RE = re.compile(r"[^a-z0-9_-]+")
+
+
+def normalize_tag(tag: str) -> str:
+    """"Écriture " -> "ecriture"; empty if nothing usable is left."""
+    return _TAG_RE.sub("", fold(tag.strip()).replace(" ", "-"))[:MAX_TAG_LENGTH]
+
+
+def parse_tags(value: str) -> List[str]:
+    """Comma or space separated tags, normalized and de-duplicated (order kept)."""
+    tags: List[str] = []
+    for raw in re.split(r"[,\s]+", value):
+        tag = normalize_tag(raw)
+        if tag and tag not in tags:
+            tags.append(tag)
+    if len(tags) > MAX_TAGS:
+        raise ValueError(f"{MAX_TAGS} tags maximum")
+    return tags
+
+
+def check_weight(weight: float) -> float:
+    if not 0 < weight <= MAX_WEIGHT:
+        raise ValueError(f"le poids doit être compris entre 0 (exclu) et {MAX_WEIGHT:g}")
+    return weight
+
+
+class AliasTable:
+    """O(1) sampling of an index proportionally to its weight (Vose's method)."""
+
+    __slots__ = ("prob", "alias")
+
+    def __init__(self, weights: Sequence[float]) -> None:
+        n = len(weights)
+        total = sum(weights)
+        scaled = [w * n / total for w in weights]
+        self.prob = array("d", [1.0]) * n
+        self.alias = array("I", range(n))
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s, g = small.pop(), large[-1]
+            self.prob[s] = scaled[s]
+            self.alias[s] = g
+            scaled[g] -= 1.0 - scaled[s]
+            if scaled[g] < 1.0:
+                small.append(large.pop())
+        # Whatever is left is 1.0 up to rounding errors.
+
+    def __len__(self) -> int:
+        return len(self.prob)
+
+    def sample(self, rng: random.Random) -> int:
+        i = rng.randrange(len(self.prob))
+        return i if rng.random() < self.prob[i] else self.alias[i]
+
+
+class WeightedPool(Sequence[str]):
+    """Prompts of ``pool`` matching a tag filter, with their draw weights.
+
+    ``ranks`` lists the matching positions in ``pool`` (None = all of them);
+    ``table`` is None when every matching prompt has the same weight, in
+    which case draws can go through the no-repeat shuffle bags.
+    """
+
+    __slots__ = ("pool", "tag", "ranks", "table")
+
+    def __init__(self, pool: PromptPool, tag: Optional[str], ranks: Optional[array], table: Optional[AliasTable]) -> None:
+        self.pool = pool
+        self.tag = tag
+        self.ranks = ranks
+        self.table = table
+
+    @property
+    def uniform(self) -> bool:
+        return self.table is None
+
+    def __len__(self) -> int:
+        return len(self.pool) if self.ranks is None else len(self.ranks)
+
+    def __getitem__(self, i):  # type: ignore[override]
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if self.ranks is None:
+            return self.pool[i]
+        return self.pool[self.ranks[i]]
+
+    def __iter__(self) -> Iterator[str]:
+        if self.ranks is None:
+            return iter(self.pool)
+        return (self.pool[r] for r in self.ranks)
+
+    def sample(self, rng: random.Random) -> str:
+        """Weighted random prompt (uniform if ``table`` is None), without building the list."""
+        i = self.table.sample(rng) if self.table is not None else rng.randrange(len(self))
+        return self[i]
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, WeightedPool):
+            return other.pool == self.pool and other.ranks == self.ranks
+        return NotImplemented
+
+    def __hash__(self) -> int:
+        return hash((self.pool, None if self.ranks is None else self.ranks.tobytes()))
+
+
+def _entries(pool: PromptPool, meta: storage.PoolMeta, base_tags: BaseTags) -> Iterator[Tuple[Sequence[str], float]]:
+    """(tags, weight) of every prompt of ``pool``: default base tags plus the guild's."""
+    metas = storage.iter_prompt_meta(pool, meta)
+    for i in pool.base_indices():
+        tags, weight = next(metas)
+        default = base_tags.get(i)
+        yield (tuple(default) + tuple(tags) if default else tags), weight
+    yield from metas
+
+
+def _build(pool: PromptPool, meta: storage.PoolMeta, base_tags: BaseTags, tag: Optional[str]) -> WeightedPool:
+    ranks = array("I")
+    weights: List[float] = []
+    for rank, (tags, weight) in enumerate(_entries(pool, meta, base_tags)):
+        if tag is None or tag in tags:
+            ranks.append(rank)
+            weights.append(weight)
+    uniform = all(w == weights[0] for w in weights)
+    table = None if uniform else AliasTable(weights)
+    return WeightedPool(pool, tag, None if tag is None else ranks, table)
+
+
+_lock = threading.Lock()
+# (guild_id, kind, tag) -> (version, base tags, pool), in LRU order.
+_cache: "OrderedDict[Tuple[int, str, Optional[str]], Tuple[Tuple[int, int, int], BaseTags, WeightedPool]]" = OrderedDict()
+
+
+def weighted_pool(
+    guild_id: int, kind: str, base: Sequence[str], base_tags: BaseTags, tag: Optional[str] = None
+) -> WeightedPool:
+    """Prompts of ``kind`` for a guild, filtered on ``tag`` (None = all), with their weights."""
+    pool, meta = storage.get_combined_with_meta(guild_id, kind, base)
+    key = (guild_id, kind, tag)
+    version = storage.guild_version(guild_id)
+    with _lock:
+        entry = _cache.get(key)
+        if entry is not None and entry[0] == version and entry[1] is base_tags and entry[2].pool is pool:
+            _cache.move_to_end(key)
+            metrics.cache_hit("sampling")
+            return entry[2]
+    metrics.cache_miss("sampling")
+    weighted = _build(pool, meta, base_tags, tag)
+    with _lock:
+        _cache[key] = (version, base_tags, weighted)
+        _cache.move_to_end(key)
+        while len(_cache) > SAMPLING_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return weighted
+
+
+def list_tags(guild_id: Optional[int], kind: str, base: Sequence[str], base_tags: BaseTags) -> Dict[str, int]:
+    """Tag -> number of enabled prompts carrying it (base defaults plus the guild's tags)."""
+    counts: Dict[str, int] = {}
+    if guild_id is None:
+        for tags in base_tags.values():
+            for t in tags:
+                counts[t] = counts.get(t, 0) + 1
+        return counts
+    for tags, _ in _entries(*storage.get_combined_with_meta(guild_id, kind, base), base_tags):
+        for t in set(tags):
+            counts[t] = counts.get(t, 0) + 1
+    return counts
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""Inverted-index search over base and custom prompts.
+
+Texts are accent-folded and split into word tokens; each index maps a token
+to the set of prompt ids containing it. The base corpus index is built once
+per base list; each guild's custom index is built on first use and then
+updated from storage commits (see prompt_index.py).
+"""
+import bisect
+import heapq
+import os
+import re
+import unicodedata
+from typing import Dict, Hashable, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+import storage
+from prompt_index import IndexCache
+
+SEARCH_CACHE_SIZE = int(os.getenv("AOUV_SEARCH_CACHE_SIZE", "256"))
+# The last query token also matches as a prefix once it is this long.
+MIN_PREFIX = 2
+
+_TOKEN_RE = re.compile(r"\w+")
+# Dropped from queries (unless nothing else is left): they match almost everything.
+STOPWORDS = frozenset(
+    "a au aux avec ce ces d de des du en et il je l la le les ma mes mon ne ou par pas pour qu que qui sa se ses son sur ta te tes ton tu un une vos votre".split()
+)
+
+
+def fold(text: str) -> str:
+    """Lowercase and strip accents: "Vérité" -> "verite"."""
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(fold(text))
+
+
+class InvertedIndex:
+    def __init__(self) -> None:
+        self.postings: Dict[str, Set[Hashable]] = {}
+        self._doc_tokens: Dict[Hashable, Tuple[str, ...]] = {}
+        self._vocab: Optional[List[str]] = None
+
+    def __len__(self) -> int:
+        return len(self._doc_tokens)
+
+    def add(self, doc_id: Hashable, text: str) -> None:
+        self.remove(doc_id)
+        tokens = tuple(set(tokenize(text)))
+        self._doc_tokens[doc_id] = tokens
+        for token in tokens:
+            posting = self.postings.get(token)
+            if posting is None:
+                self.postings[token] = {doc_id}
+                self._vocab = None
+            else:
+                posting.add(doc_id)
+
+    def remove(self, doc_id: Hashable) -> None:
+        for token in self._doc_tokens.pop(doc_id, ()):
+            posting = self.postings[token]
+            posting.discard(doc_id)
+            if not posting:
+                del self.postings[token]
+                self._vocab = None
+
+    def _prefix_matches(self, prefix: str) -> Set[Hashable]:
+        if self._vocab is None:
+            self._vocab = sorted(self.postings)
+        vocab = self._vocab
+        matches: Set[Hashable] = set()
+        i = bisect.bisect_left(vocab, prefix)
+        while i < len(vocab) and vocab[i].startswith(prefix):
+            matches |= self.postings[vocab[i]]
+            i += 1
+        return matches
+
+    def search(self, tokens: Sequence[str]) -> Set[Hashable]:
+        """Ids containing every token (the last one may be a prefix).
+
+        The returned set may be shared with the index: do not mutate it.
+        """
+        if not tokens:
+            return set()
+        sets = [self.postings.get(token, set()) for token in tokens[:-1]]
+        last = tokens[-1]
+        sets.append(self._prefix_matches(last) if len(last) >= MIN_PREFIX else self.postings.get(last, set()))
+        if len(sets) == 1:
+            return sets[0]
+        sets.sort(key=len)
+        if not sets[0]:
+            return set()
+        return sets[0].intersection(*sets[1:])
+
+
+class SearchResult(NamedTuple):
+    kind: str  # "action" or "verite"
+    source: str  # "base" or "custom"
+    ref: object  # 1-based number for base prompts, prompt id for custom ones
+    text: str
+
+
+_indexes: IndexCache[InvertedIndex] = IndexCache("search", InvertedIndex, SEARCH_CACHE_SIZE)
+
+
+def search(
+    guild_id: Optional[int],
+    query: str,
+    bases: Dict[str, Sequence[str]],
+    kinds: Sequence[str] = ("action", "verite"),
+    limit: int = 20,
+) -> Tuple[List[SearchResult], int]:
+    """Prompts matching every word of ``query``; returns (first ``limit`` results, total)."""
+    tokens = tokenize(query)
+    tokens = [t for t in tokens[:-1] if t not in STOPWORDS] + tokens[-1:] if len(tokens) > 1 else tokens
+    results: List[SearchResult] = []
+    total = 0
+    if not tokens:
+        return results, total
+    with _indexes.lock:
+        for kind in kinds:
+            base = bases[kind]
+            base_hits = _indexes.base(base).search(tokens)
+            total += len(base_hits)
+            for i in heapq.nsmallest(max(0, limit - len(results)), base_hits):  # type: ignore[type-var]
+                results.append(SearchResult(kind, "base", i + 1, base[i]))
+            if guild_id is None:
+                continue
+            custom_hits = _indexes.custom(guild_id, kind).search(tokens)
+            total += len(custom_hits)
+            if len(results) < limit and custom_hits:
+                texts = dict(storage.list_custom_prompts(guild_id, kind))
+                for pid in heapq.nsmallest(limit - len(results), custom_hits):  # type: ignore[type-var]
+                    if pid in texts:
+                        results.append(SearchResult(kind, "custom", pid, texts[pid]))
+    return results, total
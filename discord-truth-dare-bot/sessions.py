@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""Turn-based game sessions, one per (guild, channel).
+
+A session is a small slotted object: the players in join order and the index
+of the one whose turn it is (round robin). Idle sessions expire through a
+timing wheel: each session sits in the bucket of its deadline tick and only
+the buckets the cursor passes are looked at, so sessions that are not due
+cost nothing and no task or timer exists per game. Touching a session only
+updates its ``last_active``; a session found in an expiring bucket that was
+touched since is simply re-bucketed.
+
+Sessions live on the event loop. The table is snapshotted to disk at most
+every ``SESSION_SAVE_INTERVAL`` seconds when something changed, so games
+survive a restart.
+"""
+import json
+import os
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+import storage
+
+SESSION_TTL = float(os.getenv("AOUV_SESSION_TTL", "1800"))
+SESSION_TICK = float(os.getenv("AOUV_SESSION_TICK", "10"))
+SESSION_SAVE_INTERVAL = float(os.getenv("AOUV_SESSION_SAVE_INTERVAL", "30"))
+MAX_PLAYERS = 50
+
+SessionKey = Tuple[int, int]
+
+
+class Session:
+    __slots__ = ("guild_id", "channel_id", "players", "turn", "tag", "last_active")
+
+    def __init__(self, guild_id: int, channel_id: int, tag: Optional[str] = None) -> None:
+        self.guild_id = guild_id
+        self.channel_id = channel_id
+        self.players: List[int] = []
+        # Index in ``players`` of the current player; -1 before the first turn.
+        self.turn = -1
+        self.tag = tag
+        self.last_active = time.monotonic()
+
+    @property
+    def current(self) -> Optional[int]:
+        return self.players[self.turn] if 0 <= self.turn < len(self.players) else None
+
+    def advance(self) -> Optional[int]:
+        if not self.players:
+            return None
+        self.turn = (self.turn + 1) % len(self.players)
+        return self.players[self.turn]
+
+    def remove(self, user_id: int) -> bool:
+        try:
+            i = self.players.index(user_id)
+        except ValueError:
+            return False
+        del self.players[i]
+        # Keep the turn on the same player; if the current one left, the
+        # next ``advance`` lands on whoever followed them.
+        if i <= self.turn:
+            self.turn -= 1
+        return True
+
+
+class TimingWheel:
+    """Buckets of keys by deadline tick; ``due`` walks the ticks since the last call."""
+
+    def __init__(self, tick: float, horizon: float, now: Optional[float] = None) -> None:
+        self.tick = tick
+        self.size = int(horizon // tick) + 2
+        self._buckets: List[Set[SessionKey]] = [set() for _ in range(self.size)]
+        self._cursor = int((time.monotonic() if now is None else now) // tick)
+
+    def add(self, key: SessionKey, deadline: float) -> None:
+        # Never behind the cursor, never more than one lap ahead.
+        slot = min(max(int(deadline // self.tick) + 1, self._cursor + 1), self._cursor + self.size - 1)
+        self._buckets[slot % self.size].add(key)
+
+    def due(self, now: float) -> List[SessionKey]:
+        """Keys of every bucket whose tick has passed (they are removed from the wheel)."""
+        target = int(now // self.tick)
+        keys: List[SessionKey] = []
+        # A long pause cannot need more than one lap.
+        start = max(self._cursor + 1, target - self.size + 1)
+        for slot in range(start, target + 1):
+            bucket = self._buckets[slot % self.size]
+            if bucket:
+                keys.extend(bucket)
+                bucket.clear()
+        self._cursor = max(self._cursor, target)
+        return keys
+
+
+class SessionEngine:
+    def __init__(self, ttl: float = SESSION_TTL, tick: float = SESSION_TICK) -> None:
+        self.ttl = ttl
+        self._sessions: Dict[SessionKey, Session] = {}
+        self._wheel = TimingWheel(tick, ttl)
+        self.dirty = False
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def get(self, guild_id: int, channel_id: int) -> Optional[Session]:
+        return self._sessions.get((guild_id, channel_id))
+
+    def _touch(self, session: Session) -> None:
+        session.last_active = time.monotonic()
+        self.dirty = True
+
+    def start(self, guild_id: int, channel_id: int, host_id: int, tag: Optional[str] = None) -> Tuple[Session, bool]:
+        """(session, created): an existing session of the channel is returned as is."""
+        key = (guild_id, channel_id)
+        session = self._sessions.get(key)
+        if session is not None:
+            return session, False
+        session = Session(guild_id, channel_id, tag)
+        session.players.append(host_id)
+        self._sessions[key] = session
+        self._wheel.add(key, session.last_active + self.ttl)
+        self.dirty = True
+        return session, True
+
+    def join(self, session: Session, user_id: int) -> bool:
+        if user_id in session.players or len(session.players) >= MAX_PLAYERS:
+            return False
+        session.players.append(user_id)
+        self._touch(session)
+        return True
+
+    def leave(self, session: Session, user_id: int) -> bool:
+        """Remove a player; the session ends with its last player."""
+        if not session.remove(user_id):
+            return False
+        if not session.players:
+            self.end(session)
+        else:
+            self._touch(session)
+        return True
+
+    def next_player(self, session: Session) -> Optional[int]:
+        player = session.advance()
+        self._touch(session)
+        return player
+
+    def end(self, session: Session) -> None:
+        # Its wheel entry is dropped lazily when its bucket comes up.
+        if self._sessions.pop((session.guild_id, session.channel_id), None) is not None:
+            self.dirty = True
+
+    def expire(self, now: Optional[float] = None) -> List[Session]:
+        """End sessions idle for longer than ``ttl``. Returns them."""
+        now = time.monotonic() if now is None else now
+        expired: List[Session] = []
+        for key in self._wheel.due(now):
+            session = self._sessions.get(key)
+            if session is None:
+                continue
+            deadline = session.last_active + self.ttl
+            if deadline <= now:
+                del self._sessions[key]
+                expired.append(session)
+            else:
+                self._wheel.add(key, deadline)
+        if expired:
+            self.dirty = True
+        return expired
+
+    # ---- Persistence ----
+
+    def dumps(self) -> str:
+        """Serialize every session and clear ``dirty``. Call from the event loop.
+
+        The caller sets ``dirty`` again if writing the result fails.
+        """
+        now = time.monotonic()
+        state = {
+            f"{s.guild_id}:{s.channel_id}": [s.players, s.turn, s.tag, round(now - s.last_active, 1)]
+            for s in self._sessions.values()
+        }
+        self.dirty = False
+        return json.dumps({"saved_at": time.time(), "sessions": state}, separators=(",", ":"))
+
+    def load(self, path: str) -> None:
+        if not os.path.exists(path):
+            return
+        with open(path, "r", encoding="utf-8") as f:
+            raw = json.load(f)
+        downtime = max(0.0, time.time() - raw.get("saved_at", time.time()))
+        now = time.monotonic()
+        for key_str, (players, turn, tag, idle) in raw.get("sessions", {}).items():
+            idle += downtime
+            if idle >= self.ttl or not players:
+                continue
+            guild_id, channel_id = (int(part) for part in key_str.split(":"))
+            session = Session(guild_id, channel_id, tag)
+            session.players = [int(p) for p in players][:MAX_PLAYERS]
+            session.turn = min(int(turn), len(session.players) - 1)
+            session.last_active = now - idle
+            self._sessions[(guild_id, channel_id)] = session
+            self._wheel.add((guild_id, channel_id), session.last_active + self.ttl)
+
+
+def state_path(suffix: str = "") -> str:
+    """Session snapshot file; ``suffix`` keeps shard processes from sharing one."""
+    return os.path.join(storage.DATA_DIR, f"sessions{suffix}.json")
+
+
+engine = SessionEngine()
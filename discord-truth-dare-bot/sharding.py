@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""Shard layout of this process, from the environment.
+
+The bot is an ``AutoShardedBot``: by default one process runs every shard
+(count recommended by Discord). For larger deployments run N processes on
+the same data directory, each with ``AOUV_SHARD_COUNT`` set to the total and
+``AOUV_SHARD_IDS`` to the shards it owns (``"0-3"``, ``"4,5"``...). Guild
+config is shared through storage; process-local state (draw bags) gets a
+per-shard-range file.
+"""
+import os
+from typing import List, Optional
+
+
+def parse_shard_ids(value: str) -> Optional[List[int]]:
+    """ "0-2,5" -> [0, 1, 2, 5]; empty -> None (every shard)."""
+    ids: List[int] = []
+    for part in value.replace(" ", "").split(","):
+        if not part:
+            continue
+        start, sep, end = part.partition("-")
+        if sep:
+            ids.extend(range(int(start), int(end) + 1))
+        else:
+            ids.append(int(part))
+    return sorted(set(ids)) or None
+
+
+def parse_shard_count(value: str) -> Optional[int]:
+    """Number of shards; empty or "auto" -> None (asked to Discord)."""
+    value = value.strip().lower()
+    if value in ("", "auto"):
+        return None
+    count = int(value)
+    if count < 1:
+        raise ValueError("AOUV_SHARD_COUNT doit être au moins 1")
+    return count
+
+
+SHARD_COUNT = parse_shard_count(os.getenv("AOUV_SHARD_COUNT", ""))
+SHARD_IDS = parse_shard_ids(os.getenv("AOUV_SHARD_IDS", ""))
+
+if SHARD_IDS is not None:
+    if SHARD_COUNT is None:
+        raise ValueError("AOUV_SHARD_IDS nécessite AOUV_SHARD_COUNT")
+    if SHARD_IDS[-1] >= SHARD_COUNT:
+        raise ValueError(f"AOUV_SHARD_IDS doit être compris entre 0 et {SHARD_COUNT - 1}")
+
+
+def owns_global_tasks(shard_ids: Optional[List[int]] = SHARD_IDS) -> bool:
+    """Process-wide chores (command sync) run once: in the process owning shard 0."""
+    return shard_ids is None or 0 in shard_ids
+
+
+def state_suffix(shard_ids: Optional[List[int]] = SHARD_IDS) -> str:
+    """Suffix for process-local state files: "" for all shards, ".shards-0-3" otherwise."""
+    if shard_ids is None:
+        return ""
+    return ".shards-" + "-".join(str(i) for i in shard_ids)
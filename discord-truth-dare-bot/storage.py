@@ -1,18 +1,62 @@
 # -*- coding: utf-8 -*-
+import atexit
+import copy
 import json
+import logging
 import os
+import sqlite3
+import threading
 import uuid
-from dataclasses import dataclass, asdict
-from typing import Dict, List, Tuple, Optional
+from dataclasses import dataclass, asdict, field
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Tuple, Optional, Sequence
 
-DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+import metrics
+import packs
+from prompt_pool import PromptPool, mask_from_indices, mask_indices
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locking, run a single process.
+    fcntl = None  # type: ignore[assignment]
+
+DATA_DIR = os.getenv("AOUV_DATA_DIR") or os.path.join(os.path.dirname(__file__), "data")
 DATA_FILE = os.path.join(DATA_DIR, "config.json")
+SQLITE_FILE = os.path.join(DATA_DIR, "config.sqlite3")
+PACKS_FILE = os.path.join(DATA_DIR, "packs.json")
+
+# "json" (single config.json, fine for small installs), "journal"
+# (config.json snapshot + append-only journal) or "sqlite".
+STORAGE_BACKEND = os.getenv("AOUV_STORAGE", "json").lower()
+# Journal mode: compact into a new snapshot once the journal passes this size.
+JOURNAL_MAX_BYTES = int(os.getenv("AOUV_JOURNAL_MAX_BYTES", str(1024 * 1024)))
+# Write coalescing: mutations are visible immediately but reach the disk in
+# batches, at most FLUSH_DELAY seconds later or once FLUSH_MAX_PENDING
+# operations are waiting. FLUSH_DELAY=0 writes every mutation through.
+FLUSH_DELAY = float(os.getenv("AOUV_FLUSH_DELAY", "0.5"))
+FLUSH_MAX_PENDING = int(os.getenv("AOUV_FLUSH_MAX_PENDING", "100"))
+# Max number of (guild, kind) combined prompt pools kept in memory.
+POOL_CACHE_SIZE = int(os.getenv("AOUV_POOL_CACHE_SIZE", "1024"))
+
+
+DEFAULT_WEIGHT = 1.0
 
 
 @dataclass
 class CustomPrompt:
     id: str
     text: str
+    tags: List[str] = field(default_factory=list)
+    weight: float = DEFAULT_WEIGHT
+
+
+@dataclass
+class PromptMeta:
+    """Per-guild tags and draw weight of a base prompt."""
+
+    tags: List[str] = field(default_factory=list)
+    weight: float = DEFAULT_WEIGHT
 
 
 @dataclass
@@ -20,163 +64,1335 @@ class GuildConfig:
     channels: List[int]
     custom_actions: List[CustomPrompt]
     custom_truths: List[CustomPrompt]
-    disabled_actions: List[int]
-    disabled_truths: List[int]
+    # Bitmasks over the base lists: bit i set = base prompt i disabled.
+    disabled_actions: int
+    disabled_truths: int
+    # Base index -> tags/weight set by the guild; absent = no tags, weight 1.
+    base_meta_actions: Dict[int, PromptMeta] = field(default_factory=dict)
+    base_meta_truths: Dict[int, PromptMeta] = field(default_factory=dict)
+    # Ids of the shared packs the guild subscribed to, in draw-pool order.
+    packs: List[str] = field(default_factory=list)
+    # Pack id -> bitmask of the pack prompts the guild hid (or copied to edit).
+    pack_hidden_actions: Dict[str, int] = field(default_factory=dict)
+    pack_hidden_truths: Dict[str, int] = field(default_factory=dict)
 
 
 _DEFAULT_CONFIG: Dict[str, GuildConfig] = {}
 
+# A mutation is a small tuple such as ("add_channel", 123) or
+# ("add_prompt", "action", "1a2b3c4d", "texte"). Backends receive the list of
+# operations for one guild and persist only what they touch.
+Op = Tuple[Any, ...]
+
 
 def _ensure_data_dir() -> None:
     os.makedirs(DATA_DIR, exist_ok=True)
 
 
-def _read_store() -> Dict[str, GuildConfig]:
-    _ensure_data_dir()
-    if not os.path.exists(DATA_FILE):
-        return {}
-    with open(DATA_FILE, "r", encoding="utf-8") as f:
-        raw = json.load(f)
-    result: Dict[str, GuildConfig] = {}
-    for gid, conf in raw.items():
-        result[gid] = GuildConfig(
-            channels=list(conf.get("channels", [])),
-            custom_actions=[CustomPrompt(**cp) for cp in conf.get("custom_actions", [])],
-            custom_truths=[CustomPrompt(**cp) for cp in conf.get("custom_truths", [])],
-            disabled_actions=list(conf.get("disabled_actions", [])),
-            disabled_truths=list(conf.get("disabled_truths", [])),
-        )
-    return result
-
-
-def _write_store(store: Dict[str, GuildConfig]) -> None:
-    _ensure_data_dir()
-    serializable = {gid: asdict(conf) for gid, conf in store.items()}
-    tmp_file = DATA_FILE + ".tmp"
-    with open(tmp_file, "w", encoding="utf-8") as f:
-        json.dump(serializable, f, ensure_ascii=False, indent=2)
-    os.replace(tmp_file, DATA_FILE)
-
-
-def _get_or_create(store: Dict[str, GuildConfig], guild_id: int) -> GuildConfig:
-    key = str(guild_id)
-    if key not in store:
-        store[key] = GuildConfig(
-            channels=[],
-            custom_actions=[],
-            custom_truths=[],
-            disabled_actions=[],
-            disabled_truths=[],
-        )
-    return store[key]
+def _tmp_path(path: str) -> str:
+    """Temporary file name next to ``path``, unique per process and thread."""
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+class ProcessLock:
+    """Re-entrant lock shared by the threads of this process and, through
+    flock(2) on ``path``, by every process using the same data directory.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._fd: Optional[int] = None
+
+    def __enter__(self) -> "ProcessLock":
+        self._lock.acquire()
+        if self._depth == 0 and fcntl is not None:
+            try:
+                if self._fd is None:
+                    os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                    self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+            except BaseException:
+                self._lock.release()
+                raise
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self._depth -= 1
+        if self._depth == 0 and self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._lock.release()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._fd is not None and self._depth == 0:
+                os.close(self._fd)
+                self._fd = None
+
+
+def _empty_config() -> GuildConfig:
+    return GuildConfig(
+        channels=[],
+        custom_actions=[],
+        custom_truths=[],
+        disabled_actions=0,
+        disabled_truths=0,
+        base_meta_actions={},
+        base_meta_truths={},
+        packs=[],
+        pack_hidden_actions={},
+        pack_hidden_truths={},
+    )
+
+
+def _kind_key(kind: str) -> str:
+    return "action" if kind == "action" else "verite"
+
+
+def is_disabled(conf: GuildConfig, kind: str, index: int) -> bool:
+    mask = conf.disabled_actions if kind == "action" else conf.disabled_truths
+    return bool((mask >> index) & 1)
+
+
+def set_disabled(conf: GuildConfig, kind: str, index: int, disabled: bool) -> bool:
+    """Set or clear a disabled bit; returns True if it changed."""
+    if is_disabled(conf, kind, index) == disabled:
+        return False
+    if kind == "action":
+        conf.disabled_actions ^= 1 << index
+    else:
+        conf.disabled_truths ^= 1 << index
+    return True
+
+
+def base_meta(conf: GuildConfig, kind: str) -> Dict[int, PromptMeta]:
+    return conf.base_meta_actions if kind == "action" else conf.base_meta_truths
+
+
+def set_base_meta(conf: GuildConfig, kind: str, index: int, tags: Sequence[str], weight: float) -> None:
+    metas = base_meta(conf, kind)
+    if not tags and weight == DEFAULT_WEIGHT:
+        metas.pop(index, None)
+    else:
+        metas[index] = PromptMeta(tags=list(tags), weight=weight)
+
+
+def pack_hidden(conf: GuildConfig, kind: str) -> Dict[str, int]:
+    return conf.pack_hidden_actions if kind == "action" else conf.pack_hidden_truths
+
+
+def set_pack_hidden(conf: GuildConfig, kind: str, pack_id: str, index: int, hidden: bool) -> bool:
+    """Set or clear the hidden bit of a pack prompt; returns True if it changed."""
+    masks = pack_hidden(conf, kind)
+    mask = masks.get(pack_id, 0)
+    if bool((mask >> index) & 1) == hidden:
+        return False
+    mask ^= 1 << index
+    if mask:
+        masks[pack_id] = mask
+    else:
+        masks.pop(pack_id, None)
+    return True
+
+
+def _config_to_json(conf: GuildConfig) -> Dict[str, Any]:
+    # Disabled masks stay lists of indices on disk, as before.
+    data: Dict[str, Any] = {
+        "channels": conf.channels,
+        "custom_actions": [asdict(p) for p in conf.custom_actions],
+        "custom_truths": [asdict(p) for p in conf.custom_truths],
+        "disabled_actions": mask_indices(conf.disabled_actions),
+        "disabled_truths": mask_indices(conf.disabled_truths),
+    }
+    for key, metas in (("base_meta_actions", conf.base_meta_actions), ("base_meta_truths", conf.base_meta_truths)):
+        if metas:
+            data[key] = {str(i): asdict(m) for i, m in sorted(metas.items())}
+    if conf.packs:
+        data["packs"] = conf.packs
+    for key, masks in (("pack_hidden_actions", conf.pack_hidden_actions), ("pack_hidden_truths", conf.pack_hidden_truths)):
+        if masks:
+            data[key] = {pid: mask_indices(mask) for pid, mask in sorted(masks.items())}
+    return data
+
+
+def _meta_from_json(raw: Dict[str, Any]) -> Dict[int, PromptMeta]:
+    return {int(i): PromptMeta(**m) for i, m in raw.items()}
+
+
+def _pack_masks_from_json(raw: Dict[str, Any]) -> Dict[str, int]:
+    return {pid: mask_from_indices(indices) for pid, indices in raw.items() if indices}
+
+
+def _apply_ops(conf: GuildConfig, ops: Sequence[Op]) -> None:
+    """Apply a batch of mutations to an in-memory config. Every op is idempotent."""
+    # Custom prompts by id, per kind, built on first use within the batch so
+    # large imports stay linear.
+    by_id: Dict[str, Dict[str, CustomPrompt]] = {}
+    for op in ops:
+        _apply_op(conf, op, by_id)
+
+
+def _prompts_by_id(conf: GuildConfig, kind: str, by_id: Dict[str, Dict[str, CustomPrompt]]) -> Dict[str, CustomPrompt]:
+    key = _kind_key(kind)
+    prompts = by_id.get(key)
+    if prompts is None:
+        target = conf.custom_actions if key == "action" else conf.custom_truths
+        prompts = by_id[key] = {p.id: p for p in target}
+    return prompts
+
+
+def _apply_op(conf: GuildConfig, op: Op, by_id: Dict[str, Dict[str, CustomPrompt]]) -> None:
+    name = op[0]
+    if name == "add_channel":
+        if op[1] not in conf.channels:
+            conf.channels.append(op[1])
+    elif name == "remove_channel":
+        if op[1] in conf.channels:
+            conf.channels.remove(op[1])
+    elif name == "add_prompt":
+        prompts = _prompts_by_id(conf, op[1], by_id)
+        if op[2] not in prompts:
+            prompt = CustomPrompt(id=op[2], text=op[3])
+            (conf.custom_actions if op[1] == "action" else conf.custom_truths).append(prompt)
+            prompts[op[2]] = prompt
+    elif name == "edit_prompt":
+        prompt = _prompts_by_id(conf, op[1], by_id).get(op[2])
+        if prompt is not None:
+            prompt.text = op[3]
+    elif name == "remove_prompt":
+        if _prompts_by_id(conf, op[1], by_id).pop(op[2], None) is not None:
+            target = conf.custom_actions if op[1] == "action" else conf.custom_truths
+            target[:] = [p for p in target if p.id != op[2]]
+    elif name == "set_prompt_meta":
+        # ("set_prompt_meta", kind, id, tags, weight)
+        prompt = _prompts_by_id(conf, op[1], by_id).get(op[2])
+        if prompt is not None:
+            prompt.tags = list(op[3])
+            prompt.weight = op[4]
+    elif name == "disable_base":
+        set_disabled(conf, op[1], op[2], True)
+    elif name == "enable_base":
+        set_disabled(conf, op[1], op[2], False)
+    elif name == "set_base_meta":
+        # ("set_base_meta", kind, index, tags, weight)
+        set_base_meta(conf, op[1], op[2], op[3], op[4])
+    elif name == "subscribe_pack":
+        if op[1] not in conf.packs:
+            conf.packs.append(op[1])
+    elif name == "unsubscribe_pack":
+        if op[1] in conf.packs:
+            conf.packs.remove(op[1])
+    elif name == "hide_pack_prompt":
+        # ("hide_pack_prompt", kind, pack_id, index)
+        set_pack_hidden(conf, op[1], op[2], op[3], True)
+    elif name == "show_pack_prompt":
+        set_pack_hidden(conf, op[1], op[2], op[3], False)
+    else:
+        raise ValueError(f"Unknown storage operation: {name}")
+
+
+class StorageBackend:
+    """Persistence interface behind the module-level helpers.
+
+    ``load_guild`` may return a shared object: callers must not mutate it.
+    ``apply_many`` persists operations for several guilds in one write; the
+    operations of each guild are applied atomically.
+    ``generation`` changes whenever the backend had to reload everything
+    (e.g. the file was rewritten by another process), which invalidates every
+    derived cache. ``guild_seq`` changes when a guild was modified by another
+    process, which invalidates the caches of that guild only.
+    """
+
+    name = "base"
+
+    def generation(self) -> int:
+        return 0
+
+    def guild_seq(self, guild_id: int) -> int:
+        return 0
+
+    def load_guild(self, guild_id: int) -> GuildConfig:
+        raise NotImplementedError
+
+    def apply(self, guild_id: int, ops: Sequence[Op]) -> None:
+        self.apply_many([(guild_id, ops)])
+
+    def apply_many(self, batch: Sequence[Tuple[int, Sequence[Op]]]) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class JsonBackend(StorageBackend):
+    """Whole store in one JSON file, kept resident in memory.
+
+    The file is loaded once and then served from memory; mutations write
+    through to disk. The file signature (mtime, size, inode) is re-checked on
+    every access so edits made outside the process are picked up. Reloads and
+    read-modify-write cycles hold a lock file, so several bot processes can
+    share the same data directory without losing each other's updates.
+    """
+
+    name = "json"
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = ProcessLock(path + ".lock")
+        self._store: Optional[Dict[str, GuildConfig]] = None
+        self._sig: Optional[Tuple[int, int, int]] = None
+        self._generation = 0
+
+    def _file_signature(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def _load_file(self) -> Dict[str, GuildConfig]:
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, "rb") as f:
+            data = f.read()
+        metrics.storage_bytes.inc(self.name, "read", amount=len(data))
+        raw = json.loads(data)
+        result: Dict[str, GuildConfig] = {}
+        for gid, conf in raw.items():
+            result[gid] = GuildConfig(
+                channels=list(conf.get("channels", [])),
+                custom_actions=[CustomPrompt(**cp) for cp in conf.get("custom_actions", [])],
+                custom_truths=[CustomPrompt(**cp) for cp in conf.get("custom_truths", [])],
+                disabled_actions=mask_from_indices(conf.get("disabled_actions", [])),
+                disabled_truths=mask_from_indices(conf.get("disabled_truths", [])),
+                base_meta_actions=_meta_from_json(conf.get("base_meta_actions", {})),
+                base_meta_truths=_meta_from_json(conf.get("base_meta_truths", {})),
+                packs=list(conf.get("packs", [])),
+                pack_hidden_actions=_pack_masks_from_json(conf.get("pack_hidden_actions", {})),
+                pack_hidden_truths=_pack_masks_from_json(conf.get("pack_hidden_truths", {})),
+            )
+        return result
+
+    def read_store(self) -> Dict[str, GuildConfig]:
+        """Return the resident store, reloading it only if the file changed on disk."""
+        store = self._store
+        if store is not None and self._file_signature() == self._sig:
+            return store
+        with self._lock:
+            sig = self._file_signature()
+            if self._store is None or sig != self._sig:
+                _ensure_data_dir()
+                with metrics.storage_seconds.time(self.name, "read"):
+                    self._store = self._load_file()
+                metrics.storage_ops.inc(self.name, "read")
+                self._sig = sig
+                self._generation += 1
+            return self._store
+
+    def write_store(self, store: Dict[str, GuildConfig]) -> None:
+        with self._lock:
+            _ensure_data_dir()
+            serializable = {gid: _config_to_json(conf) for gid, conf in store.items()}
+            data = json.dumps(serializable, ensure_ascii=False, indent=2).encode("utf-8")
+            tmp_file = _tmp_path(self.path)
+            try:
+                with open(tmp_file, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_file, self.path)
+            except BaseException:
+                # The in-memory copy was already mutated; drop it so the next
+                # access reloads the last state that actually reached the disk.
+                self._store = None
+                raise
+            metrics.storage_bytes.inc(self.name, "write", amount=len(data))
+            self._store = store
+            self._sig = self._file_signature()
+
+    def generation(self) -> int:
+        self.read_store()
+        return self._generation
+
+    def load_guild(self, guild_id: int) -> GuildConfig:
+        conf = self.read_store().get(str(guild_id))
+        return conf if conf is not None else _empty_config()
+
+    def close(self) -> None:
+        self._lock.close()
+
+    def apply_many(self, batch: Sequence[Tuple[int, Sequence[Op]]]) -> None:
+        with self._lock:
+            store = self.read_store()
+            for guild_id, ops in batch:
+                conf = store.setdefault(str(guild_id), _empty_config())
+                _apply_ops(conf, ops)
+            self.write_store(store)
+
+
+class JournalBackend(JsonBackend):
+    """config.json snapshot plus an append-only journal of operations.
+
+    Each commit appends one line ``[guild_id, [op, ...]]`` and fsyncs it, so a
+    write costs O(record). On load the snapshot is read and the journal tail
+    replayed; a torn last line (crash mid-append) is ignored. Once the journal
+    passes ``max_bytes`` a background thread rotates it to ``.old``, writes a
+    new snapshot atomically and deletes the rotated journal. Replaying an
+    already-included journal is harmless because every operation is idempotent.
+
+    Several processes may share the files: appends and reloads hold the lock
+    file, and records appended by other processes are replayed incrementally,
+    bumping ``guild_seq`` for the guilds they touch.
+    """
+
+    name = "journal"
+
+    def __init__(self, path: str, max_bytes: int = JOURNAL_MAX_BYTES) -> None:
+        super().__init__(path)
+        self.journal_path = path + ".journal"
+        self.max_bytes = max_bytes
+        self._journal_offset = 0
+        # Inode of the journal file the offset refers to (None: no journal).
+        self._journal_ino: Optional[int] = None
+        self._guild_seqs: Dict[str, int] = {}
+        self._compacting = False
+        self._compact_lock = ProcessLock(path + ".compact.lock")
+
+    def _journal_stat(self) -> Tuple[Optional[int], int]:
+        try:
+            st = os.stat(self.journal_path)
+        except FileNotFoundError:
+            return None, 0
+        return st.st_ino, st.st_size
+
+    def _replay(self, path: str, offset: int) -> int:
+        """Apply complete journal records after ``offset``; return the new offset."""
+        try:
+            with open(path, "rb") as f:
+                f.seek(offset)
+                data = f.read()
+        except FileNotFoundError:
+            return offset
+        metrics.storage_bytes.inc(self.name, "read", amount=len(data))
+        assert self._store is not None
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            if not line.strip():
+                continue
+            try:
+                guild_id, ops = json.loads(line)
+            except ValueError:
+                logging.warning("Enregistrement de journal illisible ignoré dans %s", path)
+                continue
+            gid = str(guild_id)
+            _apply_ops(self._store.setdefault(gid, _empty_config()), ops)
+            self._guild_seqs[gid] = self._guild_seqs.get(gid, 0) + 1
+        return offset + end
+
+    def read_store(self) -> Dict[str, GuildConfig]:
+        store = self._store
+        if (
+            store is not None
+            and self._file_signature() == self._sig
+            and self._journal_stat() == (self._journal_ino, self._journal_offset)
+        ):
+            return store
+        with self._lock:
+            sig = self._file_signature()
+            ino, size = self._journal_stat()
+            if self._store is None or sig != self._sig or ino != self._journal_ino or size < self._journal_offset:
+                # First load, new snapshot or rotated journal: start over.
+                _ensure_data_dir()
+                with metrics.storage_seconds.time(self.name, "read"):
+                    self._store = self._load_file()
+                    self._sig = sig
+                    self._replay(self.journal_path + ".old", 0)
+                    self._journal_offset = self._replay(self.journal_path, 0)
+                metrics.storage_ops.inc(self.name, "read")
+                self._journal_ino = ino
+                self._generation += 1
+            elif size > self._journal_offset:
+                # Records appended by another process.
+                with metrics.storage_seconds.time(self.name, "replay"):
+                    self._journal_offset = self._replay(self.journal_path, self._journal_offset)
+                metrics.storage_ops.inc(self.name, "replay")
+            return self._store
+
+    def guild_seq(self, guild_id: int) -> int:
+        self.read_store()
+        return self._guild_seqs.get(str(guild_id), 0)
+
+    def apply_many(self, batch: Sequence[Tuple[int, Sequence[Op]]]) -> None:
+        with self._lock:
+            # Catches up with other writers first, so anything past the
+            # offset afterwards is a torn record.
+            store = self.read_store()
+            data = b"".join(
+                (json.dumps([guild_id, list(ops)], ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+                for guild_id, ops in batch
+            )
+            with open(self.journal_path, "ab") as f:
+                if f.tell() > self._journal_offset:
+                    # Torn record left by a crash: drop it before appending.
+                    f.truncate(self._journal_offset)
+                    f.seek(self._journal_offset)
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+                self._journal_ino = os.fstat(f.fileno()).st_ino
+            metrics.storage_bytes.inc(self.name, "write", amount=len(data))
+            self._journal_offset += len(data)
+            for guild_id, ops in batch:
+                conf = store.setdefault(str(guild_id), _empty_config())
+                _apply_ops(conf, ops)
+            if self._journal_offset > self.max_bytes and not self._compacting:
+                self._compacting = True
+                threading.Thread(target=self._compact_in_background, name="aouv-journal-compact", daemon=True).start()
+
+    def _compact_in_background(self) -> None:
+        try:
+            self.compact()
+        except Exception:
+            logging.exception("Échec de la compaction du journal de configuration")
+        finally:
+            self._compacting = False
+
+    def compact(self) -> None:
+        """Fold the journal into a fresh snapshot."""
+        old_path = self.journal_path + ".old"
+        with self._compact_lock:
+            with self._lock:
+                store = self.read_store()
+                if self._journal_offset == 0 and not os.path.exists(old_path):
+                    return
+                serializable = {gid: _config_to_json(conf) for gid, conf in store.items()}
+                if not os.path.exists(old_path):
+                    os.replace(self.journal_path, old_path)
+                elif self._journal_offset:
+                    # A previous compaction died before its snapshot landed; the
+                    # new snapshot covers both journals, so fold this one in.
+                    with open(self.journal_path, "rb") as src, open(old_path, "ab") as dst:
+                        dst.write(src.read(self._journal_offset))
+                        dst.flush()
+                        os.fsync(dst.fileno())
+                    os.remove(self.journal_path)
+                self._journal_offset = 0
+                self._journal_ino = None
+            # Serialization and the snapshot write happen outside the store
+            # lock, so writers keep appending to the new journal meanwhile.
+            data = json.dumps(serializable, ensure_ascii=False, indent=2).encode("utf-8")
+            tmp_file = _tmp_path(self.path)
+            with open(tmp_file, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            metrics.storage_bytes.inc(self.name, "compact", amount=len(data))
+            with self._lock:
+                os.replace(tmp_file, self.path)
+                self._sig = self._file_signature()
+                # Under the lock: a process reloading meanwhile must see either
+                # the old snapshot with .old, or the new one.
+                os.remove(old_path)
+
+    def close(self) -> None:
+        self.compact()
+        self._compact_lock.close()
+        super().close()
+
+
+_SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS channels (
+    guild_id INTEGER NOT NULL,
+    channel_id INTEGER NOT NULL,
+    UNIQUE (guild_id, channel_id)
+);
+CREATE TABLE IF NOT EXISTS custom_prompts (
+    guild_id INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    id TEXT NOT NULL,
+    text TEXT NOT NULL,
+    tags TEXT NOT NULL DEFAULT '',
+    weight REAL NOT NULL DEFAULT 1.0,
+    UNIQUE (guild_id, kind, id)
+);
+CREATE TABLE IF NOT EXISTS disabled_base (
+    guild_id INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    PRIMARY KEY (guild_id, kind, idx)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS base_meta (
+    guild_id INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    tags TEXT NOT NULL,
+    weight REAL NOT NULL,
+    PRIMARY KEY (guild_id, kind, idx)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS pack_subscriptions (
+    guild_id INTEGER NOT NULL,
+    pack_id TEXT NOT NULL,
+    UNIQUE (guild_id, pack_id)
+);
+CREATE TABLE IF NOT EXISTS pack_hidden (
+    guild_id INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    pack_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    PRIMARY KEY (guild_id, kind, pack_id, idx)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS guild_seq (
+    guild_id INTEGER PRIMARY KEY,
+    seq INTEGER NOT NULL
+);
+"""
+
+# Columns added to existing databases on open: (table, column, definition).
+_SQLITE_MIGRATIONS = [
+    ("custom_prompts", "tags", "TEXT NOT NULL DEFAULT ''"),
+    ("custom_prompts", "weight", "REAL NOT NULL DEFAULT 1.0"),
+]
+
+
+def _tags_to_sql(tags: Sequence[str]) -> str:
+    return ",".join(tags)
+
+
+def _tags_from_sql(value: str) -> List[str]:
+    return value.split(",") if value else []
+
+
+class SqliteBackend(StorageBackend):
+    """One row per channel / custom prompt / disabled index, keyed by guild_id.
+
+    Reads and writes only touch the rows of the guild involved. The database
+    runs in WAL mode so readers never wait for the writer; each thread gets its
+    own connection. Every commit bumps the guild's row in ``guild_seq``; other
+    processes notice through ``PRAGMA data_version`` and re-read the sequence
+    of the guilds they look at, so only those caches are invalidated.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str, import_json: Optional[str] = None) -> None:
+        self.path = path
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._conn_lock = threading.Lock()
+        # Dedicated connection for change detection (data_version is per connection).
+        self._watch: Optional[sqlite3.Connection] = None
+        self._watch_lock = threading.Lock()
+        self._data_version: Optional[int] = None
+        self._seqs: Dict[int, int] = {}
+        _ensure_data_dir()
+        fresh = not os.path.exists(path)
+        conn = self._conn()
+        conn.executescript(_SQLITE_SCHEMA)
+        for table, column, definition in _SQLITE_MIGRATIONS:
+            columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+            if column not in columns:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+        if fresh and import_json and os.path.exists(import_json):
+            self._import_store(JsonBackend(import_json).read_store())
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._conn_lock:
+                self._connections.append(conn)
+        return conn
+
+    def _import_store(self, store: Dict[str, GuildConfig]) -> None:
+        for gid, conf in store.items():
+            ops: List[Op] = [("add_channel", cid) for cid in conf.channels]
+            ops += [("add_prompt", "action", p.id, p.text) for p in conf.custom_actions]
+            ops += [("add_prompt", "verite", p.id, p.text) for p in conf.custom_truths]
+            ops += [("disable_base", "action", i) for i in mask_indices(conf.disabled_actions)]
+            ops += [("disable_base", "verite", i) for i in mask_indices(conf.disabled_truths)]
+            for kind, prompts in (("action", conf.custom_actions), ("verite", conf.custom_truths)):
+                ops += [("set_prompt_meta", kind, p.id, p.tags, p.weight) for p in prompts if p.tags or p.weight != DEFAULT_WEIGHT]
+            for kind in ("action", "verite"):
+                ops += [("set_base_meta", kind, i, m.tags, m.weight) for i, m in base_meta(conf, kind).items()]
+            ops += [("subscribe_pack", pid) for pid in conf.packs]
+            for kind in ("action", "verite"):
+                for pid, mask in pack_hidden(conf, kind).items():
+                    ops += [("hide_pack_prompt", kind, pid, i) for i in mask_indices(mask)]
+            self.apply(int(gid), ops)
+
+    def load_guild(self, guild_id: int) -> GuildConfig:
+        with metrics.storage_seconds.time(self.name, "read"):
+            conf = self._select_guild(guild_id)
+        metrics.storage_ops.inc(self.name, "read")
+        return conf
+
+    def _select_guild(self, guild_id: int) -> GuildConfig:
+        conn = self._conn()
+        conf = _empty_config()
+        conf.channels = [
+            row[0]
+            for row in conn.execute(
+                "SELECT channel_id FROM channels WHERE guild_id = ? ORDER BY rowid", (guild_id,)
+            )
+        ]
+        for kind, pid, text, tags, weight in conn.execute(
+            "SELECT kind, id, text, tags, weight FROM custom_prompts WHERE guild_id = ? ORDER BY rowid", (guild_id,)
+        ):
+            target = conf.custom_actions if kind == "action" else conf.custom_truths
+            target.append(CustomPrompt(id=pid, text=text, tags=_tags_from_sql(tags), weight=weight))
+        for kind, idx in conn.execute(
+            "SELECT kind, idx FROM disabled_base WHERE guild_id = ?", (guild_id,)
+        ):
+            set_disabled(conf, kind, idx, True)
+        for kind, idx, tags, weight in conn.execute(
+            "SELECT kind, idx, tags, weight FROM base_meta WHERE guild_id = ?", (guild_id,)
+        ):
+            set_base_meta(conf, kind, idx, _tags_from_sql(tags), weight)
+        conf.packs = [
+            row[0]
+            for row in conn.execute(
+                "SELECT pack_id FROM pack_subscriptions WHERE guild_id = ? ORDER BY rowid", (guild_id,)
+            )
+        ]
+        for kind, pack_id, idx in conn.execute(
+            "SELECT kind, pack_id, idx FROM pack_hidden WHERE guild_id = ?", (guild_id,)
+        ):
+            set_pack_hidden(conf, kind, pack_id, idx, True)
+        return conf
+
+    def _execute_op(self, conn: sqlite3.Connection, guild_id: int, op: Op) -> None:
+        name = op[0]
+        if name == "add_channel":
+            conn.execute("INSERT OR IGNORE INTO channels (guild_id, channel_id) VALUES (?, ?)", (guild_id, op[1]))
+        elif name == "remove_channel":
+            conn.execute("DELETE FROM channels WHERE guild_id = ? AND channel_id = ?", (guild_id, op[1]))
+        elif name == "add_prompt":
+            conn.execute(
+                "INSERT OR IGNORE INTO custom_prompts (guild_id, kind, id, text) VALUES (?, ?, ?, ?)",
+                (guild_id, _kind_key(op[1]), op[2], op[3]),
+            )
+        elif name == "edit_prompt":
+            conn.execute(
+                "UPDATE custom_prompts SET text = ? WHERE guild_id = ? AND kind = ? AND id = ?",
+                (op[3], guild_id, _kind_key(op[1]), op[2]),
+            )
+        elif name == "remove_prompt":
+            conn.execute(
+                "DELETE FROM custom_prompts WHERE guild_id = ? AND kind = ? AND id = ?",
+                (guild_id, _kind_key(op[1]), op[2]),
+            )
+        elif name == "set_prompt_meta":
+            conn.execute(
+                "UPDATE custom_prompts SET tags = ?, weight = ? WHERE guild_id = ? AND kind = ? AND id = ?",
+                (_tags_to_sql(op[3]), op[4], guild_id, _kind_key(op[1]), op[2]),
+            )
+        elif name == "disable_base":
+            conn.execute(
+                "INSERT OR IGNORE INTO disabled_base (guild_id, kind, idx) VALUES (?, ?, ?)",
+                (guild_id, _kind_key(op[1]), op[2]),
+            )
+        elif name == "enable_base":
+            conn.execute(
+                "DELETE FROM disabled_base WHERE guild_id = ? AND kind = ? AND idx = ?",
+                (guild_id, _kind_key(op[1]), op[2]),
+            )
+        elif name == "set_base_meta":
+            if not op[3] and op[4] == DEFAULT_WEIGHT:
+                conn.execute(
+                    "DELETE FROM base_meta WHERE guild_id = ? AND kind = ? AND idx = ?",
+                    (guild_id, _kind_key(op[1]), op[2]),
+                )
+            else:
+                conn.execute(
+                    "INSERT OR REPLACE INTO base_meta (guild_id, kind, idx, tags, weight) VALUES (?, ?, ?, ?, ?)",
+                    (guild_id, _kind_key(op[1]), op[2], _tags_to_sql(op[3]), op[4]),
+                )
+        elif name == "subscribe_pack":
+            conn.execute("INSERT OR IGNORE INTO pack_subscriptions (guild_id, pack_id) VALUES (?, ?)", (guild_id, op[1]))
+        elif name == "unsubscribe_pack":
+            conn.execute("DELETE FROM pack_subscriptions WHERE guild_id = ? AND pack_id = ?", (guild_id, op[1]))
+        elif name == "hide_pack_prompt":
+            conn.execute(
+                "INSERT OR IGNORE INTO pack_hidden (guild_id, kind, pack_id, idx) VALUES (?, ?, ?, ?)",
+                (guild_id, _kind_key(op[1]), op[2], op[3]),
+            )
+        elif name == "show_pack_prompt":
+            conn.execute(
+                "DELETE FROM pack_hidden WHERE guild_id = ? AND kind = ? AND pack_id = ? AND idx = ?",
+                (guild_id, _kind_key(op[1]), op[2], op[3]),
+            )
+        else:
+            raise ValueError(f"Unknown storage operation: {name}")
+
+    def apply_many(self, batch: Sequence[Tuple[int, Sequence[Op]]]) -> None:
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for guild_id, ops in batch:
+                for op in ops:
+                    self._execute_op(conn, guild_id, op)
+                conn.execute(
+                    "INSERT INTO guild_seq (guild_id, seq) VALUES (?, 1) "
+                    "ON CONFLICT (guild_id) DO UPDATE SET seq = seq + 1",
+                    (guild_id,),
+                )
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def guild_seq(self, guild_id: int) -> int:
+        with self._watch_lock:
+            if self._watch is None:
+                self._watch = sqlite3.connect(self.path, isolation_level=None, timeout=30, check_same_thread=False)
+            (data_version,) = self._watch.execute("PRAGMA data_version").fetchone()
+            if data_version != self._data_version:
+                # Some other connection committed since the last check.
+                self._data_version = data_version
+                self._seqs.clear()
+            seq = self._seqs.get(guild_id)
+            if seq is None:
+                row = self._watch.execute("SELECT seq FROM guild_seq WHERE guild_id = ?", (guild_id,)).fetchone()
+                seq = self._seqs[guild_id] = row[0] if row else 0
+            return seq
+
+    def close(self) -> None:
+        with self._watch_lock:
+            if self._watch is not None:
+                self._watch.close()
+                self._watch = None
+        with self._conn_lock:
+            for conn in self._connections:
+                try:
+                    conn.close()
+                except sqlite3.ProgrammingError:
+                    # Connection owned by another thread; it dies with it.
+                    pass
+            self._connections.clear()
+        self._local = threading.local()
+
+
+# Serializes read-check-write sequences in the helpers below.
+_lock = threading.RLock()
+_backend_instance: Optional[StorageBackend] = None
+_pack_library: Optional[packs.PackLibrary] = None
+
+# Per-guild config version, bumped after every committed mutation. Combined
+# with the backend generation it keys every cache derived from a guild config.
+_versions: Dict[int, int] = {}
+
+# (guild_id, kind) -> (version, base list, pack generation, combined pool), in LRU order.
+_pool_cache: "OrderedDict[Tuple[int, str], Tuple[Tuple[int, int, int], Sequence[str], int, PromptPool, PoolMeta]]" = OrderedDict()
+_pool_lock = threading.Lock()
+
+# Called as callback(guild_id, ops, version before the commit) after every
+# commit, so in-memory indexes derived from guild configs can follow changes
+# incrementally.
+_listeners: List[Callable[[int, Sequence[Op], Tuple[int, int, int]], None]] = []
+
+# Write coalescing state: operations not yet handed to the backend, and for
+# each affected guild a private copy of its config with those ops applied.
+_pending: Dict[int, List[Op]] = {}
+_overlay: Dict[int, GuildConfig] = {}
+_pending_count = 0
+_flush_timer: Optional[threading.Timer] = None
+
+
+def _make_backend(name: str) -> StorageBackend:
+    if name == "json":
+        return JsonBackend(DATA_FILE)
+    if name == "journal":
+        return JournalBackend(DATA_FILE)
+    if name == "sqlite":
+        # First start on SQLite: import an existing config.json if present.
+        return SqliteBackend(SQLITE_FILE, import_json=DATA_FILE)
+    raise ValueError(f"Unknown storage backend: {name!r} (expected 'json', 'journal' or 'sqlite')")
+
+
+def _backend() -> StorageBackend:
+    global _backend_instance
+    if _backend_instance is None:
+        with _lock:
+            if _backend_instance is None:
+                _backend_instance = _make_backend(STORAGE_BACKEND)
+    return _backend_instance
+
+
+def _packs() -> packs.PackLibrary:
+    global _pack_library
+    if _pack_library is None:
+        with _lock:
+            if _pack_library is None:
+                _pack_library = packs.PackLibrary(PACKS_FILE, ProcessLock(PACKS_FILE + ".lock"))
+    return _pack_library
+
+
+def configure(backend: Optional[str] = None, data_dir: Optional[str] = None) -> None:
+    """Switch backend and/or data directory (closes the current backend)."""
+    global _backend_instance, _pack_library, STORAGE_BACKEND, DATA_DIR, DATA_FILE, SQLITE_FILE, PACKS_FILE
+    with _lock:
+        flush()
+        if _backend_instance is not None:
+            _backend_instance.close()
+            _backend_instance = None
+        _pack_library = None
+        _versions.clear()
+        with _pool_lock:
+            _pool_cache.clear()
+        if backend is not None:
+            STORAGE_BACKEND = backend.lower()
+        if data_dir is not None:
+            DATA_DIR = data_dir
+            DATA_FILE = os.path.join(DATA_DIR, "config.json")
+            SQLITE_FILE = os.path.join(DATA_DIR, "config.sqlite3")
+            PACKS_FILE = os.path.join(DATA_DIR, "packs.json")
+
+
+def _apply_many(batch: Sequence[Tuple[int, Sequence[Op]]]) -> None:
+    backend = _backend()
+    with metrics.storage_seconds.time(backend.name, "write"):
+        backend.apply_many(batch)
+    metrics.storage_ops.inc(backend.name, "write")
+
+
+def _load(guild_id: int) -> GuildConfig:
+    conf = _overlay.get(guild_id)
+    return conf if conf is not None else _backend().load_guild(guild_id)
+
+
+def _commit(guild_id: int, ops: Sequence[Op]) -> None:
+    global _pending_count, _flush_timer
+    if not ops:
+        return
+    with _lock:
+        before = guild_version(guild_id) if _listeners else (0, 0, 0)
+        flush_now = False
+        if FLUSH_DELAY <= 0:
+            _apply_many([(guild_id, ops)])
+        else:
+            conf = _overlay.get(guild_id)
+            if conf is None:
+                conf = copy.deepcopy(_backend().load_guild(guild_id))
+            _apply_ops(conf, ops)
+            _overlay[guild_id] = conf
+            _pending.setdefault(guild_id, []).extend(ops)
+            _pending_count += len(ops)
+            if _pending_count >= FLUSH_MAX_PENDING:
+                flush_now = True
+            elif _flush_timer is None:
+                _flush_timer = threading.Timer(FLUSH_DELAY, _flush_in_background)
+                _flush_timer.daemon = True
+                _flush_timer.start()
+        # From here on the change is visible to reads: caches must follow.
+        _versions[guild_id] = _versions.get(guild_id, 0) + 1
+        for callback in _listeners:
+            try:
+                callback(guild_id, ops, before)
+            except Exception:
+                logging.exception("Échec d'un observateur de configuration")
+        if flush_now:
+            # The ops stay pending and flush() armed a retry if this fails,
+            # so the commit itself succeeded.
+            _flush_in_background()
+
+
+def add_listener(callback: Callable[[int, Sequence[Op], Tuple[int, int, int]], None]) -> None:
+    """Register ``callback(guild_id, ops, before)``, run after each commit in the committing thread.
+
+    ``before`` is the ``guild_version`` just before the commit. Listeners must
+    be quick and must not call back into storage writes. Changes picked up
+    from outside the process are not reported: state derived from a version
+    other than ``before`` missed some of them and must be rebuilt rather
+    than patched with ``ops``.
+    """
+    _listeners.append(callback)
+
+
+def _flush_in_background() -> None:
+    try:
+        flush()
+    except Exception:
+        logging.exception("Échec de l'écriture différée de la configuration")
+
+
+def flush() -> None:
+    """Write every pending mutation to the backend in a single batch."""
+    global _pending_count, _flush_timer
+    with _lock:
+        if _flush_timer is not None:
+            _flush_timer.cancel()
+            _flush_timer = None
+        if not _pending:
+            return
+        batch = list(_pending.items())
+        try:
+            _apply_many(batch)
+        except BaseException:
+            # Keep everything pending and retry on the next window.
+            _flush_timer = threading.Timer(max(FLUSH_DELAY, 1.0), _flush_in_background)
+            _flush_timer.daemon = True
+            _flush_timer.start()
+            raise
+        _pending.clear()
+        _overlay.clear()
+        _pending_count = 0
+
+
+atexit.register(flush)
+
+
+def guild_version(guild_id: int) -> Tuple[int, int, int]:
+    """Opaque version of a guild config; changes whenever the config may have changed.
+
+    Covers commits made by this process and, through the backend, by other
+    processes sharing the same data.
+    """
+    backend = _backend()
+    return (backend.generation(), backend.guild_seq(guild_id), _versions.get(guild_id, 0))
+
+
+def get_config(guild_id: int) -> GuildConfig:
+    """Private copy of a guild config, safe to mutate."""
+    return copy.deepcopy(_load(guild_id))
+
+
+def _diff(before: GuildConfig, after: GuildConfig) -> List[Op]:
+    """Operations turning ``before`` into ``after``.
+
+    Membership, prompt texts and tags/weights are tracked; reordering a
+    list is not.
+    """
+    ops: List[Op] = []
+    ops += [("remove_channel", cid) for cid in before.channels if cid not in after.channels]
+    ops += [("add_channel", cid) for cid in after.channels if cid not in before.channels]
+    for kind, old, new in (
+        ("action", before.custom_actions, after.custom_actions),
+        ("verite", before.custom_truths, after.custom_truths),
+    ):
+        old_prompts = {p.id: p for p in old}
+        new_ids = {p.id for p in new}
+        ops += [("remove_prompt", kind, pid) for pid in old_prompts if pid not in new_ids]
+        for p in new:
+            previous = old_prompts.get(p.id)
+            if previous is None:
+                ops.append(("add_prompt", kind, p.id, p.text))
+                if p.tags or p.weight != DEFAULT_WEIGHT:
+                    ops.append(("set_prompt_meta", kind, p.id, list(p.tags), p.weight))
+                continue
+            if previous.text != p.text:
+                ops.append(("edit_prompt", kind, p.id, p.text))
+            if previous.tags != p.tags or previous.weight != p.weight:
+                ops.append(("set_prompt_meta", kind, p.id, list(p.tags), p.weight))
+    for kind, old_mask, new_mask in (
+        ("action", before.disabled_actions, after.disabled_actions),
+        ("verite", before.disabled_truths, after.disabled_truths),
+    ):
+        for i in mask_indices(old_mask ^ new_mask):
+            ops.append(("disable_base" if (new_mask >> i) & 1 else "enable_base", kind, i))
+    for kind in ("action", "verite"):
+        old_meta, new_meta = base_meta(before, kind), base_meta(after, kind)
+        for i in sorted(old_meta.keys() | new_meta.keys()):
+            meta = new_meta.get(i, PromptMeta())
+            if old_meta.get(i, PromptMeta()) != meta:
+                ops.append(("set_base_meta", kind, i, list(meta.tags), meta.weight))
+    ops += [("unsubscribe_pack", pid) for pid in before.packs if pid not in after.packs]
+    ops += [("subscribe_pack", pid) for pid in after.packs if pid not in before.packs]
+    for kind in ("action", "verite"):
+        old_masks, new_masks = pack_hidden(before, kind), pack_hidden(after, kind)
+        for pid in sorted(old_masks.keys() | new_masks.keys()):
+            new_mask = new_masks.get(pid, 0)
+            for i in mask_indices(old_masks.get(pid, 0) ^ new_mask):
+                ops.append(("hide_pack_prompt" if (new_mask >> i) & 1 else "show_pack_prompt", kind, pid, i))
+    return ops
+
+
+def commit_config(guild_id: int, before: GuildConfig, after: GuildConfig) -> None:
+    """Persist every change between two copies of a guild config in one commit."""
+    _commit(guild_id, _diff(before, after))
+
+
+@contextmanager
+def transaction(guild_id: int) -> Iterator[GuildConfig]:
+    """Edit a guild config in place and commit all changes at once.
+
+        with storage.transaction(guild_id) as conf:
+            conf.channels.append(channel_id)
+            storage.set_disabled(conf, "action", 3, True)
+
+    Nothing is written if the block raises. Other writers in this process
+    wait until the block ends.
+    """
+    with _lock:
+        before = get_config(guild_id)
+        conf = copy.deepcopy(before)
+        yield conf
+        commit_config(guild_id, before, conf)
+
+
+def new_prompt_id() -> str:
+    return uuid.uuid4().hex[:8]
+
+
+def _custom(conf: GuildConfig, kind: str) -> List[CustomPrompt]:
+    return conf.custom_actions if kind == "action" else conf.custom_truths
 
 
 def add_channel(guild_id: int, channel_id: int) -> None:
-    store = _read_store()
-    conf = _get_or_create(store, guild_id)
-    if channel_id not in conf.channels:
-        conf.channels.append(channel_id)
-    _write_store(store)
+    with transaction(guild_id) as conf:
+        if channel_id not in conf.channels:
+            conf.channels.append(channel_id)
 
 
 def remove_channel(guild_id: int, channel_id: int) -> bool:
-    store = _read_store()
-    conf = _get_or_create(store, guild_id)
-    if channel_id in conf.channels:
-        conf.channels.remove(channel_id)
-        _write_store(store)
-        return True
-    return False
+    with transaction(guild_id) as conf:
+        if channel_id in conf.channels:
+            conf.channels.remove(channel_id)
+            return True
+        return False
 
 
 def get_channels(guild_id: int) -> List[int]:
-    store = _read_store()
-    conf = _get_or_create(store, guild_id)
-    return list(conf.channels)
+    return list(_load(guild_id).channels)
 
 
 def add_custom_prompt(guild_id: int, kind: str, text: str) -> str:
-    store = _read_store()
-    conf = _get_or_create(store, guild_id)
-    prompt_id = uuid.uuid4().hex[:8]
-    target = conf.custom_actions if kind == "action" else conf.custom_truths
-    target.append(CustomPrompt(id=prompt_id, text=text))
-    _write_store(store)
-    return prompt_id
+    with transaction(guild_id) as conf:
+        prompt_id = new_prompt_id()
+        _custom(conf, kind).append(CustomPrompt(id=prompt_id, text=text))
+        return prompt_id
 
 
 def edit_custom_prompt(guild_id: int, kind: str, prompt_id: str, new_text: str) -> bool:
-    store = _read_store()
-    conf = _get_or_create(store, guild_id)
-    target = conf.custom_actions if kind == "action" else conf.custom_truths
-    for p in target:
-        if p.id == prompt_id:
-            p.text = new_text
-            _write_store(store)
-            return True
-    return False
+    with transaction(guild_id) as conf:
+        for p in _custom(conf, kind):
+            if p.id == prompt_id:
+                p.text = new_text
+                return True
+        return False
 
 
 def remove_custom_prompt(guild_id: int, kind: str, prompt_id: str) -> bool:
-    store = _read_store()
-    conf = _get_or_create(store, guild_id)
-    target = conf.custom_actions if kind == "action" else conf.custom_truths
-    for i, p in enumerate(target):
-        if p.id == prompt_id:
-            target.pop(i)
-            _write_store(store)
-            return True
-    return False
+    with transaction(guild_id) as conf:
+        target = _custom(conf, kind)
+        for i, p in enumerate(target):
+            if p.id == prompt_id:
+                target.pop(i)
+                return True
+        return False
 
 
 def list_custom_prompts(guild_id: int, kind: str) -> List[Tuple[str, str]]:
-    store = _read_store()
-    conf = _get_or_create(store, guild_id)
-    target = conf.custom_actions if kind == "action" else conf.custom_truths
-    return [(p.id, p.text) for p in target]
+    return [(p.id, p.text) for p in _custom(_load(guild_id), kind)]
+
+
+def get_custom_prompts(guild_id: int, kind: str) -> List[CustomPrompt]:
+    """Copies of the custom prompts of ``kind``, with their tags and weights."""
+    return [copy.copy(p) for p in _custom(_load(guild_id), kind)]
+
+
+def set_custom_prompt_meta(
+    guild_id: int, kind: str, prompt_id: str, tags: Optional[Sequence[str]] = None, weight: Optional[float] = None
+) -> Optional[CustomPrompt]:
+    """Replace the tags and/or weight of a custom prompt (None keeps the current value).
+
+    Returns a copy of the updated prompt, or None if the ID is unknown.
+    """
+    with transaction(guild_id) as conf:
+        for p in _custom(conf, kind):
+            if p.id == prompt_id:
+                if tags is not None:
+                    p.tags = list(tags)
+                if weight is not None:
+                    p.weight = weight
+                return copy.copy(p)
+        return None
+
+
+def get_base_prompt_meta(guild_id: int, kind: str, index: int) -> PromptMeta:
+    return copy.deepcopy(base_meta(_load(guild_id), kind).get(index, PromptMeta()))
+
+
+def set_base_prompt_meta(
+    guild_id: int, kind: str, index: int, tags: Optional[Sequence[str]] = None, weight: Optional[float] = None
+) -> PromptMeta:
+    """Replace the guild's tags and/or weight for a base prompt (None keeps the current value)."""
+    with transaction(guild_id) as conf:
+        meta = base_meta(conf, kind).get(index, PromptMeta())
+        new_tags = list(tags) if tags is not None else meta.tags
+        new_weight = weight if weight is not None else meta.weight
+        set_base_meta(conf, kind, index, new_tags, new_weight)
+        return PromptMeta(tags=list(new_tags), weight=new_weight)
 
 
 def disable_base_prompt(guild_id: int, kind: str, index: int) -> bool:
-    store = _read_store()
-    conf = _get_or_create(store, guild_id)
-    target = conf.disabled_actions if kind == "action" else conf.disabled_truths
-    if index not in target:
-        target.append(index)
-        _write_store(store)
-        return True
-    return False
+    with transaction(guild_id) as conf:
+        return set_disabled(conf, kind, index, True)
 
 
 def enable_base_prompt(guild_id: int, kind: str, index: int) -> bool:
-    store = _read_store()
-    conf = _get_or_create(store, guild_id)
-    target = conf.disabled_actions if kind == "action" else conf.disabled_truths
-    if index in target:
-        target.remove(index)
-        _write_store(store)
-        return True
-    return False
+    with transaction(guild_id) as conf:
+        return set_disabled(conf, kind, index, False)
 
 
 def list_disabled_base(guild_id: int, kind: str) -> List[int]:
-    store = _read_store()
-    conf = _get_or_create(store, guild_id)
-    return list(conf.disabled_actions if kind == "action" else conf.disabled_truths)
-
-
-def get_combined_actions(guild_id: int, base_actions: List[str]) -> List[str]:
-    store = _read_store()
-    conf = _get_or_create(store, guild_id)
-    disabled = set(conf.disabled_actions)
-    combined = [text for i, text in enumerate(base_actions) if i not in disabled]
-    combined.extend([p.text for p in conf.custom_actions])
-    return combined
-
-
-def get_combined_truths(guild_id: int, base_truths: List[str]) -> List[str]:
-    store = _read_store()
-    conf = _get_or_create(store, guild_id)
-    disabled = set(conf.disabled_truths)
-    combined = [text for i, text in enumerate(base_truths) if i not in disabled]
-    combined.extend([p.text for p in conf.custom_truths])
-    return combined
\ No newline at end of file
+    conf = _load(guild_id)
+    return mask_indices(conf.disabled_actions if kind == "action" else conf.disabled_truths)
+
+
+# ---- Shared prompt packs ----
+
+
+def list_packs() -> List[packs.Pack]:
+    """Every pack, by id. Packs are shared: do not mutate them."""
+    return sorted(_packs().packs().values(), key=lambda p: p.id)
+
+
+def get_pack(pack_id: str) -> Optional[packs.Pack]:
+    return _packs().get(pack_id)
+
+
+def add_pack_prompts(
+    pack_id: str, kind: str, texts: Sequence[str], name: Optional[str] = None
+) -> Tuple[List[int], int]:
+    """Append prompts to a shared pack (created if needed).
+
+    Returns their indices and how many were dropped because the pack is full.
+    """
+    return _packs().add_prompts(pack_id, kind, texts, name)
+
+
+def get_subscribed_packs(guild_id: int) -> List[str]:
+    return list(_load(guild_id).packs)
+
+
+def subscribe_pack(guild_id: int, pack_id: str) -> bool:
+    with transaction(guild_id) as conf:
+        if pack_id in conf.packs:
+            return False
+        conf.packs.append(pack_id)
+        return True
+
+
+def unsubscribe_pack(guild_id: int, pack_id: str) -> bool:
+    """Drop a subscription. Hidden prompts are kept for a later re-subscription."""
+    with transaction(guild_id) as conf:
+        if pack_id not in conf.packs:
+            return False
+        conf.packs.remove(pack_id)
+        return True
+
+
+def hide_pack_prompt(guild_id: int, kind: str, pack_id: str, index: int) -> bool:
+    with transaction(guild_id) as conf:
+        return set_pack_hidden(conf, kind, pack_id, index, True)
+
+
+def show_pack_prompt(guild_id: int, kind: str, pack_id: str, index: int) -> bool:
+    with transaction(guild_id) as conf:
+        return set_pack_hidden(conf, kind, pack_id, index, False)
+
+
+def list_hidden_pack_prompts(guild_id: int, kind: str, pack_id: str) -> List[int]:
+    return mask_indices(pack_hidden(_load(guild_id), kind).get(pack_id, 0))
+
+
+def edit_pack_prompt(guild_id: int, kind: str, pack_id: str, index: int, new_text: str) -> str:
+    """Copy-on-write edit of a pack prompt for one guild.
+
+    The edited text becomes a custom prompt of the guild (tagged with the
+    pack id, like the pack prompts) and the original is hidden for that
+    guild. Returns the new custom prompt ID.
+    """
+    with transaction(guild_id) as conf:
+        prompt_id = new_prompt_id()
+        _custom(conf, kind).append(CustomPrompt(id=prompt_id, text=new_text, tags=[pack_id]))
+        set_pack_hidden(conf, kind, pack_id, index, True)
+        return prompt_id
+
+
+class PoolMeta(NamedTuple):
+    """Guild tags and weights taken from the same config read as a combined pool."""
+
+    base: Dict[int, Tuple[Tuple[str, ...], float]]
+    custom: Tuple[Tuple[Tuple[str, ...], float], ...]
+
+
+def _combined_pool(guild_id: int, kind: str, base: Sequence[str]) -> Tuple[PromptPool, PoolMeta]:
+    """Base prompts minus disabled ones, subscribed packs, then custom prompts, cached per version.
+
+    The pool is a lazy view over ``base`` and the pack tuples (see
+    prompt_pool.PromptPool): only the custom texts, the masks and references
+    to the shared pack segments are held per guild. The tags and weights are
+    copied from the same config, so they always line up with the pool.
+    """
+    key = (guild_id, _kind_key(kind))
+    version = guild_version(guild_id)
+    library = _packs()
+    generation = library.generation()
+    with _pool_lock:
+        entry = _pool_cache.get(key)
+        if entry is not None and entry[0] == version and entry[1] is base and entry[2] == generation:
+            _pool_cache.move_to_end(key)
+            metrics.cache_hit("pool")
+            return entry[3], entry[4]
+    metrics.cache_miss("pool")
+    conf = _load(guild_id)
+    if key[1] == "action":
+        mask, custom = conf.disabled_actions, conf.custom_actions
+    else:
+        mask, custom = conf.disabled_truths, conf.custom_truths
+    hidden = pack_hidden(conf, kind)
+    segments: List[PromptPool] = []
+    pack_ids: List[str] = []
+    for pack_id in conf.packs:
+        pack = library.get(pack_id)
+        if pack is None:
+            # Deleted pack: the subscription stays but draws nothing.
+            continue
+        segments.append(pack.view(key[1], hidden.get(pack_id, 0)))
+        pack_ids.append(pack_id)
+    pool = PromptPool(base, mask, tuple(p.text for p in custom), tuple(segments), tuple(pack_ids))
+    # Copied: the loaded config is shared and later commits update it in place.
+    meta = PoolMeta(
+        {i: (tuple(m.tags), m.weight) for i, m in base_meta(conf, kind).items()},
+        tuple((tuple(p.tags), p.weight) for p in custom),
+    )
+    with _pool_lock:
+        _pool_cache[key] = (version, base, generation, pool, meta)
+        _pool_cache.move_to_end(key)
+        while len(_pool_cache) > POOL_CACHE_SIZE:
+            _pool_cache.popitem(last=False)
+    return pool, meta
+
+
+def iter_prompt_meta(pool: PromptPool, meta: PoolMeta) -> Iterator[Tuple[Sequence[str], float]]:
+    """(guild tags, weight) of every prompt of ``pool``, in pool order.
+
+    ``pool`` and ``meta`` come from one ``get_combined_with_meta`` call; base
+    prompts the guild did not tag come with no tags and the default weight,
+    pack prompts with their pack id as only tag.
+    """
+    default = ((), DEFAULT_WEIGHT)
+    for i in pool.base_indices():
+        yield meta.base.get(i, default)
+    for pack_id, segment in zip(pool.pack_ids, pool.packs):
+        entry = ((pack_id,), DEFAULT_WEIGHT)
+        for _ in range(len(segment)):
+            yield entry
+    yield from meta.custom
+
+
+def get_combined_actions(guild_id: int, base_actions: Sequence[str]) -> PromptPool:
+    return _combined_pool(guild_id, "action", base_actions)[0]
+
+
+def get_combined_truths(guild_id: int, base_truths: Sequence[str]) -> PromptPool:
+    return _combined_pool(guild_id, "verite", base_truths)[0]
+
+
+def get_combined_with_meta(guild_id: int, kind: str, base: Sequence[str]) -> Tuple[PromptPool, PoolMeta]:
+    """The combined pool of ``kind`` and the tags/weights of its prompts, from one config read."""
+    return _combined_pool(guild_id, kind, base)
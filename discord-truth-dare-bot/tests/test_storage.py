@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""Crash-safety of the journal backend and PromptPool rank/select."""
+import json
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import storage  # noqa: E402
+from prompt_pool import BLOCK_BITS, PromptPool, mask_from_indices, mask_indices  # noqa: E402
+
+
+def _backend(tmp_path):
+    return storage.JournalBackend(str(tmp_path / "config.json"))
+
+
+def _texts(conf):
+    return [p.text for p in conf.custom_actions]
+
+
+def test_append_reopen_replay(tmp_path):
+    writer = _backend(tmp_path)
+    writer.apply_many([(1, [("add_channel", 10), ("add_prompt", "action", "a1", "Premier défi")])])
+    writer.apply_many([(1, [("add_prompt", "action", "a2", "Deuxième défi")]), (2, [("add_channel", 20)])])
+
+    reader = _backend(tmp_path)
+    assert reader.load_guild(1).channels == [10]
+    assert _texts(reader.load_guild(1)) == ["Premier défi", "Deuxième défi"]
+    assert reader.load_guild(2).channels == [20]
+
+
+def test_torn_last_line_is_ignored(tmp_path):
+    writer = _backend(tmp_path)
+    writer.apply_many([(1, [("add_channel", 10)])])
+    with open(writer.journal_path, "ab") as f:
+        f.write(b'[1,[["add_channel",99')
+
+    reader = _backend(tmp_path)
+    assert reader.load_guild(1).channels == [10]
+    # The next append replaces the torn record instead of following it.
+    reader.apply_many([(1, [("add_channel", 11)])])
+    with open(reader.journal_path, "rb") as f:
+        lines = f.read().splitlines()
+    assert [json.loads(line)[1] for line in lines] == [[["add_channel", 10]], [["add_channel", 11]]]
+    assert _backend(tmp_path).load_guild(1).channels == [10, 11]
+
+
+def test_recovery_after_crash_between_rotation_and_snapshot(tmp_path):
+    writer = _backend(tmp_path)
+    writer.apply_many([(1, [("add_channel", 10)])])
+    writer.compact()
+    writer.apply_many([(1, [("add_channel", 11)])])
+    # compact() died right after rotating the journal: the snapshot on disk
+    # does not include the rotated records yet.
+    os.replace(writer.journal_path, writer.journal_path + ".old")
+
+    recovered = _backend(tmp_path)
+    assert recovered.load_guild(1).channels == [10, 11]
+    recovered.apply_many([(1, [("add_channel", 12)])])
+    assert _backend(tmp_path).load_guild(1).channels == [10, 11, 12]
+
+    # The next compaction folds both journals into the snapshot.
+    recovered.compact()
+    assert not os.path.exists(recovered.journal_path + ".old")
+    with open(recovered.path, "r", encoding="utf-8") as f:
+        assert json.load(f)["1"]["channels"] == [10, 11, 12]
+    assert _backend(tmp_path).load_guild(1).channels == [10, 11, 12]
+
+
+def test_two_backends_see_each_other(tmp_path):
+    first, second = _backend(tmp_path), _backend(tmp_path)
+    assert second.load_guild(1).channels == []
+    seq = second.guild_seq(1)
+
+    first.apply_many([(1, [("add_channel", 10)])])
+    assert second.load_guild(1).channels == [10]
+    assert second.guild_seq(1) != seq
+
+    second.apply_many([(1, [("add_prompt", "action", "a1", "Défi partagé")])])
+    assert _texts(first.load_guild(1)) == ["Défi partagé"]
+
+    generation = second.generation()
+    first.compact()
+    assert second.generation() != generation
+    first.apply_many([(1, [("add_channel", 11)])])
+    assert second.load_guild(1).channels == [10, 11]
+    assert _texts(second.load_guild(1)) == ["Défi partagé"]
+
+
+def _random_mask(rng, size):
+    """Disabled bits in varied densities, always touching block boundaries."""
+    density = rng.choice((0.0, 0.05, 0.5, 0.95, 1.0))
+    indices = {i for i in range(size) if rng.random() < density}
+    for edge in range(BLOCK_BITS, size + 1, BLOCK_BITS):
+        if rng.random() < 0.5:
+            indices.update(i for i in (edge - 1, edge) if i < size)
+    return mask_from_indices(sorted(indices))
+
+
+def test_mask_indices_roundtrip():
+    rng = random.Random(1)
+    for size in (0, 1, 63, 64, 65, 128, 200, 1000):
+        for _ in range(20):
+            indices = sorted(rng.sample(range(size), rng.randint(0, size))) if size else []
+            assert mask_indices(mask_from_indices(indices)) == indices
+
+
+def test_prompt_pool_matches_plain_list():
+    rng = random.Random(7)
+    for size in (0, 1, 63, 64, 65, 127, 128, 129, 300, 1000):
+        base = [f"base {i}" for i in range(size)]
+        for _ in range(25):
+            mask = _random_mask(rng, size)
+            # Bits past the end of the base are ignored.
+            if rng.random() < 0.2:
+                mask |= 1 << (size + rng.randint(0, 70))
+            segments = []
+            pack_ids = []
+            for p in range(rng.randint(0, 3)):
+                pack = [f"pack {p}-{i}" for i in range(rng.choice((0, 1, 64, 70)))]
+                hidden = _random_mask(rng, len(pack))
+                segments.append(PromptPool(pack, hidden, ()))
+                pack_ids.append(f"pack{p}")
+            custom = tuple(f"custom {i}" for i in range(rng.randint(0, 5)))
+            pool = PromptPool(base, mask, custom, tuple(segments), tuple(pack_ids))
+
+            enabled = [i for i in range(size) if not mask >> i & 1]
+            expected = [base[i] for i in enabled]
+            for segment in segments:
+                expected += [t for i, t in enumerate(segment.base) if not segment.mask >> i & 1]
+            expected += list(custom)
+
+            assert len(pool) == len(expected)
+            assert list(pool) == expected
+            assert [pool[r] for r in range(len(pool))] == expected
+            assert list(pool.base_indices()) == enabled
+            assert [pool.base_index(r) for r in range(len(enabled))] == enabled
+            assert pool.pack_size == sum(len(segment) for segment in segments)
+            if expected:
+                assert pool[-1] == expected[-1]
+                assert pool[1:len(expected):3] == expected[1::3]
+                assert pool.sample(rng) in expected
+            for r in (len(expected), -len(expected) - 1):
+                with pytest.raises(IndexError):
+                    pool[r]